@@ -0,0 +1,66 @@
+import atexit
+import threading
+import time
+
+
+class ActivityTracker:
+    """In-memory last-seen table flushed to users.json in batches.
+
+    ``touch()`` only records a timestamp; repeated touches by the same user
+    coalesce into one entry. A background thread writes all pending
+    entries in a single transaction every ``flush_interval`` seconds, or
+    sooner once ``max_pending`` users are waiting, so memory stays bounded.
+    """
+    
+    def __init__(self, user_manager, flush_interval=60, max_pending=10000):
+        self.user_manager = user_manager
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+    
+    def _start(self):
+        # Started on first use so each gunicorn worker gets its own thread
+        self._thread = threading.Thread(target=self._run, name='activity-flush', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Activity flush failed: {e}")
+    
+    def touch(self, user_id):
+        """Mark a user as active now"""
+        with self._lock:
+            if self._thread is None:
+                self._start()
+            self._pending[int(user_id)] = time.time()
+            if len(self._pending) >= self.max_pending:
+                self._wake.set()
+    
+    def last_seen(self, user_id):
+        """Unflushed activity timestamp of a user, or None"""
+        return self._pending.get(int(user_id))
+    
+    def flush(self):
+        """Write all pending timestamps in one users.json transaction"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+        
+        try:
+            return self.user_manager.touch_many(pending)
+        except Exception:
+            # Put the batch back without overwriting newer touches
+            with self._lock:
+                for user_id, seen_at in pending.items():
+                    self._pending.setdefault(user_id, seen_at)
+            raise
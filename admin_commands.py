@@ -1,14 +1,16 @@
-import json
 import logging
 from telegram import Update
 from telegram.ext import CallbackContext, CommandHandler
 from config import ADMIN_ID
+from catalog import Catalog
+import money
 
 logger = logging.getLogger(__name__)
 
 class AdminCommands:
-    def __init__(self, dispatcher):
+    def __init__(self, dispatcher, catalog=None):
         self.dispatcher = dispatcher
+        self.catalog = catalog or Catalog()
         self.setup_admin_handlers()
     
     def setup_admin_handlers(self):
@@ -27,16 +29,6 @@ class AdminCommands:
         """Check if user is admin"""
         return str(user_id) == str(ADMIN_ID)
     
-    def load_data(self):
-        """Load all data from JSON files"""
-        with open('products.json', 'r') as f:
-            return json.load(f)
-    
-    def save_data(self, data):
-        """Save data to JSON files"""
-        with open('products.json', 'w') as f:
-            json.dump(data, f, indent=2)
-    
     async def add_category(self, update: Update, context: CallbackContext):
         """Add a new category: /addcategory Name|Description"""
         user_id = update.message.from_user.id
@@ -60,23 +52,11 @@ class AdminCommands:
             
             name, description = args
             
-            data = self.load_data()
-            
-            # Generate new category ID
-            new_id = max([c['id'] for c in data['categories']]) + 1 if data['categories'] else 1
-            
-            new_category = {
-                'id': new_id,
-                'name': name.strip(),
-                'description': description.strip()
-            }
-            
-            data['categories'].append(new_category)
-            self.save_data(data)
+            new_category = self.catalog.add_category(name.strip(), description.strip())
             
             await update.message.reply_text(
                 f"✅ Category added successfully!\n\n"
-                f"🆔 ID: {new_id}\n"
+                f"🆔 ID: {new_category.id}\n"
                 f"📂 Name: {name}\n"
                 f"📝 Description: {description}"
             )
@@ -108,30 +88,14 @@ class AdminCommands:
             
             name, category_id, description = args
             
-            data = self.load_data()
-            
-            # Check if category exists
-            category_exists = any(cat['id'] == int(category_id) for cat in data['categories'])
-            if not category_exists:
+            new_subcategory = self.catalog.add_subcategory(name.strip(), int(category_id), description.strip())
+            if not new_subcategory:
                 await update.message.reply_text(f"❌ Category ID {category_id} not found. Use /listcategories")
                 return
             
-            # Generate new subcategory ID
-            new_id = max([s['id'] for s in data['subcategories']]) + 1 if data['subcategories'] else 1
-            
-            new_subcategory = {
-                'id': new_id,
-                'name': name.strip(),
-                'category_id': int(category_id),
-                'description': description.strip()
-            }
-            
-            data['subcategories'].append(new_subcategory)
-            self.save_data(data)
-            
             await update.message.reply_text(
                 f"✅ Subcategory added successfully!\n\n"
-                f"🆔 ID: {new_id}\n"
+                f"🆔 ID: {new_subcategory.id}\n"
                 f"📂 Name: {name}\n"
                 f"🏷️ Category ID: {category_id}\n"
                 f"📝 Description: {description}"
@@ -166,53 +130,33 @@ class AdminCommands:
             
             name, description, price, category_id, subcategory_id, features = args
             
-            data = self.load_data()
-            
             # Check if category exists
-            category_exists = any(cat['id'] == int(category_id) for cat in data['categories'])
-            if not category_exists:
+            category = self.catalog.get_category(int(category_id))
+            if not category:
                 await update.message.reply_text(f"❌ Category ID {category_id} not found.")
                 return
             
-            # Check if subcategory exists and belongs to category
-            subcategory_exists = any(
-                sub['id'] == int(subcategory_id) and sub['category_id'] == int(category_id) 
-                for sub in data['subcategories']
-            )
-            if not subcategory_exists:
-                await update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found or doesn't belong to category {category_id}.")
-                return
-            
-            # Generate new product ID
-            new_id = max([p['id'] for p in data['products']]) + 1 if data['products'] else 1
-            
             # Parse features
             feature_list = [f.strip() for f in features.split(',')]
             
-            new_product = {
-                'id': new_id,
-                'name': name.strip(),
-                'description': description.strip(),
-                'price': float(price),
-                'category_id': int(category_id),
-                'subcategory_id': int(subcategory_id),
-                'features': feature_list
-            }
-            
-            data['products'].append(new_product)
-            self.save_data(data)
+            # Fails if the subcategory is missing or doesn't belong to the category
+            new_product = self.catalog.add_product(
+                name.strip(), description.strip(), money.usd_to_cents(price),
+                int(category_id), int(subcategory_id), feature_list
+            )
+            if not new_product:
+                await update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found or doesn't belong to category {category_id}.")
+                return
             
-            # Get category and subcategory names for confirmation
-            category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == int(category_id)), "Unknown")
-            subcategory_name = next((sub['name'] for sub in data['subcategories'] if sub['id'] == int(subcategory_id)), "Unknown")
+            subcategory = self.catalog.get_subcategory(int(subcategory_id))
             
             await update.message.reply_text(
                 f"✅ Product added successfully!\n\n"
-                f"🆔 ID: {new_id}\n"
+                f"🆔 ID: {new_product.id}\n"
                 f"📦 Name: {name}\n"
-                f"💰 Price: ${float(price):.2f}\n"
-                f"📂 Category: {category_name}\n"
-                f"📁 Subcategory: {subcategory_name}\n"
+                f"💰 Price: ${new_product.price:.2f}\n"
+                f"📂 Category: {category.name}\n"
+                f"📁 Subcategory: {subcategory.name}\n"
                 f"⭐ Features: {', '.join(feature_list)}"
             )
             
@@ -230,24 +174,24 @@ class AdminCommands:
             return
         
         try:
-            data = self.load_data()
+            categories = self.catalog.categories
             
-            if not data['categories']:
+            if not categories:
                 await update.message.reply_text("📭 No categories available.")
                 return
             
             categories_text = "📂 **All Categories & Subcategories:**\n\n"
             
-            for category in data['categories']:
-                categories_text += f"🏷️ **{category['name']}** (ID: {category['id']})\n"
-                categories_text += f"   📝 {category['description']}\n"
+            for category in categories:
+                categories_text += f"🏷️ **{category.name}** (ID: {category.id})\n"
+                categories_text += f"   📝 {category.description}\n"
                 
                 # Show subcategories for this category
-                subcategories = [s for s in data['subcategories'] if s['category_id'] == category['id']]
+                subcategories = self.catalog.subcategories_in_category(category.id)
                 if subcategories:
                     for sub in subcategories:
-                        categories_text += f"   └─ 📁 {sub['name']} (ID: {sub['id']})\n"
-                        categories_text += f"        📝 {sub['description']}\n"
+                        categories_text += f"   └─ 📁 {sub.name} (ID: {sub.id})\n"
+                        categories_text += f"        📝 {sub.description}\n"
                 else:
                     categories_text += f"   └─ 📭 No subcategories\n"
                 
@@ -267,19 +211,19 @@ class AdminCommands:
             return
         
         try:
-            data = self.load_data()
+            subcategories = self.catalog.subcategories
             
-            if not data['subcategories']:
+            if not subcategories:
                 await update.message.reply_text("📭 No subcategories available.")
                 return
             
             subcategories_text = "📁 **All Subcategories:**\n\n"
             
-            for subcategory in data['subcategories']:
-                category = next((c for c in data['categories'] if c['id'] == subcategory['category_id']), {"name": "Unknown"})
-                subcategories_text += f"📁 **{subcategory['name']}** (ID: {subcategory['id']})\n"
-                subcategories_text += f"   🏷️ Category: {category['name']} (ID: {subcategory['category_id']})\n"
-                subcategories_text += f"   📝 {subcategory['description']}\n\n"
+            for subcategory in subcategories:
+                category = self.catalog.get_category(subcategory.category_id)
+                subcategories_text += f"📁 **{subcategory.name}** (ID: {subcategory.id})\n"
+                subcategories_text += f"   🏷️ Category: {category.name if category else 'Unknown'} (ID: {subcategory.category_id})\n"
+                subcategories_text += f"   📝 {subcategory.description}\n\n"
             
             await update.message.reply_text(subcategories_text, parse_mode='Markdown')
             
@@ -295,21 +239,21 @@ class AdminCommands:
             return
         
         try:
-            data = self.load_data()
+            products = self.catalog.products
             
-            if not data['products']:
+            if not products:
                 await update.message.reply_text("📭 No products available.")
                 return
             
             products_text = "📦 **All Products:**\n\n"
-            for product in data['products']:
-                category = next((c for c in data['categories'] if c['id'] == product['category_id']), {"name": "Unknown"})
-                subcategory = next((s for s in data['subcategories'] if s['id'] == product['subcategory_id']), {"name": "Unknown"})
+            for product in products:
+                category = self.catalog.get_category(product.category_id)
+                subcategory = self.catalog.get_subcategory(product.subcategory_id)
                 
-                products_text += f"🆔 {product['id']}: {product['name']}\n"
-                products_text += f"   💰 ${product['price']} | 📂 {category['name']} | 📁 {subcategory['name']}\n"
-                products_text += f"   📝 {product['description']}\n"
-                products_text += f"   ⭐ Features: {', '.join(product.get('features', []))}\n\n"
+                products_text += f"🆔 {product.id}: {product.name}\n"
+                products_text += f"   💰 ${product.price} | 📂 {category.name if category else 'Unknown'} | 📁 {subcategory.name if subcategory else 'Unknown'}\n"
+                products_text += f"   📝 {product.description}\n"
+                products_text += f"   ⭐ Features: {', '.join(product.features)}\n\n"
             
             await update.message.reply_text(products_text, parse_mode='Markdown')
             
@@ -330,16 +274,11 @@ class AdminCommands:
         
         try:
             product_id = int(context.args[0])
-            data = self.load_data()
-            
-            initial_count = len(data['products'])
-            data['products'] = [p for p in data['products'] if p['id'] != product_id]
             
-            if len(data['products']) == initial_count:
+            if not self.catalog.delete_product(product_id):
                 await update.message.reply_text(f"❌ Product ID {product_id} not found.")
                 return
             
-            self.save_data(data)
             await update.message.reply_text(f"✅ Product ID {product_id} deleted successfully.")
             
         except ValueError:
@@ -361,32 +300,17 @@ class AdminCommands:
         
         try:
             category_id = int(context.args[0])
-            data = self.load_data()
             
-            # Check if category exists
-            category_exists = any(cat['id'] == category_id for cat in data['categories'])
-            if not category_exists:
+            # Cascade delete: category, its subcategories and their products
+            result = self.catalog.delete_category(category_id)
+            if not result:
                 await update.message.reply_text(f"❌ Category ID {category_id} not found.")
                 return
             
-            # Get category name for confirmation
-            category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == category_id), "Unknown")
-            
-            # Delete category
-            data['categories'] = [c for c in data['categories'] if c['id'] != category_id]
-            
-            # Delete related subcategories
-            subcategories_deleted = [s for s in data['subcategories'] if s['category_id'] == category_id]
-            data['subcategories'] = [s for s in data['subcategories'] if s['category_id'] != category_id]
-            
-            # Delete related products
-            products_deleted = [p for p in data['products'] if p['category_id'] == category_id]
-            data['products'] = [p for p in data['products'] if p['category_id'] != category_id]
-            
-            self.save_data(data)
+            category, subcategories_deleted, products_deleted = result
             
             await update.message.reply_text(
-                f"✅ Category '{category_name}' (ID: {category_id}) deleted successfully.\n\n"
+                f"✅ Category '{category.name}' (ID: {category_id}) deleted successfully.\n\n"
                 f"🗑️ Also deleted:\n"
                 f"• {len(subcategories_deleted)} subcategories\n"
                 f"• {len(products_deleted)} products"
@@ -411,30 +335,19 @@ class AdminCommands:
         
         try:
             subcategory_id = int(context.args[0])
-            data = self.load_data()
             
-            # Check if subcategory exists
-            subcategory_exists = any(sub['id'] == subcategory_id for sub in data['subcategories'])
-            if not subcategory_exists:
+            # Cascade delete: subcategory and its products
+            result = self.catalog.delete_subcategory(subcategory_id)
+            if not result:
                 await update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found.")
                 return
             
-            # Get subcategory name and category info for confirmation
-            subcategory = next((sub for sub in data['subcategories'] if sub['id'] == subcategory_id), None)
-            category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == subcategory['category_id']), "Unknown")
-            
-            # Delete subcategory
-            data['subcategories'] = [s for s in data['subcategories'] if s['id'] != subcategory_id]
-            
-            # Delete related products
-            products_deleted = [p for p in data['products'] if p['subcategory_id'] == subcategory_id]
-            data['products'] = [p for p in data['products'] if p['subcategory_id'] != subcategory_id]
-            
-            self.save_data(data)
+            subcategory, products_deleted = result
+            category = self.catalog.get_category(subcategory.category_id)
             
             await update.message.reply_text(
-                f"✅ Subcategory '{subcategory['name']}' (ID: {subcategory_id}) deleted successfully.\n\n"
-                f"📂 Category: {category_name}\n"
+                f"✅ Subcategory '{subcategory.name}' (ID: {subcategory_id}) deleted successfully.\n\n"
+                f"📂 Category: {category.name if category else 'Unknown'}\n"
                 f"🗑️ Also deleted: {len(products_deleted)} products"
             )
             
@@ -1,385 +1,129 @@
-from flask import Flask, request, jsonify
-from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from flask import Flask, Response, request, jsonify, g
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Dispatcher, CommandHandler, MessageHandler, Filters, CallbackQueryHandler
-from dotenv import load_dotenv
+from telegram.error import RetryAfter
+from telegram.utils.request import Request
 import os
+import hmac
 import logging
 import requests
-import json
 import time
 import traceback
 from datetime import datetime, timedelta
-from web3 import Web3
+from io import BytesIO
+
+from config import BOT_TOKEN, ADMIN_ID, RENDER_URL, WALLET_XPUBS, ADDRESS_POOL_SIZE, PROFILER_TOKEN, CRYPTO_NETWORKS, SHARED_CACHE_PATH
+from config import WEBHOOK_REPLIES, TELEGRAM_POOL_SIZE
+from activity import ActivityTracker
+from broadcast import BroadcastManager, format_job
+from catalog import Catalog
+from conversation_state import ConversationState, create_state_backend
+from database import Database
+from events import EventQueue, EventConsumer
+from hd_wallet import AddressPool
+from lazy import StartupTimer, WarmUp
+from menus import MenuCache
+from ledger import Ledger
+from notifications import OrderNotifier
+from order_log import LogCompactor
+from payment_handler import PaymentHandler
+from payment_watcher import PaymentWatcher
+from profiler import SamplingProfiler, format_summary
+from quotes import QuoteBook
+from reply_pipeline import AsyncTelegramClient, ReplyPipeline
+from send_scheduler import SendScheduler, ScheduledBot, send_priority, PRIORITY_HIGH
+from serialization import dumps_pretty, loads
+from shared_cache import SharedCache
+from store import Store
+from tracing import Tracer, format_trace
+from updates import decode_update
+from user_manager import UserManager
+import money
+import metrics
 
 # ---------------------------
 # Configuration
 # ---------------------------
-load_dotenv()
-
-# Bot Configuration
-BOT_TOKEN = os.getenv('BOT_TOKEN', '7963936009:AAEK3Y4GYCpRk4mbASW2Xvh7u0xedXmR64Y')
-ADMIN_ID = os.getenv('ADMIN_ID', '7091475665')
-
-# Payment Configuration
-CRYPTO_NETWORKS = {
-    'USDT_BEP20': {
-        'name': 'USDT (BEP20)',
-        'network': 'BSC',
-        'decimals': 6,
-    },
-    'BTC': {
-        'name': 'Bitcoin',
-        'network': 'BTC',
-        'decimals': 8
-    },
-    'LTC': {
-        'name': 'Litecoin',
-        'network': 'LTC',
-        'decimals': 8
-    }
-}
-
-# Your wallet addresses (REPLACE WITH YOUR ACTUAL ADDRESSES)
-WALLET_ADDRESSES = {
-    'USDT_BEP20': '0x515a1DA038D2813400912C88Bbd4921836041766',
-    'BTC': 'bc1q85ad38ndcd29zgz7d77y5k9hcsurqxaqurzl2g',
-    'LTC': 'ltc1q2e3z74c63j5cn2hu0wep5vdrmmf6jv9zf6m4rv'
-}
-
-# Render Configuration
-RENDER_URL = os.getenv('RENDER_EXTERNAL_URL', 'http://localhost:8000')
 WEBHOOK_URL = f"https://telegram-bot-5fco.onrender.com/{BOT_TOKEN}"
 
-# ---------------------------
-# User Manager Class
-# ---------------------------
-class UserManager:
-    def __init__(self):
-        self.users_file = 'users.json'
-        self._init_file()
-    
-    def _init_file(self):
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump({}, f)
-    
-    def _read_users(self):
-        try:
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    
-    def _write_users(self, users):
-        with open(self.users_file, 'w') as f:
-            json.dump(users, f, indent=2)
-    
-    def get_user(self, user_id):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str not in users:
-            return None
-        
-        return users[user_id_str]
-    
-    def create_user(self, user_id, username, first_name):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            return users[user_id_str]
-        
-        user_data = {
-            'user_id': user_id,
-            'username': username,
-            'first_name': first_name,
-            'balance': 0.0,
-            'registration_date': datetime.now().isoformat(),
-            'first_topup_date': None,
-            'total_deposited': 0.0,
-            'total_orders': 0,
-            'last_activity': datetime.now().isoformat()
-        }
-        
-        users[user_id_str] = user_data
-        self._write_users(users)
-        return user_data
-    
-    def update_balance(self, user_id, amount):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str not in users:
-            return False
-        
-        users[user_id_str]['balance'] += amount
-        if amount > 0:
-            users[user_id_str]['total_deposited'] += amount
-        users[user_id_str]['last_activity'] = datetime.now().isoformat()
-        
-        # Set first top-up date if this is the first deposit
-        if amount > 0 and users[user_id_str]['first_topup_date'] is None:
-            users[user_id_str]['first_topup_date'] = datetime.now().isoformat()
-        
-        self._write_users(users)
-        return True
-    
-    def update_user_activity(self, user_id):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            users[user_id_str]['last_activity'] = datetime.now().isoformat()
-            self._write_users(users)
-    
-    def increment_orders(self, user_id):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            users[user_id_str]['total_orders'] += 1
-            self._write_users(users)
-
-# ---------------------------
-# Database Class
-# ---------------------------
-class Database:
-    def __init__(self):
-        self.orders_file = 'orders.json'
-        self._init_files()
-    
-    def _init_files(self):
-        for file in [self.orders_file]:
-            if not os.path.exists(file):
-                with open(file, 'w') as f:
-                    json.dump([], f)
-    
-    def _read_json(self, filename):
-        try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except:
-            return []
-    
-    def _write_json(self, filename, data):
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-    
-    def create_order(self, user_id, product_id, amount, crypto_currency, crypto_amount, payment_address, exchange_rate):
-        orders = self._read_json(self.orders_file)
-        order_id = len(orders) + 1
-        
-        order = {
-            'order_id': order_id,
-            'user_id': user_id,
-            'product_id': product_id,
-            'amount': amount,
-            'crypto_currency': crypto_currency,
-            'crypto_amount': crypto_amount,
-            'payment_address': payment_address,
-            'exchange_rate': exchange_rate,
-            'status': 'pending',
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(minutes=15)).isoformat()
-        }
-        
-        orders.append(order)
-        self._write_json(self.orders_file, orders)
-        return order
-    
-    def get_order(self, order_id):
-        orders = self._read_json(self.orders_file)
-        for order in orders:
-            if order['order_id'] == order_id:
-                return order
-        return None
-    
-    def update_order_status(self, order_id, status):
-        orders = self._read_json(self.orders_file)
-        for order in orders:
-            if order['order_id'] == order_id:
-                order['status'] = status
-                if status == 'paid':
-                    order['paid_at'] = datetime.now().isoformat()
-                self._write_json(self.orders_file, orders)
-                return True
-        return False
-    
-    def get_user_orders(self, user_id):
-        orders = self._read_json(self.orders_file)
-        return [order for order in orders if order['user_id'] == user_id]
-    
-    def cleanup_expired_orders(self):
-        """Remove orders that have expired"""
-        orders = self._read_json(self.orders_file)
-        current_time = datetime.now()
-        valid_orders = []
-        
-        for order in orders:
-            expires_at = datetime.fromisoformat(order['expires_at'])
-            if expires_at > current_time or order['status'] in ['paid', 'cancelled']:
-                valid_orders.append(order)
-        
-        self._write_json(self.orders_file, valid_orders)
-        return len(orders) - len(valid_orders)
-
-# ---------------------------
-# Improved Payment Handler with Multiple API Fallbacks
-# ---------------------------
-class PaymentHandler:
-    def __init__(self):
-        self.price_cache = {}
-        self.cache_duration = 300  # 5 minutes
-        print("✅ Payment Handler Initialized")
-    
-    def get_binance_price(self, symbol):
-        """Get price from Binance API"""
-        try:
-            url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                return float(data['price'])
-            return None
-        except:
-            return None
-    
-    def get_kraken_price(self, pair):
-        """Get price from Kraken API"""
-        try:
-            url = f"https://api.kraken.com/0/public/Ticker?pair={pair}"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'result' in data:
-                    # Kraken returns different keys, get the first one
-                    first_key = list(data['result'].keys())[0]
-                    return float(data['result'][first_key]['c'][0])
-            return None
-        except:
-            return None
-    
-    def get_coingecko_price(self, crypto_id):
-        """Get price from CoinGecko API"""
-        try:
-            url = f"https://api.coingecko.com/api/v3/simple/price?ids={crypto_id}&vs_currencies=usd"
-            response = requests.get(url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                price = data.get(crypto_id, {}).get('usd')
-                if price:
-                    return float(price)
-            return None
-        except:
-            return None
-    
-    def get_real_time_price(self, crypto_currency):
-        """Get real-time price with multiple fallback APIs"""
-        cache_key = crypto_currency
-        current_time = time.time()
-        
-        # Check cache first
-        if cache_key in self.price_cache:
-            cached_price, timestamp = self.price_cache[cache_key]
-            if current_time - timestamp < self.cache_duration:
-                return cached_price
-        
-        price = None
-        print(f"🔍 Fetching price for {crypto_currency}...")
-        
-        if crypto_currency == 'BTC':
-            # Try multiple APIs for BTC
-            price = self.get_binance_price('BTCUSDT')
-            if not price:
-                price = self.get_kraken_price('XXBTZUSD')
-            if not price:
-                price = self.get_coingecko_price('bitcoin')
-                
-        elif crypto_currency == 'LTC':
-            # Try multiple APIs for LTC
-            price = self.get_binance_price('LTCUSDT')
-            if not price:
-                price = self.get_kraken_price('XLTCZUSD')
-            if not price:
-                price = self.get_coingecko_price('litecoin')
-                
-        elif crypto_currency == 'USDT_BEP20':
-            # For USDT, we expect ~1.0, but check multiple sources
-            price = self.get_binance_price('BUSDUSDT')  # Using BUSD as stablecoin reference
-            if not price:
-                price = self.get_kraken_price('USDTZUSD')
-            if not price:
-                price = self.get_coingecko_price('tether')
-            
-            # If still no price or price is unrealistic, use 1.0
-            if not price or price < 0.9 or price > 1.1:
-                price = 1.0
-        
-        # If all APIs fail, use fallback prices
-        if not price:
-            fallback_prices = {
-                'BTC': 45000.0,
-                'LTC': 75.0,
-                'USDT_BEP20': 1.0
-            }
-            price = fallback_prices.get(crypto_currency, 1.0)
-            print(f"⚠️ Using fallback price for {crypto_currency}: ${price}")
-        else:
-            print(f"✅ Real-time price for {crypto_currency}: ${price:.4f}")
-        
-        # Cache the price
-        self.price_cache[cache_key] = (price, current_time)
-        return price
-    
-    def generate_payment_address(self, crypto_currency, order_id):
-        """Generate payment address for specific cryptocurrency"""
-        try:
-            address = WALLET_ADDRESSES.get(crypto_currency)
-            if not address:
-                print(f"❌ No address configured for {crypto_currency}")
-                return None
-            
-            print(f"✅ Generated {crypto_currency} address: {address}")
-            return address
-            
-        except Exception as e:
-            print(f"❌ Error generating payment address: {e}")
-            return None
-    
-    def get_crypto_amount(self, usd_amount, crypto_currency):
-        """Convert USD amount to cryptocurrency amount using real-time prices"""
-        current_price = self.get_real_time_price(crypto_currency)
-        
-        if current_price <= 0:
-            current_price = 1.0  # Prevent division by zero
-        
-        crypto_amount = usd_amount / current_price
-        
-        # Round to appropriate decimal places
-        decimals = CRYPTO_NETWORKS.get(crypto_currency, {}).get('decimals', 8)
-        crypto_amount = round(crypto_amount, decimals)
-        
-        return crypto_amount, current_price
-
 # ---------------------------
 # Flask App Setup
 # ---------------------------
 app = Flask(__name__)
 
-bot = Bot(token=BOT_TOKEN)
-dispatcher = Dispatcher(bot, None, workers=0, use_context=True)
+# Construction stays cheap; data loading and background services run in the warm-up thread
+startup = StartupTimer()
+warmup = WarmUp()
+
+# Outgoing messages are paced under Telegram's flood limits; a webhook update's replies
+# go back in the webhook response or out over the pooled async client
+with startup.phase('telegram'):
+    send_scheduler = SendScheduler(workers=4)
+    telegram_client = AsyncTelegramClient(BOT_TOKEN, pool_size=TELEGRAM_POOL_SIZE)
+    reply_pipeline = ReplyPipeline(telegram_client, send_scheduler)
+    bot = ScheduledBot(BOT_TOKEN, send_scheduler, pipeline=reply_pipeline if WEBHOOK_REPLIES else None,
+                       request=Request(con_pool_size=8))
+    dispatcher = Dispatcher(bot, None, workers=0, use_context=True)
+
+# Prices, catalog snapshot and menus shared with the other workers on this host
+with startup.phase('shared_cache'):
+    shared_cache = SharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
 
 # Initialize components
-db = Database()
-payment_handler = PaymentHandler()
-user_manager = UserManager()
+with startup.phase('storage'):
+    state_backend = create_state_backend()
+    events = EventQueue()
+    db = Database(events)
+    ledger = Ledger()
+    user_manager = UserManager(ledger, events)
+    if ledger.is_empty():
+        ledger.seed_opening_balances(user_manager.all_users())
+
+with startup.phase('payments'):
+    address_pool = AddressPool(WALLET_XPUBS, pool_size=ADDRESS_POOL_SIZE)
+    payment_handler = PaymentHandler(address_pool, shared_cache)
+
+# Product catalog (categories, subcategories, products)
+with startup.phase('catalog'):
+    catalog = Catalog(shared_cache=shared_cache)
+    menu_cache = MenuCache(catalog, shared_cache)
+store = Store(user_manager, db, catalog, ledger)
+
+# Drops superseded order records and keeps the order log's index fresh
+order_compactor = LogCompactor(db.log)
+
+# Last-seen timestamps, written to users.json in batches
+activity = ActivityTracker(user_manager)
+
+# Admin broadcasts (resumes jobs interrupted by a restart)
+broadcasts = BroadcastManager(user_manager, bot, send_scheduler)
+
+# Push order and balance updates to users as they happen
+notifier = EventConsumer(events, 'notifier', OrderNotifier(bot, catalog))
+
+# Conversation state (pending deposit amounts), shared across workers
+conversation_state = ConversationState(state_backend, default_ttl=3600)
+
+# Deposit prices locked per order, checked when the payment arrives
+quote_book = QuoteBook(state_backend, payment_handler)
+
+# Credit deposits as matching transfers arrive
+payment_watcher = PaymentWatcher(payment_handler, db, user_manager, quote_book)
+
+# Per-update span timings; slow traces land in traces.jsonl
+tracer = Tracer()
+
+# On-demand sampling profiler for this worker (/profiler, /debug/profiler)
+profiler = SamplingProfiler()
+
+# Queue depths, read when /metrics is scraped
+metrics.QUEUE_DEPTH.set_function(send_scheduler.pending, queue='telegram_send')
+metrics.QUEUE_DEPTH.set_function(lambda: len(db.pending_addresses()), queue='pending_deposit_addresses')
+for crypto_currency in address_pool.derivers:
+    metrics.QUEUE_DEPTH.set_function(lambda asset=crypto_currency: address_pool.free_count(asset),
+                                     queue=f'address_pool_{crypto_currency}')
+metrics.EVENT_LAG.set_function(notifier.lag, consumer='notifier')
 
-# Global storage for user context
-user_deposit_context = {}
 
 # Enable logging for debugging
 logging.basicConfig(
@@ -388,18 +132,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Load products data
-def load_products():
-    try:
-        with open('products.json', 'r') as f:
-            data = json.load(f)
-            return data.get('products', []), data.get('categories', []), data.get('subcategories', [])
-    except Exception as e:
-        logger.error(f"Error loading products: {e}")
-        return [], [], []
-
-products, categories, subcategories = load_products()
-
 # ---------------------------
 # User Command Functions
 # ---------------------------
@@ -444,15 +176,15 @@ def show_profile(update, context):
     profile_text = f"""
 👤 **User Profile**
 
-🆔 ID: `{user_data['user_id']}`
-👤 Name: {user_data['first_name']}
-📛 Username: @{user_data['username'] or 'N/A'}
-💰 Balance: ${user_data['balance']:.2f}
+🆔 ID: `{user_data.user_id}`
+👤 Name: {user_data.first_name}
+📛 Username: @{user_data.username or 'N/A'}
+💰 Balance: ${user_data.balance:.2f}
 
 📊 **Statistics:**
-💳 Total Deposited: ${user_data['total_deposited']:.2f}
-🛍️ Total Orders: {user_data['total_orders']}
-📅 Member Since: {datetime.fromisoformat(user_data['registration_date']).strftime('%Y-%m-%d')}
+💳 Total Deposited: ${user_data.total_deposited:.2f}
+🛍️ Total Orders: {user_data.total_orders}
+📅 Member Since: {datetime.fromisoformat(user_data.registration_date).strftime('%Y-%m-%d')}
     """
     
     keyboard = [
@@ -468,7 +200,7 @@ def show_profile(update, context):
 def add_balance(update, context):
     """Add balance command"""
     user = update.message.from_user
-    user_manager.update_user_activity(user.id)
+    activity.touch(user.id)
     
     balance_text = """
 💰 **Add Balance**
@@ -495,23 +227,14 @@ Choose a cryptocurrency to deposit:
 def show_services(update, context):
     """Show services/categories"""
     user = update.message.from_user
-    user_manager.update_user_activity(user.id)
+    activity.touch(user.id)
     
-    if not categories:
+    page = menu_cache.services()
+    if not page:
         update.message.reply_text("❌ No categories available at the moment.")
         return
     
-    services_text = "🛍️ **Available Categories**\n\n"
-    
-    keyboard = []
-    for category in categories:
-        services_text += f"📂 **{category['name']}**\n"
-        services_text += f"   {category['description']}\n\n"
-        keyboard.append([InlineKeyboardButton(category['name'], callback_data=f"category_{category['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    services_text, reply_markup = page
     update.message.reply_text(services_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 def show_about(update, context):
@@ -559,11 +282,11 @@ def show_orders(update, context):
     else:
         orders_text = "📋 **Your Orders**\n\n"
         for order in orders[-5:]:  # Show last 5 orders
-            status_emoji = "✅" if order['status'] == 'paid' else "⏳" if order['status'] == 'pending' else "❌"
-            orders_text += f"{status_emoji} Order #{order['order_id']}\n"
-            orders_text += f"   💰 ${order['amount']} • {order['crypto_currency']}\n"
-            orders_text += f"   📅 {datetime.fromisoformat(order['created_at']).strftime('%Y-%m-%d %H:%M')}\n"
-            orders_text += f"   📊 Status: {order['status'].title()}\n\n"
+            status_emoji = "✅" if order.status == 'paid' else "⏳" if order.status == 'pending' else "❌"
+            orders_text += f"{status_emoji} Order #{order.order_id}\n"
+            orders_text += f"   💰 ${order.amount} • {order.crypto_currency}\n"
+            orders_text += f"   📅 {datetime.fromisoformat(order.created_at).strftime('%Y-%m-%d %H:%M')}\n"
+            orders_text += f"   📊 Status: {order.status.title()}\n\n"
     
     keyboard = [
         [InlineKeyboardButton("🛍️ Browse Services", callback_data="services")],
@@ -584,7 +307,7 @@ def button_handler(update, context):
     
     data = query.data
     user_id = query.from_user.id
-    user_manager.update_user_activity(user_id)
+    activity.touch(user_id)
     
     try:
         if data == "main_menu":
@@ -614,6 +337,9 @@ def button_handler(update, context):
         else:
             query.edit_message_text("❌ Unknown button action. Use /start to restart.")
             
+    except RetryAfter as e:
+        # Still flood limited after the scheduler's retries; another send would only make it worse
+        logger.warning(f"Flood limited in button handler, retry after {e.retry_after}s")
     except Exception as e:
         logger.error(f"Error in button handler: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -659,15 +385,15 @@ def show_profile_callback(query):
     profile_text = f"""
 👤 **User Profile**
 
-🆔 ID: `{user_data['user_id']}`
-👤 Name: {user_data['first_name']}
-📛 Username: @{user_data['username'] or 'N/A'}
-💰 Balance: ${user_data['balance']:.2f}
+🆔 ID: `{user_data.user_id}`
+👤 Name: {user_data.first_name}
+📛 Username: @{user_data.username or 'N/A'}
+💰 Balance: ${user_data.balance:.2f}
 
 📊 **Statistics:**
-💳 Total Deposited: ${user_data['total_deposited']:.2f}
-🛍️ Total Orders: {user_data['total_orders']}
-📅 Member Since: {datetime.fromisoformat(user_data['registration_date']).strftime('%Y-%m-%d')}
+💳 Total Deposited: ${user_data.total_deposited:.2f}
+🛍️ Total Orders: {user_data.total_orders}
+📅 Member Since: {datetime.fromisoformat(user_data.registration_date).strftime('%Y-%m-%d')}
     """
     
     keyboard = [
@@ -706,21 +432,12 @@ Choose a cryptocurrency to deposit:
 
 def show_services_callback(query):
     """Show services for callback queries"""
-    if not categories:
+    page = menu_cache.services()
+    if not page:
         query.edit_message_text("❌ No categories available at the moment.")
         return
     
-    services_text = "🛍️ **Available Categories**\n\n"
-    
-    keyboard = []
-    for category in categories:
-        services_text += f"📂 **{category['name']}**\n"
-        services_text += f"   {category['description']}\n\n"
-        keyboard.append([InlineKeyboardButton(category['name'], callback_data=f"category_{category['id']}")])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    services_text, reply_markup = page
     query.edit_message_text(services_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 def show_about_callback(query):
@@ -768,11 +485,11 @@ def show_orders_callback(query):
     else:
         orders_text = "📋 **Your Orders**\n\n"
         for order in orders[-5:]:
-            status_emoji = "✅" if order['status'] == 'paid' else "⏳" if order['status'] == 'pending' else "❌"
-            orders_text += f"{status_emoji} Order #{order['order_id']}\n"
-            orders_text += f"   💰 ${order['amount']} • {order['crypto_currency']}\n"
-            orders_text += f"   📅 {datetime.fromisoformat(order['created_at']).strftime('%Y-%m-%d %H:%M')}\n"
-            orders_text += f"   📊 Status: {order['status'].title()}\n\n"
+            status_emoji = "✅" if order.status == 'paid' else "⏳" if order.status == 'pending' else "❌"
+            orders_text += f"{status_emoji} Order #{order.order_id}\n"
+            orders_text += f"   💰 ${order.amount} • {order.crypto_currency}\n"
+            orders_text += f"   📅 {datetime.fromisoformat(order.created_at).strftime('%Y-%m-%d %H:%M')}\n"
+            orders_text += f"   📊 Status: {order.status.title()}\n\n"
     
     keyboard = [
         [InlineKeyboardButton("🛍️ Browse Services", callback_data="services")],
@@ -788,7 +505,7 @@ def handle_deposit_selection(query, crypto_currency):
     user = query.from_user
     
     user_data = user_manager.get_user(user.id)
-    current_balance = user_data['balance'] if user_data else 0.0
+    current_balance = user_data.balance if user_data else 0.0
     
     # Get current price for display
     current_price = payment_handler.get_real_time_price(crypto_currency)
@@ -807,12 +524,11 @@ Please enter the amount in USD you want to deposit:
 ⏰ Address valid for 15 minutes
     """
     
-    # Store user context globally
-    global user_deposit_context
-    user_deposit_context[user.id] = {
+    # Remember that we're waiting for an amount from this user
+    conversation_state.set(user.id, {
         'awaiting_deposit_amount': crypto_currency,
         'timestamp': time.time()
-    }
+    })
     
     keyboard = [
         [InlineKeyboardButton("🔙 Back to Deposit", callback_data="add_balance")],
@@ -824,90 +540,59 @@ Please enter the amount in USD you want to deposit:
 
 def show_category_products(query, category_id):
     """Show products in a category"""
-    category_products = [p for p in products if p['category_id'] == category_id]
-    category = next((c for c in categories if c['id'] == category_id), None)
-    
-    if not category_products or not category:
+    page = menu_cache.category(category_id)
+    if not page:
         query.edit_message_text("❌ No products available in this category.")
         return
     
-    products_text = f"📂 **{category['name']}**\n\n"
-    products_text += f"{category['description']}\n\n"
-    
-    keyboard = []
-    for product in category_products:
-        products_text += f"🆔 {product['id']}: **{product['name']}**\n"
-        products_text += f"   💰 ${product['price']:.2f}\n"
-        products_text += f"   📝 {product['description']}\n\n"
-        keyboard.append([InlineKeyboardButton(
-            f"{product['name']} - ${product['price']:.2f}", 
-            callback_data=f"product_{product['id']}"
-        )])
-    
-    keyboard.append([InlineKeyboardButton("🔙 Back to Categories", callback_data="services")])
-    keyboard.append([InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")])
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    products_text, reply_markup = page
     query.edit_message_text(products_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 def show_product_details(query, product_id):
     """Show detailed product information"""
-    product = next((p for p in products if p['id'] == product_id), None)
-    if not product:
+    page = menu_cache.product(product_id)
+    if not page:
         query.edit_message_text("❌ Product not found.")
         return
     
-    category = next((c for c in categories if c['id'] == product['category_id']), {"name": "Unknown"})
-    subcategory = next((s for s in subcategories if s['id'] == product['subcategory_id']), {"name": "Unknown"})
-    
-    product_text = f"""
-📦 **{product['name']}**
-
-💰 **Price:** ${product['price']:.2f}
-📂 **Category:** {category['name']}
-📁 **Subcategory:** {subcategory['name']}
-
-📝 **Description:**
-{product['description']}
-
-⭐ **Features:**
-"""
-    for feature in product.get('features', []):
-        product_text += f"• {feature}\n"
-    
-    keyboard = [
-        [InlineKeyboardButton("🛒 Buy Now", callback_data=f"buy_{product['id']}")],
-        [InlineKeyboardButton("🔙 Back to Category", callback_data=f"category_{product['category_id']}")],
-        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
+    product_text, reply_markup = page
     query.edit_message_text(product_text, reply_markup=reply_markup, parse_mode='Markdown')
 
 def start_payment_process(query, product_id):
     """Start payment process for a product"""
-    product = next((p for p in products if p['id'] == product_id), None)
-    if not product:
+    user = query.from_user
+    
+    # Check, debit, count and create the order in one locked transaction. The key is the
+    # message version the button was clicked on, so a redelivered update or a double click
+    # on the same button pays once
+    message = query.message
+    request_key = None
+    if message:
+        clicked_version = message.edit_date or message.date
+        request_key = f"{message.chat.id}:{message.message_id}:{int(clicked_version.timestamp())}"
+    result = store.purchase(user.id, product_id, request_key=request_key)
+    
+    if result.status == 'user_not_found':
+        query.edit_message_text("❌ User not found. Please use /start first.")
+        return
+    
+    if result.status == 'product_not_found':
         query.edit_message_text("❌ Product not found.")
         return
     
-    user = query.from_user
-    user_data = user_manager.get_user(user.id)
+    user_data = result.user
+    product = result.product
     
-    if user_data['balance'] >= product['price']:
-        # User has enough balance
-        user_manager.update_balance(user.id, -product['price'])
-        user_manager.increment_orders(user.id)
-        
+    if result.ok:
         success_text = f"""
 ✅ **Purchase Successful!**
 
-📦 **Product:** {product['name']}
-💰 **Price:** ${product['price']:.2f}
-🆔 **Order ID:** {len(db.get_user_orders(user.id)) + 1}
+📦 **Product:** {product.name}
+💰 **Price:** ${product.price:.2f}
+🆔 **Order ID:** {result.order.order_id}
 
 💳 **Payment Method:** Balance
-💰 **New Balance:** ${user_data['balance'] - product['price']:.2f}
+💰 **New Balance:** ${user_data.balance:.2f}
 
 📦 Your product will be delivered shortly.
 Thank you for your purchase!
@@ -920,16 +605,17 @@ Thank you for your purchase!
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        query.edit_message_text(success_text, reply_markup=reply_markup, parse_mode='Markdown')
+        with send_priority(PRIORITY_HIGH):
+            query.edit_message_text(success_text, reply_markup=reply_markup, parse_mode='Markdown')
     else:
         # Not enough balance - show deposit options
-        balance_needed = product['price'] - user_data['balance']
+        balance_needed = money.from_minor(result.shortfall_cents, 'USD')
         
         payment_text = f"""
-🛒 **Purchase {product['name']}**
+🛒 **Purchase {product.name}**
 
-💰 **Product Price:** ${product['price']:.2f}
-💳 **Your Balance:** ${user_data['balance']:.2f}
+💰 **Product Price:** ${product.price:.2f}
+💳 **Your Balance:** ${user_data.balance:.2f}
 ❌ **Balance Shortage:** ${balance_needed:.2f}
 
 💡 Please add ${balance_needed:.2f} or more to your balance to complete this purchase.
@@ -937,7 +623,7 @@ Thank you for your purchase!
         
         keyboard = [
             [InlineKeyboardButton("💰 Add Balance", callback_data="add_balance")],
-            [InlineKeyboardButton("🔙 Back to Product", callback_data=f"product_{product['id']}")],
+            [InlineKeyboardButton("🔙 Back to Product", callback_data=f"product_{product.id}")],
             [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
@@ -949,49 +635,56 @@ def handle_text_message(update, context):
     user = update.message.from_user
     text = update.message.text.strip()
     
-    # Check if we're expecting a deposit amount from this user
-    global user_deposit_context
-    
-    user_context = user_deposit_context.get(user.id, {})
-    
-    # Clean old contexts (older than 1 hour)
-    current_time = time.time()
-    user_deposit_context = {uid: ctx for uid, ctx in user_deposit_context.items() 
-                           if current_time - ctx.get('timestamp', 0) < 3600}
+    # Check if we're expecting a deposit amount from this user (expires after 1 hour)
+    user_context = conversation_state.get(user.id) or {}
     
     if user_context and 'awaiting_deposit_amount' in user_context:
         crypto_currency = user_context['awaiting_deposit_amount']
         
         try:
-            usd_amount = float(text)
-            if usd_amount <= 0:
+            usd_cents = money.usd_to_cents(text)
+            if usd_cents <= 0:
                 update.message.reply_text("❌ Please enter a positive amount.")
                 return
             
-            if usd_amount < 1:
+            if usd_cents < 100:
                 update.message.reply_text("❌ Minimum deposit amount is $1.00")
                 return
             
-            if usd_amount > 10000:
+            if usd_cents > 1000000:
                 update.message.reply_text("❌ Maximum deposit amount is $10,000")
                 return
             
             # Clear the user context
-            user_deposit_context.pop(user.id, None)
+            conversation_state.pop(user.id)
             
-            # Generate payment information
-            crypto_amount, current_price = payment_handler.get_crypto_amount(usd_amount, crypto_currency)
+            # Price the deposit from the cached rate snapshot
+            quote = quote_book.quote(usd_cents, crypto_currency)
+            current_price = quote.exchange_rate
             payment_address = payment_handler.generate_payment_address(crypto_currency, f"deposit_{user.id}")
             
             if not payment_address:
                 update.message.reply_text("❌ Payment system temporarily unavailable. Please try again later.")
                 return
             
+            # The order gets a unique amount so the payment watcher can tell deposits apart
+            order = db.create_deposit_order(user.id, usd_cents, crypto_currency, quote.crypto_amount_minor,
+                                            payment_address, quote.exchange_rate_e8,
+                                            single_use_address=payment_handler.is_single_use_address(
+                                                crypto_currency, payment_address))
+            if not order:
+                payment_handler.release_payment_address(crypto_currency, payment_address)
+                update.message.reply_text("❌ Too many pending deposits right now. Please try again in a few minutes.")
+                return
+            quote_book.lock(quote, order)
+            crypto_amount = money.format_amount(order.crypto_amount_minor, crypto_currency)
+            
             payment_text = f"""
 💰 **Deposit Instructions - {crypto_currency}**
 
-💵 **Amount:** ${usd_amount:.2f} USD
-🪙 **To Pay:** {crypto_amount:.8f} {crypto_currency}
+🆔 **Order ID:** {order.order_id}
+💵 **Amount:** ${money.format_usd(usd_cents)} USD
+🪙 **To Pay:** {crypto_amount} {crypto_currency}
 💱 **Exchange Rate:** 1 {crypto_currency} = ${current_price:.4f} USD
 
 📍 **Send to this address:**
@@ -1001,7 +694,7 @@ def handle_text_message(update, context):
 🔍 **Network:** {crypto_currency.replace('_', ' ')}
 
 ⚠️ **Important:**
-• Send exactly {crypto_amount:.8f} {crypto_currency}
+• Send exactly {crypto_amount} {crypto_currency} (the last digits identify your deposit)
 • Only send {crypto_currency} to this address
 • Payment will be auto-confirmed
 • Do not send from exchange wallets
@@ -1031,16 +724,6 @@ def is_admin(user_id):
     """Check if user is admin"""
     return str(user_id) == str(ADMIN_ID)
 
-def load_data():
-    """Load all data from JSON files"""
-    with open('products.json', 'r') as f:
-        return json.load(f)
-
-def save_data(data):
-    """Save data to JSON files"""
-    with open('products.json', 'w') as f:
-        json.dump(data, f, indent=2)
-
 def add_category(update, context):
     """Add a new category: /addcategory Name|Description"""
     user_id = update.message.from_user.id
@@ -1064,27 +747,11 @@ def add_category(update, context):
         
         name, description = args
         
-        data = load_data()
-        
-        # Generate new category ID
-        new_id = max([c['id'] for c in data['categories']]) + 1 if data['categories'] else 1
-        
-        new_category = {
-            'id': new_id,
-            'name': name.strip(),
-            'description': description.strip()
-        }
-        
-        data['categories'].append(new_category)
-        save_data(data)
-        
-        # Reload products data
-        global categories
-        categories = data['categories']
+        new_category = catalog.add_category(name.strip(), description.strip())
         
         update.message.reply_text(
             f"✅ Category added successfully!\n\n"
-            f"🆔 ID: {new_id}\n"
+            f"🆔 ID: {new_category.id}\n"
             f"📂 Name: {name}\n"
             f"📝 Description: {description}"
         )
@@ -1116,34 +783,14 @@ def add_subcategory(update, context):
         
         name, category_id, description = args
         
-        data = load_data()
-        
-        # Check if category exists
-        category_exists = any(cat['id'] == int(category_id) for cat in data['categories'])
-        if not category_exists:
+        new_subcategory = catalog.add_subcategory(name.strip(), int(category_id), description.strip())
+        if not new_subcategory:
             update.message.reply_text(f"❌ Category ID {category_id} not found. Use /listcategories")
             return
         
-        # Generate new subcategory ID
-        new_id = max([s['id'] for s in data['subcategories']]) + 1 if data['subcategories'] else 1
-        
-        new_subcategory = {
-            'id': new_id,
-            'name': name.strip(),
-            'category_id': int(category_id),
-            'description': description.strip()
-        }
-        
-        data['subcategories'].append(new_subcategory)
-        save_data(data)
-        
-        # Reload products data
-        global subcategories
-        subcategories = data['subcategories']
-        
         update.message.reply_text(
             f"✅ Subcategory added successfully!\n\n"
-            f"🆔 ID: {new_id}\n"
+            f"🆔 ID: {new_subcategory.id}\n"
             f"📂 Name: {name}\n"
             f"🏷️ Category ID: {category_id}\n"
             f"📝 Description: {description}"
@@ -1178,57 +825,33 @@ def add_product(update, context):
         
         name, description, price, category_id, subcategory_id, features = args
         
-        data = load_data()
-        
         # Check if category exists
-        category_exists = any(cat['id'] == int(category_id) for cat in data['categories'])
-        if not category_exists:
+        category = catalog.get_category(int(category_id))
+        if not category:
             update.message.reply_text(f"❌ Category ID {category_id} not found.")
             return
         
-        # Check if subcategory exists and belongs to category
-        subcategory_exists = any(
-            sub['id'] == int(subcategory_id) and sub['category_id'] == int(category_id) 
-            for sub in data['subcategories']
-        )
-        if not subcategory_exists:
-            update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found or doesn't belong to category {category_id}.")
-            return
-        
-        # Generate new product ID
-        new_id = max([p['id'] for p in data['products']]) + 1 if data['products'] else 1
-        
         # Parse features
         feature_list = [f.strip() for f in features.split(',')]
         
-        new_product = {
-            'id': new_id,
-            'name': name.strip(),
-            'description': description.strip(),
-            'price': float(price),
-            'category_id': int(category_id),
-            'subcategory_id': int(subcategory_id),
-            'features': feature_list
-        }
-        
-        data['products'].append(new_product)
-        save_data(data)
-        
-        # Reload products data
-        global products
-        products = data['products']
+        # Fails if the subcategory is missing or doesn't belong to the category
+        new_product = catalog.add_product(
+            name.strip(), description.strip(), money.usd_to_cents(price),
+            int(category_id), int(subcategory_id), feature_list
+        )
+        if not new_product:
+            update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found or doesn't belong to category {category_id}.")
+            return
         
-        # Get category and subcategory names for confirmation
-        category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == int(category_id)), "Unknown")
-        subcategory_name = next((sub['name'] for sub in data['subcategories'] if sub['id'] == int(subcategory_id)), "Unknown")
+        subcategory = catalog.get_subcategory(int(subcategory_id))
         
         update.message.reply_text(
             f"✅ Product added successfully!\n\n"
-            f"🆔 ID: {new_id}\n"
+            f"🆔 ID: {new_product.id}\n"
             f"📦 Name: {name}\n"
             f"💰 Price: ${float(price):.2f}\n"
-            f"📂 Category: {category_name}\n"
-            f"📁 Subcategory: {subcategory_name}\n"
+            f"📂 Category: {category.name}\n"
+            f"📁 Subcategory: {subcategory.name}\n"
             f"⭐ Features: {', '.join(feature_list)}"
         )
         
@@ -1246,24 +869,24 @@ def list_categories(update, context):
         return
     
     try:
-        data = load_data()
+        categories = catalog.categories
         
-        if not data['categories']:
+        if not categories:
             update.message.reply_text("📭 No categories available.")
             return
         
         categories_text = "📂 **All Categories & Subcategories:**\n\n"
         
-        for category in data['categories']:
-            categories_text += f"🏷️ **{category['name']}** (ID: {category['id']})\n"
-            categories_text += f"   📝 {category['description']}\n"
+        for category in categories:
+            categories_text += f"🏷️ **{category.name}** (ID: {category.id})\n"
+            categories_text += f"   📝 {category.description}\n"
             
             # Show subcategories for this category
-            subcategories_list = [s for s in data['subcategories'] if s['category_id'] == category['id']]
+            subcategories_list = catalog.subcategories_in_category(category.id)
             if subcategories_list:
                 for sub in subcategories_list:
-                    categories_text += f"   └─ 📁 {sub['name']} (ID: {sub['id']})\n"
-                    categories_text += f"        📝 {sub['description']}\n"
+                    categories_text += f"   └─ 📁 {sub.name} (ID: {sub.id})\n"
+                    categories_text += f"        📝 {sub.description}\n"
             else:
                 categories_text += f"   └─ 📭 No subcategories\n"
             
@@ -1283,19 +906,19 @@ def list_subcategories(update, context):
         return
     
     try:
-        data = load_data()
+        subcategories = catalog.subcategories
         
-        if not data['subcategories']:
+        if not subcategories:
             update.message.reply_text("📭 No subcategories available.")
             return
         
         subcategories_text = "📁 **All Subcategories:**\n\n"
         
-        for subcategory in data['subcategories']:
-            category = next((c for c in data['categories'] if c['id'] == subcategory['category_id']), {"name": "Unknown"})
-            subcategories_text += f"📁 **{subcategory['name']}** (ID: {subcategory['id']})\n"
-            subcategories_text += f"   🏷️ Category: {category['name']} (ID: {subcategory['category_id']})\n"
-            subcategories_text += f"   📝 {subcategory['description']}\n\n"
+        for subcategory in subcategories:
+            category = catalog.get_category(subcategory.category_id)
+            subcategories_text += f"📁 **{subcategory.name}** (ID: {subcategory.id})\n"
+            subcategories_text += f"   🏷️ Category: {category.name if category else 'Unknown'} (ID: {subcategory.category_id})\n"
+            subcategories_text += f"   📝 {subcategory.description}\n\n"
         
         update.message.reply_text(subcategories_text, parse_mode='Markdown')
         
@@ -1311,27 +934,43 @@ def list_products(update, context):
         return
     
     try:
-        data = load_data()
+        products = catalog.products
         
-        if not data['products']:
+        if not products:
             update.message.reply_text("📭 No products available.")
             return
         
         products_text = "📦 **All Products:**\n\n"
-        for product in data['products']:
-            category = next((c for c in data['categories'] if c['id'] == product['category_id']), {"name": "Unknown"})
-            subcategory = next((s for s in data['subcategories'] if s['id'] == product['subcategory_id']), {"name": "Unknown"})
+        for product in products:
+            category = catalog.get_category(product.category_id)
+            subcategory = catalog.get_subcategory(product.subcategory_id)
             
-            products_text += f"🆔 {product['id']}: {product['name']}\n"
-            products_text += f"   💰 ${product['price']} | 📂 {category['name']} | 📁 {subcategory['name']}\n"
-            products_text += f"   📝 {product['description']}\n"
-            products_text += f"   ⭐ Features: {', '.join(product.get('features', []))}\n\n"
+            products_text += f"🆔 {product.id}: {product.name}\n"
+            products_text += f"   💰 ${product.price} | 📂 {category.name if category else 'Unknown'} | 📁 {subcategory.name if subcategory else 'Unknown'}\n"
+            products_text += f"   📝 {product.description}\n"
+            products_text += f"   ⭐ Features: {', '.join(product.features)}\n\n"
         
         update.message.reply_text(products_text, parse_mode='Markdown')
         
     except Exception as e:
         update.message.reply_text(f"❌ Error: {str(e)}")
 
+def export_catalog(update, context):
+    """Send the catalog as an indented products.json: /exportcatalog"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    try:
+        catalog.refresh()
+        document = BytesIO(dumps_pretty(catalog.to_dict()))
+        update.message.reply_document(document, filename='products.json',
+                                      caption=f"📦 {len(catalog.products)} products")
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
 def delete_product(update, context):
     """Delete a product: /deleteproduct PRODUCT_ID"""
     user_id = update.message.from_user.id
@@ -1346,21 +985,11 @@ def delete_product(update, context):
     
     try:
         product_id = int(context.args[0])
-        data = load_data()
-        
-        initial_count = len(data['products'])
-        data['products'] = [p for p in data['products'] if p['id'] != product_id]
         
-        if len(data['products']) == initial_count:
+        if not catalog.delete_product(product_id):
             update.message.reply_text(f"❌ Product ID {product_id} not found.")
             return
         
-        save_data(data)
-        
-        # Reload products data
-        global products
-        products = data['products']
-        
         update.message.reply_text(f"✅ Product ID {product_id} deleted successfully.")
         
     except ValueError:
@@ -1382,38 +1011,17 @@ def delete_category(update, context):
     
     try:
         category_id = int(context.args[0])
-        data = load_data()
         
-        # Check if category exists
-        category_exists = any(cat['id'] == category_id for cat in data['categories'])
-        if not category_exists:
+        # Cascade delete: category, its subcategories and their products
+        result = catalog.delete_category(category_id)
+        if not result:
             update.message.reply_text(f"❌ Category ID {category_id} not found.")
             return
         
-        # Get category name for confirmation
-        category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == category_id), "Unknown")
-        
-        # Delete category
-        data['categories'] = [c for c in data['categories'] if c['id'] != category_id]
-        
-        # Delete related subcategories
-        subcategories_deleted = [s for s in data['subcategories'] if s['category_id'] == category_id]
-        data['subcategories'] = [s for s in data['subcategories'] if s['category_id'] != category_id]
-        
-        # Delete related products
-        products_deleted = [p for p in data['products'] if p['category_id'] == category_id]
-        data['products'] = [p for p in data['products'] if p['category_id'] != category_id]
-        
-        save_data(data)
-        
-        # Reload global data
-        global categories, subcategories, products
-        categories = data['categories']
-        subcategories = data['subcategories']
-        products = data['products']
+        category, subcategories_deleted, products_deleted = result
         
         update.message.reply_text(
-            f"✅ Category '{category_name}' (ID: {category_id}) deleted successfully.\n\n"
+            f"✅ Category '{category.name}' (ID: {category_id}) deleted successfully.\n\n"
             f"🗑️ Also deleted:\n"
             f"• {len(subcategories_deleted)} subcategories\n"
             f"• {len(products_deleted)} products"
@@ -1438,40 +1046,173 @@ def delete_subcategory(update, context):
     
     try:
         subcategory_id = int(context.args[0])
-        data = load_data()
         
-        # Check if subcategory exists
-        subcategory_exists = any(sub['id'] == subcategory_id for sub in data['subcategories'])
-        if not subcategory_exists:
+        # Cascade delete: subcategory and its products
+        result = catalog.delete_subcategory(subcategory_id)
+        if not result:
             update.message.reply_text(f"❌ Subcategory ID {subcategory_id} not found.")
             return
         
-        # Get subcategory name and category info for confirmation
-        subcategory = next((sub for sub in data['subcategories'] if sub['id'] == subcategory_id), None)
-        category_name = next((cat['name'] for cat in data['categories'] if cat['id'] == subcategory['category_id']), "Unknown")
+        subcategory, products_deleted = result
+        category = catalog.get_category(subcategory.category_id)
         
-        # Delete subcategory
-        data['subcategories'] = [s for s in data['subcategories'] if s['id'] != subcategory_id]
+        update.message.reply_text(
+            f"✅ Subcategory '{subcategory.name}' (ID: {subcategory_id}) deleted successfully.\n\n"
+            f"📂 Category: {category.name if category else 'Unknown'}\n"
+            f"🗑️ Also deleted: {len(products_deleted)} products"
+        )
         
-        # Delete related products
-        products_deleted = [p for p in data['products'] if p['subcategory_id'] == subcategory_id]
-        data['products'] = [p for p in data['products'] if p['subcategory_id'] != subcategory_id]
+    except ValueError:
+        update.message.reply_text("❌ Subcategory ID must be a number")
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def reconcile_balances(update, context):
+    """Rebuild balances from the ledger and report mismatches: /reconcile"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    try:
+        started = time.time()
+        mismatches = ledger.reconcile(user_manager.all_users())
+        elapsed = time.time() - started
+        
+        if not mismatches:
+            update.message.reply_text(f"✅ Ledger and balances match.\n\n⏱️ Reconciled in {elapsed:.2f}s")
+            return
         
-        save_data(data)
+        reconcile_text = f"⚠️ {len(mismatches)} balance mismatches:\n\n"
+        for mismatch_user_id, ledger_cents, snapshot_cents in mismatches[:20]:
+            snapshot = f"${money.format_usd(snapshot_cents)}" if snapshot_cents is not None else "no user"
+            reconcile_text += f"🆔 {mismatch_user_id}: ledger ${money.format_usd(ledger_cents)} | stored {snapshot}\n"
+        reconcile_text += f"\n⏱️ Reconciled in {elapsed:.2f}s"
         
-        # Reload global data
-        global subcategories, products
-        subcategories = data['subcategories']
-        products = data['products']
+        update.message.reply_text(reconcile_text)
         
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def broadcast(update, context):
+    """Send a message to every user in the background: /broadcast TEXT"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    # Keep the text exactly as typed, line breaks included
+    parts = update.message.text.split(None, 1)
+    if len(parts) < 2 or not parts[1].strip():
+        update.message.reply_text("📝 Usage: /broadcast TEXT")
+        return
+    
+    try:
+        job = broadcasts.create(parts[1].strip(), admin_chat_id=update.message.chat_id)
         update.message.reply_text(
-            f"✅ Subcategory '{subcategory['name']}' (ID: {subcategory_id}) deleted successfully.\n\n"
-            f"📂 Category: {category_name}\n"
-            f"🗑️ Also deleted: {len(products_deleted)} products"
+            f"📢 Broadcast {job['id']} started for {job['total']} users.\n\n"
+            f"Use /broadcaststatus to follow it or /broadcastcancel {job['id']} to stop it."
         )
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def broadcast_status(update, context):
+    """Delivery stats of recent broadcasts: /broadcaststatus [JOB_ID]"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    try:
+        if context.args:
+            job = broadcasts.load(context.args[0])
+            jobs = [job] if job else []
+        else:
+            jobs = broadcasts.jobs()
+        
+        if not jobs:
+            update.message.reply_text("📭 No broadcasts found.")
+            return
         
+        update.message.reply_text("\n\n".join(format_job(job) for job in jobs))
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def broadcast_cancel(update, context):
+    """Stop a running broadcast: /broadcastcancel JOB_ID"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    if not context.args:
+        update.message.reply_text("📝 Usage: /broadcastcancel JOB_ID")
+        return
+    
+    try:
+        job = broadcasts.cancel(context.args[0])
+        if not job:
+            update.message.reply_text("❌ No running broadcast with that ID.")
+            return
+        update.message.reply_text(f"⏹️ Broadcast cancelled.\n\n{format_job(job)}")
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def show_traces(update, context):
+    """Slowest recently recorded update traces: /traces [N]"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    try:
+        limit = min(int(context.args[0]), 20) if context.args else 5
+        traces = tracer.slowest(limit)
+        if not traces:
+            update.message.reply_text(f"📭 No traces recorded yet (slow threshold {tracer.slow_ms:.0f} ms).")
+            return
+        
+        traces_text = f"🐢 Slowest {len(traces)} recent updates:\n\n"
+        traces_text += "\n\n".join(format_trace(record) for record in traces)
+        update.message.reply_text(traces_text[:4000])
     except ValueError:
-        update.message.reply_text("❌ Subcategory ID must be a number")
+        update.message.reply_text("📝 Usage: /traces [N]")
+    except Exception as e:
+        update.message.reply_text(f"❌ Error: {str(e)}")
+
+def run_profiler(update, context):
+    """Profile this worker and send the top functions and stacks: /profiler [SECONDS]"""
+    user_id = update.message.from_user.id
+    
+    if not is_admin(user_id):
+        update.message.reply_text("❌ Admin access required.")
+        return
+    
+    try:
+        seconds = int(context.args[0]) if context.args else 30
+        if not 1 <= seconds <= 300:
+            update.message.reply_text("❌ Profile for 1 to 300 seconds.")
+            return
+        
+        chat_id = update.message.chat_id
+        
+        def send_results(result):
+            bot.send_message(chat_id, format_summary(result))
+            with open(result['file'], 'rb') as f:
+                bot.send_document(chat_id, f, filename=os.path.basename(result['file']),
+                                  caption="Collapsed stacks for flamegraph.pl or speedscope")
+        
+        if not profiler.start(seconds, send_results):
+            update.message.reply_text("⏳ A profile is already running in this worker.")
+            return
+        update.message.reply_text(f"🔬 Profiling worker {os.getpid()} for {seconds}s...")
+    except ValueError:
+        update.message.reply_text("📝 Usage: /profiler [SECONDS]")
     except Exception as e:
         update.message.reply_text(f"❌ Error: {str(e)}")
 
@@ -1494,17 +1235,47 @@ dispatcher.add_handler(CommandHandler("addsubcategory", add_subcategory))
 dispatcher.add_handler(CommandHandler("listproducts", list_products))
 dispatcher.add_handler(CommandHandler("listcategories", list_categories))
 dispatcher.add_handler(CommandHandler("listsubcategories", list_subcategories))
+dispatcher.add_handler(CommandHandler("exportcatalog", export_catalog))
 dispatcher.add_handler(CommandHandler("deleteproduct", delete_product))
 dispatcher.add_handler(CommandHandler("deletecategory", delete_category))
 dispatcher.add_handler(CommandHandler("deletesubcategory", delete_subcategory))
+dispatcher.add_handler(CommandHandler("reconcile", reconcile_balances))
+dispatcher.add_handler(CommandHandler("broadcast", broadcast))
+dispatcher.add_handler(CommandHandler("broadcaststatus", broadcast_status))
+dispatcher.add_handler(CommandHandler("broadcastcancel", broadcast_cancel))
+dispatcher.add_handler(CommandHandler("traces", show_traces))
+dispatcher.add_handler(CommandHandler("profiler", run_profiler))
 
 # Callback and message handlers
 dispatcher.add_handler(CallbackQueryHandler(button_handler))
 dispatcher.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_text_message))
 
+# Metric labels for updates; anything else is bucketed as unknown
+KNOWN_COMMANDS = {command for handlers in dispatcher.handlers.values() for handler in handlers
+                  if isinstance(handler, CommandHandler) for command in handler.command}
+KNOWN_CALLBACK_PREFIXES = {'main', 'services', 'category', 'product', 'buy', 'profile',
+                           'orders', 'about', 'add', 'deposit'}
+
 # ---------------------------
 # Flask Routes
 # ---------------------------
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.get('request_started')
+    if started is not None:
+        # Label by endpoint name so the bot token in the webhook URL never shows up
+        metrics.HTTP_SECONDS.observe(time.perf_counter() - started,
+                                     endpoint=request.endpoint or 'unknown', status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def home():
     return jsonify({
@@ -1516,20 +1287,94 @@ def home():
     })
 
 @app.route('/health')
-def health():
-    return jsonify({"status": "healthy"})
+@app.route('/live')
+def live():
+    """Liveness: the worker is up and answering (``/health`` is kept for existing monitors)"""
+    return jsonify({"status": "alive", "pid": os.getpid()})
+
+@app.route('/ready')
+def ready():
+    """Readiness: 200 once caches, prices and menus are warm, 503 before or while a task fails"""
+    is_ready = warmup.ready.is_set()
+    failed = warmup.failed(required_only=True)
+    if is_ready:
+        status = "ready"
+    elif failed:
+        status = "failed"
+    else:
+        status = "warming_up"
+    return jsonify({
+        "status": status,
+        "pid": os.getpid(),
+        "startup": startup.report(),
+        "warmup": warmup.results,
+        "pending": warmup.pending(),
+        "failed": failed
+    }), 200 if is_ready else 503
+
+@app.route('/debug/profiler', methods=['GET', 'POST'])
+def profiler_endpoint():
+    """POST ?seconds=N starts a profile of this worker; GET returns the last collapsed stacks"""
+    token = request.headers.get('X-Profiler-Token', '')
+    if not PROFILER_TOKEN or not hmac.compare_digest(token, PROFILER_TOKEN):
+        return jsonify({"ok": False, "error": "not found"}), 404
+    
+    if request.method == 'POST':
+        try:
+            seconds = min(max(int(request.args.get('seconds', 30)), 1), 300)
+        except ValueError:
+            return jsonify({"ok": False, "error": "seconds must be a number"}), 400
+        started = profiler.start(seconds)
+        return jsonify({"ok": started, "pid": os.getpid(), "seconds": seconds}), 202 if started else 409
+    
+    result = profiler.last_result
+    if result is None:
+        return jsonify({"ok": False, "pid": os.getpid(), "running": profiler.running}), 404
+    if request.args.get('format') == 'summary':
+        return Response(format_summary(result), mimetype='text/plain')
+    with open(result['file'], 'r') as f:
+        return Response(f.read(), mimetype='text/plain')
 
 @app.route(f'/{BOT_TOKEN}', methods=['POST'])
 def webhook():
     """Receive Telegram updates"""
     try:
-        update = Update.de_json(request.get_json(force=True), bot)
-        dispatcher.process_update(update)
+        data = loads(request.get_data())
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid JSON"}), 400
+    route = update_route(data)
+    started = time.perf_counter()
+    try:
+        with tracer.trace('update', update_id=data.get('update_id'), route=route):
+            update = decode_update(data, bot)
+            with reply_pipeline.collect() as reply:
+                dispatcher.process_update(update)
     except Exception as e:
+        metrics.UPDATE_ERRORS.inc(route=route)
         logger.error(f"Error processing update: {e}")
         return jsonify({"ok": False, "error": str(e)}), 500
+    finally:
+        metrics.UPDATE_SECONDS.observe(time.perf_counter() - started, route=route)
+    if reply.body is not None:
+        # Telegram runs this method itself, saving a round trip from here
+        return jsonify(reply.body)
     return jsonify({"ok": True})
 
+def update_route(data):
+    """Low-cardinality label for an update: command, callback prefix or kind"""
+    message = data.get('message') or data.get('edited_message')
+    if message:
+        text = message.get('text') or ''
+        if text.startswith('/'):
+            command = text.split()[0][1:].split('@')[0].lower()
+            return f"/{command}" if command in KNOWN_COMMANDS else '/unknown'
+        return 'text'
+    if 'callback_query' in data:
+        # "category_3" -> "category", "deposit_BTC" -> "deposit"
+        prefix = (data['callback_query'].get('data') or '').split('_')[0]
+        return f"callback:{prefix}" if prefix in KNOWN_CALLBACK_PREFIXES else 'callback:unknown'
+    return 'other'
+
 @app.route('/setwebhook')
 def set_webhook():
     """Manually trigger setting the webhook"""
@@ -1547,6 +1392,32 @@ def delete_webhook():
 # ---------------------------
 # Startup
 # ---------------------------
+def start_background_services():
+    address_pool.start()
+    notifier.start()
+    payment_watcher.start()
+    order_compactor.start()
+    broadcasts.resume()
+
+def prefetch_prices():
+    for crypto_currency in CRYPTO_NETWORKS:
+        payment_handler.get_rate(crypto_currency)
+
+# Warm caches (replaying the ledger, which also repairs balances a crash left
+# unrecorded), prices and menus (then /ready answers 200), start background
+# services; web3 (slow to import) last
+warmup.add('users', user_manager.all_users)
+warmup.add('orders', db.pending_addresses)
+warmup.add('ledger', user_manager.repair_from_ledger)
+warmup.add('menus', menu_cache.render_all)
+warmup.add('prices', prefetch_prices)
+warmup.add('background_services', start_background_services, required=False)
+warmup.add('web3', lambda: payment_handler.bsc_web3, required=False)
+
+startup.ready()
+print(startup.summary())
+warmup.start()
+
 if __name__ == '__main__':
     # Automatically set webhook on startup
     try:
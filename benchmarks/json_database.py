@@ -0,0 +1,173 @@
+"""The previous order store, kept for the storage benchmarks' comparison with the order log"""
+from datetime import datetime
+
+from database import _new_order
+from deposit_tags import DepositTagIndex
+from metrics import instrument_methods
+from models import Order, OrderColumns
+from storage import CachedJsonFile
+
+
+@instrument_methods('database', 'create_order', 'create_deposit_order', 'get_order', 'update_order_status',
+                    'get_user_orders', 'find_pending_deposit', 'cleanup_expired_orders')
+class JsonDatabase:
+    """Every order in one ``orders.json`` array; any write rewrites the whole file"""
+    
+    def __init__(self, events=None):
+        self.orders_file = 'orders.json'
+        self.events = events
+        self._store = CachedJsonFile(self.orders_file, list, self._decode, self._encode)
+        self._indexed = None
+        self._by_id = {}
+        self._by_user = {}
+        self._next_id = 1
+        self._columns = None
+        self.deposit_tags = DepositTagIndex()
+    
+    @staticmethod
+    def _decode(raw):
+        return [Order.from_dict(data) for data in raw]
+    
+    @staticmethod
+    def _encode(orders):
+        return [order.to_dict() for order in orders]
+    
+    def _read_orders(self):
+        return self._ensure_index(self._store.load())
+    
+    def _ensure_index(self, orders):
+        if orders is not self._indexed:
+            self._reindex(orders)
+        return orders
+    
+    def _reindex(self, orders):
+        self._by_id = {order.order_id: order for order in orders}
+        self._next_id = max(self._by_id, default=0) + 1
+        self._by_user = {}
+        for order in orders:
+            self._by_user.setdefault(order.user_id, []).append(order)
+        self.deposit_tags.rebuild(orders)
+        self._indexed = orders
+        self._columns = None
+    
+    def transaction(self):
+        """Locked read-modify-write over all orders (see CachedJsonFile.transaction)"""
+        return self._store.transaction()
+    
+    def publish(self, event_type, order, **extra):
+        """Publish an order event (after the order has been saved)"""
+        if self.events:
+            self.events.publish(
+                event_type, order_id=order.order_id, user_id=order.user_id, product_id=order.product_id,
+                amount_cents=order.amount_cents, crypto_currency=order.crypto_currency,
+                crypto_amount_minor=order.crypto_amount_minor, status=order.status, **extra
+            )
+    
+    def add_order(self, orders, user_id, product_id, amount_cents, crypto_currency, crypto_amount_minor,
+                  payment_address, exchange_rate_e8, status='pending'):
+        """Append a new order to ``orders`` (caller holds the transaction)"""
+        self._ensure_index(orders)
+        order_id = self._next_id
+        self._next_id += 1
+        
+        order = _new_order(order_id, user_id, product_id, amount_cents, crypto_currency,
+                           crypto_amount_minor, payment_address, exchange_rate_e8, status)
+        orders.append(order)
+        self._by_id[order_id] = order
+        self._by_user.setdefault(user_id, []).append(order)
+        self.deposit_tags.add(order)
+        self._columns = None
+        return order
+    
+    def create_order(self, user_id, product_id, amount_cents, crypto_currency, crypto_amount_minor, payment_address, exchange_rate_e8):
+        with self.transaction() as txn:
+            order = self.add_order(txn.value, user_id, product_id, amount_cents, crypto_currency,
+                                   crypto_amount_minor, payment_address, exchange_rate_e8)
+            txn.changed = True
+        
+        self.publish('order_created', order)
+        return order
+    
+    def create_deposit_order(self, user_id, amount_cents, crypto_currency, base_minor, payment_address, exchange_rate_e8):
+        """Create a pending balance deposit with a unique tagged crypto amount.
+
+        Returns None when every tag slot above ``base_minor`` is taken.
+        """
+        with self.transaction() as txn:
+            self._ensure_index(txn.value)
+            crypto_amount_minor = self.deposit_tags.allocate(crypto_currency, payment_address, base_minor)
+            if crypto_amount_minor is None:
+                return None
+            
+            order = self.add_order(txn.value, user_id, None, amount_cents, crypto_currency,
+                                   crypto_amount_minor, payment_address, exchange_rate_e8)
+            txn.changed = True
+        
+        self.publish('order_created', order)
+        return order
+    
+    def find_pending_deposit(self, crypto_currency, payment_address, crypto_amount_minor):
+        """Pending order expecting exactly this amount at this address, in O(1)"""
+        self._read_orders()
+        return self.deposit_tags.lookup(crypto_currency, payment_address, crypto_amount_minor)
+    
+    def pending_at_address(self, crypto_currency, payment_address):
+        self._read_orders()
+        return self.deposit_tags.at_address(crypto_currency, payment_address)
+    
+    def pending_addresses(self, crypto_currency=None):
+        """``(crypto_currency, address)`` pairs with pending orders"""
+        self._read_orders()
+        return self.deposit_tags.addresses(crypto_currency)
+    
+    def get_order(self, order_id):
+        self._read_orders()
+        return self._by_id.get(order_id)
+    
+    def update_order_status(self, order_id, status):
+        with self.transaction() as txn:
+            self._ensure_index(txn.value)
+            order = self._by_id.get(order_id)
+            if not order:
+                return False
+            
+            order.status = status
+            if status == 'paid':
+                order.paid_at = datetime.now().isoformat()
+            if status != 'pending':
+                self.deposit_tags.discard(order)
+            txn.changed = True
+        
+        if status == 'paid':
+            self.publish('order_paid', order)
+        elif status == 'expired':
+            self.publish('order_expired', order)
+        return True
+    
+    def get_user_orders(self, user_id):
+        self._read_orders()
+        return list(self._by_user.get(user_id, ()))
+    
+    def columns(self):
+        """Columnar snapshot of all orders for reports and bulk scans"""
+        orders = self._read_orders()
+        if self._columns is None:
+            self._columns = OrderColumns(orders)
+        return self._columns
+    
+    def cleanup_expired_orders(self):
+        """Remove orders that have expired; returns the removed orders"""
+        with self.transaction() as txn:
+            orders = txn.value
+            expired = set(OrderColumns(orders).expired_positions(datetime.now().timestamp()))
+            if not expired:
+                return []
+            
+            removed = [orders[i] for i in sorted(expired)]
+            txn.value = [order for i, order in enumerate(orders) if i not in expired]
+            txn.changed = True
+        
+        for order in removed:
+            order.status = 'expired'
+            self.publish('order_expired', order)
+        return removed
@@ -0,0 +1,96 @@
+import json
+import math
+import platform
+import sys
+
+import metrics
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[max(1, math.ceil(fraction * len(sorted_samples))) - 1]
+
+
+def summarize(samples):
+    """count, mean and p50/p95/p99/max (milliseconds) of durations in seconds"""
+    ordered = sorted(samples)
+    to_ms = 1000.0
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * to_ms, 3) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 0.50) * to_ms, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * to_ms, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * to_ms, 3),
+        'max_ms': round(ordered[-1] * to_ms, 3) if ordered else 0.0
+    }
+
+
+def storage_snapshot():
+    """Per ``file:op`` operation count, bytes and seconds from the storage metrics"""
+    timings = metrics.STORAGE_SECONDS.snapshot()
+    sizes = metrics.STORAGE_BYTES.snapshot()
+    snapshot = {}
+    for (file, op), (count, seconds) in timings.items():
+        snapshot[f"{file}:{op}"] = {'ops': count, 'bytes': sizes.get((file, op), 0), 'seconds': seconds}
+    return snapshot
+
+
+def storage_delta(before, after):
+    delta = {}
+    for key, value in after.items():
+        previous = before.get(key, {'ops': 0, 'bytes': 0, 'seconds': 0.0})
+        ops = value['ops'] - previous['ops']
+        if ops:
+            delta[key] = {
+                'ops': ops,
+                'bytes': value['bytes'] - previous['bytes'],
+                'ms': round((value['seconds'] - previous['seconds']) * 1000.0, 3)
+            }
+    return dict(sorted(delta.items()))
+
+
+def environment():
+    return {'python': sys.version.split()[0], 'platform': platform.platform(), 'machine': platform.machine()}
+
+
+def save(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(current, baseline, tolerance=0.15, min_delta_ms=0.5, keys=('p50_ms', 'p95_ms', 'p99_ms')):
+    """Regressions of ``current`` against ``baseline`` as readable lines.
+
+    Both map a scenario name to a summary from ``summarize``. A latency is
+    a regression when it is more than ``tolerance`` (relative) and
+    ``min_delta_ms`` (absolute, to ignore sub-millisecond jitter) slower.
+    Scenarios missing from either side are skipped.
+    """
+    regressions = []
+    for name, old in baseline.items():
+        new = current.get(name)
+        if not new:
+            continue
+        for key in keys:
+            if key not in old or key not in new:
+                continue
+            if new[key] > old[key] * (1 + tolerance) and new[key] - old[key] > min_delta_ms:
+                regressions.append(f"{name} {key}: {old[key]:.3f} -> {new[key]:.3f} ms "
+                                   f"(+{(new[key] / old[key] - 1) * 100 if old[key] else float('inf'):.0f}%)")
+    return regressions
+
+
+def print_table(results, title):
+    print(f"\n{title}")
+    print(f"{'scenario':<28}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for name, row in results.items():
+        print(f"{name:<28}{row['count']:>8}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}"
+              f"{row['p95_ms']:>10.3f}{row['p99_ms']:>10.3f}{row['max_ms']:>10.3f}")
@@ -0,0 +1,86 @@
+import random
+from datetime import datetime, timedelta
+
+from config import WALLET_ADDRESSES
+from deposit_tags import tag_quantum
+from models import User, Order
+from money import RATE_DECIMALS
+from storage import atomic_write_json
+
+FIRST_USER_ID = 100000000
+
+
+def make_users(count, rng, now=None):
+    """``count`` users with random balances and activity over the last 90 days"""
+    now = now or datetime.now()
+    users = []
+    for i in range(count):
+        registered = now - timedelta(days=rng.uniform(1, 365))
+        users.append(User(
+            user_id=FIRST_USER_ID + i,
+            username=f"user{i}",
+            first_name=f"User {i}",
+            balance_cents=rng.randrange(0, 50000),
+            registration_date=registered.isoformat(),
+            total_deposited_cents=rng.randrange(0, 200000),
+            total_orders=rng.randrange(0, 20),
+            last_activity=(now - timedelta(days=rng.uniform(0, 90))).isoformat()
+        ))
+    return users
+
+
+def make_orders(count, users, products, rng, pending_ratio=0.01, now=None):
+    """``count`` orders spread over ``users``.
+
+    Mostly paid balance purchases of ``products``, plus paid crypto
+    deposits and a ``pending_ratio`` share of unexpired pending deposits
+    with unique tagged amounts, like the live store accumulates.
+    """
+    now = now or datetime.now()
+    assets = list(WALLET_ADDRESSES)
+    orders = []
+    for order_id in range(1, count + 1):
+        user = users[rng.randrange(len(users))]
+        created = now - timedelta(days=rng.uniform(0, 365))
+        if rng.random() < pending_ratio:
+            asset = assets[order_id % len(assets)]
+            created = now - timedelta(minutes=rng.uniform(0, 10))
+            order = Order(
+                order_id=order_id, user_id=user.user_id, product_id=None,
+                amount_cents=rng.randrange(100, 100000), crypto_currency=asset,
+                crypto_amount_minor=10 ** 6 + order_id * tag_quantum(asset),
+                payment_address=WALLET_ADDRESSES[asset], exchange_rate_e8=10 ** RATE_DECIMALS,
+                status='pending', created_at=created.isoformat(),
+                expires_at=(created + timedelta(minutes=15)).isoformat()
+            )
+        elif products and rng.random() < 0.8:
+            product = products[rng.randrange(len(products))]
+            order = Order(
+                order_id=order_id, user_id=user.user_id, product_id=product.id,
+                amount_cents=product.price_cents, crypto_currency='USD',
+                crypto_amount_minor=product.price_cents, payment_address=None,
+                exchange_rate_e8=10 ** RATE_DECIMALS, status='paid', created_at=created.isoformat(),
+                expires_at=(created + timedelta(minutes=15)).isoformat(), paid_at=created.isoformat()
+            )
+        else:
+            asset = assets[order_id % len(assets)]
+            order = Order(
+                order_id=order_id, user_id=user.user_id, product_id=None,
+                amount_cents=rng.randrange(100, 100000), crypto_currency=asset,
+                crypto_amount_minor=rng.randrange(10 ** 4, 10 ** 8),
+                payment_address=WALLET_ADDRESSES[asset], exchange_rate_e8=10 ** RATE_DECIMALS,
+                status='paid', created_at=created.isoformat(),
+                expires_at=(created + timedelta(minutes=15)).isoformat(), paid_at=created.isoformat()
+            )
+        orders.append(order)
+    return orders
+
+
+def seed_files(users_count, orders_count, products=(), seed=1, users_file='users.json', orders_file='orders.json'):
+    """Write synthetic ``users.json`` and ``orders.json`` in the stores' on-disk format"""
+    rng = random.Random(seed)
+    users = make_users(users_count, rng)
+    orders = make_orders(orders_count, users, list(products), rng)
+    atomic_write_json(users_file, {str(user.user_id): user.to_dict() for user in users})
+    atomic_write_json(orders_file, [order.to_dict() for order in orders])
+    return users, orders
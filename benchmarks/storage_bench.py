@@ -0,0 +1,214 @@
+"""Microbenchmarks for the user and order stores at 1k to 1M rows.
+
+Seeds ``users.json`` and ``orders.json`` with N rows each and times the
+store operations the bot's handlers use, per backend, plus the cost of
+the first (cold) load and the memory it takes (tracemalloc high-water
+mark). Run from the repository root:
+
+    python -m benchmarks.storage_bench --sizes 1000,10000,100000
+    python -m benchmarks.storage_bench --sizes 1000000 --max-seconds 20
+    python -m benchmarks.storage_bench --baseline storage-baseline.json
+
+A backend is a function in ``BACKENDS`` that opens ``(user_store,
+order_store)`` in the working directory, migrating from the seeded JSON
+files if it keeps its own format; every scenario runs against each one.
+"""
+import argparse
+import gc
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB = 1024 * 1024
+
+
+def json_backend():
+    from benchmarks.json_database import JsonDatabase
+    from user_manager import UserManager
+    return UserManager(), JsonDatabase()
+
+
+def log_backend():
+    """Orders in the append-only order log (migrated from orders.json on first open)"""
+    from database import Database
+    from user_manager import UserManager
+    return UserManager(), Database()
+
+
+# name -> opener; openers run inside the seeded working directory
+BACKENDS = {
+    'json': json_backend,
+    'log': log_backend
+}
+
+
+def scenarios(users, orders, user_ids, rng):
+    """``name -> operation`` for one opened backend"""
+    def get_user():
+        users.get_user(rng.choice(user_ids))
+    
+    def update_balance():
+        users.update_balance(rng.choice(user_ids), 1)
+    
+    def create_order():
+        orders.create_order(rng.choice(user_ids), None, 1000, 'USD', 1000, None, 10 ** 8)
+    
+    def get_user_orders():
+        orders.get_user_orders(rng.choice(user_ids))
+    
+    def cleanup_expired_orders():
+        orders.cleanup_expired_orders()
+    
+    return {
+        'get_user': get_user,
+        'update_balance': update_balance,
+        'create_order': create_order,
+        'get_user_orders': get_user_orders,
+        'cleanup_expired_orders': cleanup_expired_orders
+    }
+
+
+def time_operation(operation, ops, max_seconds):
+    """Run ``operation`` up to ``ops`` times (at least 3) or until ``max_seconds`` is spent"""
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    for _ in range(ops):
+        started = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - started)
+        if len(samples) >= 3 and time.perf_counter() > deadline:
+            break
+    return samples
+
+
+def measure_load(opener, user_ids):
+    """Cold open + first read of both stores: (seconds, peak MB, retained MB)"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    users, orders = opener()
+    users.get_user(user_ids[0])
+    orders.get_user_orders(user_ids[0])
+    seconds = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak / MB, retained / MB
+
+
+def bench_backend(name, size, args, results):
+    from benchmarks.seed import seed_files
+    from catalog import Catalog
+    
+    workdir = tempfile.mkdtemp(prefix=f'storage-bench-{name}-{size}-')
+    try:
+        shutil.copy(os.path.join(REPO_ROOT, 'products.json'), workdir)
+        os.chdir(workdir)
+        seeded_users, _ = seed_files(size, size, Catalog().products, seed=args.seed)
+        user_ids = [user.user_id for user in seeded_users]
+        del seeded_users
+        file_mb = (os.path.getsize('users.json') + os.path.getsize('orders.json')) / MB
+        
+        # Memory pass (tracemalloc slows everything down, so it is not timed further)
+        load_seconds, peak_mb, retained_mb = measure_load(BACKENDS[name], user_ids)
+        gc.collect()
+        
+        # Timing pass on a fresh instance, cold load first
+        started = time.perf_counter()
+        users, orders = BACKENDS[name]()
+        users.get_user(user_ids[0])
+        orders.get_user_orders(user_ids[0])
+        cold_seconds = time.perf_counter() - started
+        
+        rows = {'cold_load': results.summarize([cold_seconds])}
+        rng = random.Random(args.seed)
+        for scenario, operation in scenarios(users, orders, user_ids, rng).items():
+            rows[scenario] = results.summarize(time_operation(operation, args.ops, args.max_seconds))
+        
+        return {
+            'backend': name,
+            'rows': size,
+            'file_mb': round(file_mb, 1),
+            'load_seconds_traced': round(load_seconds, 3),
+            'load_peak_mb': round(peak_mb, 1),
+            'retained_mb': round(retained_mb, 1),
+            'scenarios': rows
+        }
+    finally:
+        os.chdir(REPO_ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def flatten_runs(report):
+    """``backend@rows:scenario -> summary`` for baseline comparison"""
+    return {f"{run['backend']}@{run['rows']}:{scenario}": row
+            for run in report.get('runs', []) for scenario, row in run['scenarios'].items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark user/order storage at increasing sizes")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help="comma-separated row counts for users and orders (default 1000,10000,100000)")
+    parser.add_argument('--backends', default=','.join(BACKENDS), help=f"comma-separated, from {', '.join(BACKENDS)}")
+    parser.add_argument('--ops', type=int, default=200, help="operations per scenario (default 200)")
+    parser.add_argument('--max-seconds', type=float, default=10.0, help="time budget per scenario (default 10)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help="write the full report to this file")
+    parser.add_argument('--save-baseline', help="write the report as a baseline file")
+    parser.add_argument('--baseline', help="compare against this baseline; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path.insert(0, REPO_ROOT)
+    from benchmarks import results
+    
+    runs = []
+    for size in (int(size) for size in args.sizes.split(',')):
+        for name in args.backends.split(','):
+            if name not in BACKENDS:
+                print(f"❌ Unknown backend {name}")
+                return 2
+            run = bench_backend(name, size, args, results)
+            runs.append(run)
+            results.print_table(run['scenarios'], f"{name} @ {size} rows: {run['file_mb']} MB on disk, "
+                                                  f"load peak {run['load_peak_mb']} MB, "
+                                                  f"retained {run['retained_mb']} MB")
+    
+    report = {
+        'benchmark': 'storage',
+        'params': {'sizes': args.sizes, 'backends': args.backends, 'ops': args.ops, 'seed': args.seed},
+        'environment': results.environment(),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'runs': runs
+    }
+    print(f"\nProcess max RSS: {report['max_rss_mb']} MB")
+    
+    if args.json_path:
+        results.save(report, args.json_path)
+    if args.save_baseline:
+        results.save(report, args.save_baseline)
+        print(f"\n✅ Baseline saved to {args.save_baseline}")
+    
+    status = 0
+    if args.baseline:
+        regressions = results.compare(flatten_runs(report), flatten_runs(results.load(args.baseline)), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
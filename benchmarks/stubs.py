@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+
+import requests
+import telegram.utils.request as telegram_request
+
+from reply_pipeline import AsyncTelegramClient
+
+# Fixed prices so quotes are reproducible
+PRICES = {'BTC': '65000.00', 'LTC': '80.00', 'USDT': '1.00'}
+
+
+class UpstreamStub:
+    """Local stand-ins for the Telegram Bot API and the price/chain APIs.
+
+    Patches ``requests.Session.request`` (price providers, blockstream,
+    blockcypher and web3's BSC JSON-RPC), python-telegram-bot's
+    ``Request._request_wrapper`` and ``AsyncTelegramClient._post``, so
+    requests are still encoded and the responses still parsed. ``latency`` (seconds) is slept per call to
+    model the network round trip. Calls are counted per service/method.
+    """
+    
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._message_id = 0
+        self._originals = None
+    
+    def install(self):
+        if self._originals is None:
+            self._originals = (requests.Session.request, telegram_request.Request._request_wrapper,
+                               AsyncTelegramClient._post)
+            stub = self
+            
+            def session_request(session, method, url, **kwargs):
+                return stub.http(method, url, kwargs.get('json') or kwargs.get('data'))
+            
+            def request_wrapper(request, method, url, **kwargs):
+                return stub.telegram(url, kwargs.get('body'))
+            
+            async def client_post(client, method, body):
+                # Off the client's loop so the simulated latency does not serialise calls
+                payload = await asyncio.get_running_loop().run_in_executor(None, stub.telegram, f"/{method}", body)
+                return 200, payload
+            
+            requests.Session.request = session_request
+            telegram_request.Request._request_wrapper = request_wrapper
+            AsyncTelegramClient._post = client_post
+        return self
+    
+    def uninstall(self):
+        if self._originals is not None:
+            (requests.Session.request, telegram_request.Request._request_wrapper,
+             AsyncTelegramClient._post) = self._originals
+            self._originals = None
+    
+    def webhook_reply(self, body):
+        """Count a Bot API call returned in a webhook response (no round trip)"""
+        if body and 'method' in body:
+            with self._lock:
+                self.calls[f"webhook_reply:{body['method']}"] += 1
+    
+    def _count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+    
+    # ---------------------------
+    # Telegram
+    # ---------------------------
+    def telegram(self, url, body):
+        method = url.rsplit('/', 1)[-1]
+        self._count(f"telegram:{method}")
+        data = json.loads(body) if body else {}
+        
+        if method in ('sendMessage', 'editMessageText'):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            result = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(data.get('chat_id', 0)), 'type': 'private'},
+                'text': data.get('text', '')
+            }
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        else:
+            result = True
+        return json.dumps({'ok': True, 'result': result}).encode()
+    
+    # ---------------------------
+    # Price and chain APIs
+    # ---------------------------
+    def http(self, method, url, payload):
+        parts = urlsplit(url)
+        self._count(parts.netloc)
+        query = parse_qs(parts.query)
+        if isinstance(payload, (bytes, str)):
+            payload = json.loads(payload)  # web3 posts pre-encoded JSON-RPC
+        
+        if parts.netloc == 'api.binance.com':
+            symbol = query.get('symbol', [''])[0]
+            asset = symbol[:-4] if symbol.endswith('USDT') else symbol
+            body = {'symbol': symbol, 'price': PRICES.get(asset, '1.00')}
+        elif parts.netloc == 'blockstream.info':
+            body = [] if parts.path.endswith('/txs') else {'chain_stats': {'funded_txo_sum': 0}}
+        elif parts.netloc == 'api.blockcypher.com':
+            body = {'txrefs': [], 'unconfirmed_txrefs': [], 'total_received': 0}
+        elif isinstance(payload, dict) and 'method' in payload:
+            body = self._json_rpc(payload)
+        else:
+            body = {}
+        
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers['Content-Type'] = 'application/json'
+        response._content = json.dumps(body).encode()
+        return response
+    
+    def _json_rpc(self, payload):
+        results = {
+            'eth_chainId': '0x38',
+            'eth_blockNumber': '0x2000000',
+            'eth_getLogs': [],
+            'eth_call': '0x' + '0' * 64
+        }
+        return {'jsonrpc': '2.0', 'id': payload.get('id'), 'result': results.get(payload['method'])}
@@ -0,0 +1,272 @@
+"""Load benchmark for the webhook path.
+
+Posts synthetic Telegram updates (start, profile, catalog browsing,
+deposits, purchases, order history) to ``app.webhook()`` through Flask's
+test client, with Telegram and the price/chain APIs stubbed locally, and
+reports throughput, per-scenario p50/p95/p99 and storage I/O.
+
+Run from the repository root:
+
+    python -m benchmarks.webhook_bench --users 10000 --orders 50000 --updates 5000
+    python -m benchmarks.webhook_bench --save-baseline bench-baseline.json
+    python -m benchmarks.webhook_bench --baseline bench-baseline.json
+
+Each run works in a fresh temporary directory seeded from ``--seed``, so
+runs with the same arguments replay the same updates. A baseline only
+means something on the machine it was recorded on.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Relative weights of user flows; deposit is two updates (pick asset, send amount)
+SCENARIO_WEIGHTS = {
+    'start': 10,
+    'services': 15,
+    'category': 20,
+    'product': 20,
+    'profile': 10,
+    'orders': 5,
+    'deposit': 5,
+    'buy': 10
+}
+
+
+class Workload:
+    """Reproducible stream of update flows from seeded users"""
+    
+    def __init__(self, user_ids, catalog, seed=1, new_user_ratio=0.05):
+        self.rng = random.Random(seed)
+        self.user_ids = user_ids
+        self.category_ids = [category.id for category in catalog.categories]
+        self.product_ids = [product.id for product in catalog.products]
+        self.new_user_ratio = new_user_ratio
+        self._update_ids = itertools.count(1)
+        self._new_user_ids = itertools.count(900000000)
+        self._scenarios = list(SCENARIO_WEIGHTS)
+        self._weights = list(SCENARIO_WEIGHTS.values())
+    
+    def _user(self, new=False):
+        user_id = next(self._new_user_ids) if new else self.user_ids[self.rng.randrange(len(self.user_ids))]
+        return {'id': user_id, 'is_bot': False, 'first_name': f"User {user_id}", 'username': f"user{user_id}"}
+    
+    def message(self, user, text):
+        message = {
+            'message_id': self.rng.randrange(1, 10 ** 6),
+            'date': int(time.time()),
+            'chat': {'id': user['id'], 'type': 'private'},
+            'from': user,
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._update_ids), 'message': message}
+    
+    def click(self, user, data):
+        return {
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(self.rng.randrange(10 ** 12)),
+                'from': user,
+                'chat_instance': str(user['id']),
+                'data': data,
+                'message': {
+                    'message_id': self.rng.randrange(1, 10 ** 6),
+                    'date': int(time.time()),
+                    'chat': {'id': user['id'], 'type': 'private'},
+                    'text': 'menu'
+                }
+            }
+        }
+    
+    def flow(self):
+        """One user action as ``[(scenario, update), ...]``"""
+        scenario = self.rng.choices(self._scenarios, self._weights)[0]
+        if scenario == 'start':
+            user = self._user(new=self.rng.random() < self.new_user_ratio)
+            return [('start', self.message(user, '/start'))]
+        
+        user = self._user()
+        if scenario == 'services':
+            return [('services', self.click(user, 'services'))]
+        if scenario == 'category':
+            return [('category', self.click(user, f"category_{self.rng.choice(self.category_ids)}"))]
+        if scenario == 'product':
+            return [('product', self.click(user, f"product_{self.rng.choice(self.product_ids)}"))]
+        if scenario == 'profile':
+            return [('profile', self.click(user, 'profile'))]
+        if scenario == 'orders':
+            return [('orders', self.message(user, '/orders'))]
+        if scenario == 'buy':
+            return [('buy', self.click(user, f"buy_{self.rng.choice(self.product_ids)}"))]
+        asset = self.rng.choice(('BTC', 'LTC', 'USDT_BEP20'))
+        amount = f"{self.rng.randrange(5, 500)}.{self.rng.randrange(100):02d}"
+        return [('deposit_menu', self.click(user, f"deposit_{asset}")),
+                ('deposit_amount', self.message(user, amount))]
+    
+    def flows(self, updates):
+        flows, total = [], 0
+        while total < updates:
+            flow = self.flow()
+            flows.append(flow)
+            total += len(flow)
+        return flows
+
+
+def run_flows(app_module, flows, threads, stub=None):
+    """Post every flow's updates in order; returns ({scenario: [seconds]}, errors, wall seconds)"""
+    path = f"/{app_module.BOT_TOKEN}"
+    durations = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    
+    def worker(assigned):
+        client = app_module.app.test_client()
+        local = []
+        for flow in assigned:
+            for scenario, update in flow:
+                body = json.dumps(update).encode()
+                started = time.perf_counter()
+                response = client.post(path, data=body, content_type='application/json')
+                local.append((scenario, time.perf_counter() - started, response.status_code))
+                if stub is not None:
+                    stub.webhook_reply(response.get_json(silent=True))
+        with lock:
+            for scenario, seconds, status in local:
+                durations[scenario].append(seconds)
+                if status != 200:
+                    errors[scenario] += 1
+    
+    # A flow always stays on one thread so its updates arrive in order
+    shares = [flows[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=worker, args=(share,)) for share in shares]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return durations, errors, time.perf_counter() - started
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Telegram webhook path with stubbed upstream APIs")
+    parser.add_argument('--users', type=int, default=10000, help="seeded users (default 10000)")
+    parser.add_argument('--orders', type=int, default=50000, help="seeded orders (default 50000)")
+    parser.add_argument('--updates', type=int, default=5000, help="measured updates (default 5000)")
+    parser.add_argument('--warmup', type=int, default=200, help="unmeasured updates first (default 200)")
+    parser.add_argument('--threads', type=int, default=1, help="concurrent clients, like gunicorn --threads (default 1)")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="simulated upstream round trip per call")
+    parser.add_argument('--paced', action='store_true', help="keep Telegram flood-limit pacing (off: measures our code)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workdir', help="directory for the seeded data files (default: a fresh temp dir)")
+    parser.add_argument('--keep', action='store_true', help="keep the temp dir afterwards")
+    parser.add_argument('--json', dest='json_path', help="write the full report to this file")
+    parser.add_argument('--save-baseline', help="write the report as a baseline file")
+    parser.add_argument('--baseline', help="compare against this baseline; exit 1 on regressions")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = args.workdir or tempfile.mkdtemp(prefix='webhook-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    shutil.copy(os.path.join(REPO_ROOT, 'products.json'), workdir)
+    
+    # The bot reads config and its data files relative to the working directory
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_ROOT)
+    if not args.paced:
+        os.environ.setdefault('TELEGRAM_GLOBAL_RATE', '1000000')
+        os.environ.setdefault('TELEGRAM_CHAT_RATE', '1000000')
+    
+    from benchmarks import results
+    from benchmarks.seed import seed_files
+    from benchmarks.stubs import UpstreamStub
+    from catalog import Catalog
+    
+    stub = UpstreamStub(latency=args.latency_ms / 1000.0).install()
+    users, _ = seed_files(args.users, args.orders, Catalog().products, seed=args.seed)
+    
+    import_started = time.perf_counter()
+    import app as app_module
+    import_seconds = time.perf_counter() - import_started
+    
+    workload = Workload([user.user_id for user in users], app_module.catalog, seed=args.seed)
+    run_flows(app_module, workload.flows(args.warmup), 1, stub)
+    
+    storage_before = results.storage_snapshot()
+    calls_before = dict(stub.calls)
+    flows = workload.flows(args.updates)
+    durations, errors, wall = run_flows(app_module, flows, max(1, args.threads), stub)
+    storage = results.storage_delta(storage_before, results.storage_snapshot())
+    upstream = {name: count - calls_before.get(name, 0) for name, count in sorted(stub.calls.items())
+                if count - calls_before.get(name, 0)}
+    
+    measured = sum(len(samples) for samples in durations.values())
+    scenarios = {name: results.summarize(durations[name]) for name in sorted(durations)}
+    report = {
+        'benchmark': 'webhook',
+        'params': {key: getattr(args, key) for key in ('users', 'orders', 'updates', 'warmup', 'threads',
+                                                       'latency_ms', 'paced', 'seed')},
+        'environment': results.environment(),
+        'import_seconds': round(import_seconds, 3),
+        'throughput_per_s': round(measured / wall, 1) if wall else 0.0,
+        'overall': results.summarize([s for samples in durations.values() for s in samples]),
+        'scenarios': scenarios,
+        'errors': dict(errors),
+        'storage': storage,
+        'upstream_calls': upstream
+    }
+    
+    results.print_table(scenarios, f"Webhook: {measured} updates in {wall:.2f}s "
+                                   f"({report['throughput_per_s']}/s, {args.threads} thread(s))")
+    print(f"\nStartup (import app): {report['import_seconds']}s")
+    if errors:
+        print(f"❌ Non-200 responses: {dict(errors)}")
+    print("\nStorage I/O (measured run):")
+    for name, row in storage.items():
+        print(f"  {name:<32}{row['ops']:>8} ops{row['bytes']:>14} bytes{row['ms']:>12.1f} ms")
+    print("\nUpstream calls (measured run):")
+    for name, count in upstream.items():
+        print(f"  {name:<32}{count:>8}")
+    
+    if args.json_path:
+        results.save(report, args.json_path)
+    if args.save_baseline:
+        results.save(report, args.save_baseline)
+        print(f"\n✅ Baseline saved to {args.save_baseline}")
+    
+    status = 0
+    if args.baseline:
+        baseline = results.load(args.baseline)
+        if baseline.get('params') != report['params']:
+            print("⚠️ Baseline was recorded with different parameters; comparing anyway")
+        regressions = results.compare(scenarios, baseline.get('scenarios', {}), args.tolerance)
+        if regressions:
+            print(f"\n❌ {len(regressions)} regression(s) against {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            status = 1
+        else:
+            print(f"\n✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    
+    if not args.workdir and not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return status
+
+
+if __name__ == '__main__':
+    # Background threads (scheduler, watcher, notifier) are daemons; skip their shutdown
+    sys.stdout.flush()
+    os._exit(main())
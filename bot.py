@@ -12,6 +12,7 @@ from database import Database
 from payment_handler import PaymentHandler
 from user_manager import UserManager
 from admin_commands import AdminCommands
+from catalog import Catalog
 
 # Enable logging
 logging.basicConfig(
@@ -33,14 +34,13 @@ class CryptoStoreBot:
         self.setup_handlers()
         self.load_products()
         # Initialize admin commands
-        self.admin_commands = AdminCommands(self.dispatcher)
+        self.admin_commands = AdminCommands(self.dispatcher, self.catalog)
         
     def load_products(self):
-        with open('products.json', 'r') as f:
-            data = json.load(f)
-            self.products = data.get('products', [])
-            self.categories = data.get('categories', [])
-            self.subcategories = data.get('subcategories', [])
+        self.catalog = Catalog()
+        self.products = self.catalog.products
+        self.categories = self.catalog.categories
+        self.subcategories = self.catalog.subcategories
     
     def setup_handlers(self):
         # Command handlers
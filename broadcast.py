@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+
+from telegram.error import Unauthorized, BadRequest
+
+from send_scheduler import PRIORITY_LOW
+from serialization import loads
+from storage import atomic_write_json, file_lock
+
+
+class BroadcastManager:
+    """Resumable admin broadcasts to every user.
+
+    Each job is a checkpoint file ``broadcasts/<job_id>.json``. Recipients
+    are taken from the sorted user id array in chunks after the job's
+    ``cursor`` (the last user id handled), sent through the scheduler's
+    low priority lane, and the cursor and delivery counts are saved after
+    every chunk. A job interrupted by a restart continues from its last
+    checkpoint; a run lock makes sure only one worker sends it.
+    """
+    
+    def __init__(self, user_manager, bot, scheduler, jobs_dir='broadcasts', chunk_size=500):
+        self.user_manager = user_manager
+        self.bot = bot
+        self.scheduler = scheduler
+        self.jobs_dir = jobs_dir
+        self.chunk_size = chunk_size
+        os.makedirs(self.jobs_dir, exist_ok=True)
+    
+    def _path(self, job_id):
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+    
+    def load(self, job_id):
+        try:
+            with open(self._path(job_id), 'rb') as f:
+                return loads(f.read())
+        except (OSError, ValueError):
+            return None
+    
+    def jobs(self, limit=5):
+        """Most recent jobs first"""
+        names = sorted((n for n in os.listdir(self.jobs_dir) if n.endswith('.json')), reverse=True)
+        jobs = (self.load(name[:-5]) for name in names[:limit])
+        return [job for job in jobs if job]
+    
+    def create(self, text, admin_chat_id=None):
+        """Save a new job and start sending it in the background"""
+        job = {
+            'id': str(int(time.time() * 1000)),
+            'text': text,
+            'admin_chat_id': admin_chat_id,
+            'status': 'running',
+            'cursor': None,
+            'total': len(self.user_manager.user_ids()),
+            'sent': 0,
+            'blocked': 0,
+            'failed': 0,
+            'created_at': time.time(),
+            'updated_at': time.time(),
+            'finished_at': None
+        }
+        atomic_write_json(self._path(job['id']), job)
+        self.start(job['id'])
+        return job
+    
+    def cancel(self, job_id):
+        with file_lock(self._path(job_id)):
+            job = self.load(job_id)
+            if not job or job['status'] != 'running':
+                return None
+            job['status'] = 'cancelled'
+            job['finished_at'] = time.time()
+            atomic_write_json(self._path(job_id), job)
+            return job
+    
+    def start(self, job_id):
+        thread = threading.Thread(target=self._run, args=(job_id,), name=f'broadcast-{job_id}', daemon=True)
+        thread.start()
+        return thread
+    
+    def resume(self):
+        """Restart jobs left running by a previous process"""
+        for name in os.listdir(self.jobs_dir):
+            if name.endswith('.json'):
+                job = self.load(name[:-5])
+                if job and job['status'] == 'running':
+                    self.start(job['id'])
+    
+    def _next_chunk(self, cursor):
+        # Re-read each time so users who joined after the cursor are included
+        user_ids = self.user_manager.user_ids()
+        start = 0 if cursor is None else bisect_right(user_ids, cursor)
+        return user_ids[start:start + self.chunk_size]
+    
+    def _send(self, user_id, text):
+        return self.scheduler.submit(
+            lambda: self.bot.send_message(chat_id=user_id, text=text),
+            chat_id=str(user_id), priority=PRIORITY_LOW
+        )
+    
+    def _checkpoint(self, job_id, cursor, counts, done):
+        """Save progress; returns False if the job was cancelled meanwhile"""
+        with file_lock(self._path(job_id)):
+            job = self.load(job_id)
+            if job is None or job['status'] != 'running':
+                return False
+            job['cursor'] = cursor
+            for key, value in counts.items():
+                job[key] += value
+            job['updated_at'] = time.time()
+            if done:
+                job['status'] = 'done'
+                job['finished_at'] = time.time()
+            atomic_write_json(self._path(job_id), job)
+            return True
+    
+    def _run(self, job_id):
+        try:
+            with file_lock(self._path(job_id) + '.run', blocking=False):
+                self._send_all(job_id)
+        except BlockingIOError:
+            pass  # another worker is sending this job
+        except Exception as e:
+            print(f"❌ Broadcast {job_id} failed: {e}")
+    
+    def _send_all(self, job_id):
+        job = self.load(job_id)
+        if not job or job['status'] != 'running':
+            return
+        
+        cursor = job['cursor']
+        print(f"📢 Broadcast {job_id} sending from user {cursor}")
+        while True:
+            chunk = self._next_chunk(cursor)
+            if not len(chunk):
+                break
+            
+            futures = [self._send(user_id, job['text']) for user_id in chunk]
+            counts = {'sent': 0, 'blocked': 0, 'failed': 0}
+            for future in futures:
+                try:
+                    future.result()
+                    counts['sent'] += 1
+                except Unauthorized:
+                    counts['blocked'] += 1
+                except BadRequest:
+                    counts['failed'] += 1
+                except Exception as e:
+                    print(f"Broadcast send error: {e}")
+                    counts['failed'] += 1
+            
+            cursor = chunk[-1]
+            if not self._checkpoint(job_id, cursor, counts, done=False):
+                print(f"⏹️ Broadcast {job_id} cancelled")
+                return
+        
+        self._checkpoint(job_id, cursor, {}, done=True)
+        job = self.load(job_id)
+        print(f"✅ Broadcast {job_id} done: {job['sent']} sent, {job['blocked']} blocked, {job['failed']} failed")
+        if job.get('admin_chat_id'):
+            self.bot.send_message(chat_id=job['admin_chat_id'], text=format_job(job))
+
+
+def format_job(job):
+    """Status summary of a broadcast job for admins"""
+    status_icon = {'running': '⏳', 'done': '✅', 'cancelled': '⏹️'}.get(job['status'], '❔')
+    handled = job['sent'] + job['blocked'] + job['failed']
+    preview = job['text'] if len(job['text']) <= 40 else job['text'][:40] + '…'
+    return (
+        f"{status_icon} Broadcast {job['id']} ({job['status']})\n"
+        f"💬 {preview}\n"
+        f"📊 {handled}/{job['total']} handled: {job['sent']} sent, "
+        f"{job['blocked']} blocked, {job['failed']} failed"
+    )
@@ -0,0 +1,284 @@
+import os
+import threading
+
+from models import Category, Subcategory, Product
+from serialization import loads
+from storage import atomic_write_json
+
+
+class Catalog:
+    """Product catalog kept in memory with parent→child reverse indexes.
+
+    Categories, subcategories and products are stored in id-keyed dicts
+    (insertion ordered, so listings keep the order of products.json) and
+    every mutation bumps ``version`` exactly once after it has been written
+    to disk. ``revision`` (the file's mtime) names the same content in every
+    worker; with a ``shared_cache`` the parsed snapshot is published under
+    it so other workers skip reading the file.
+    """
+    
+    def __init__(self, products_file='products.json', shared_cache=None):
+        self.products_file = products_file
+        self.shared_cache = shared_cache
+        self._lock = threading.RLock()
+        self._mtime = None
+        self.version = 0
+        self._load()
+    
+    # ---------------------------
+    # Loading / persistence
+    # ---------------------------
+    def _read_file(self):
+        try:
+            with open(self.products_file, 'rb') as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return {'categories': [], 'subcategories': [], 'products': []}
+    
+    def _file_mtime(self):
+        try:
+            return os.stat(self.products_file).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    def _read_shared(self, mtime):
+        if not self.shared_cache or mtime is None:
+            return None
+        snapshot = self.shared_cache.get('catalog')
+        if snapshot and snapshot['mtime'] == mtime:
+            return snapshot['data']
+        return None
+    
+    def _publish(self, data):
+        if self.shared_cache and self._mtime is not None:
+            self.shared_cache.set('catalog', {'mtime': self._mtime, 'data': data})
+    
+    def _load(self):
+        # The mtime is taken first: a rewrite during the read is picked up by the next refresh()
+        mtime = self._file_mtime()
+        data = self._read_shared(mtime)
+        self._mtime = mtime
+        if data is None:
+            data = self._read_file()
+            if self._file_mtime() == mtime:
+                self._publish(data)
+        self._index(data)
+        self.version += 1
+    
+    @property
+    def revision(self):
+        """Identifies the loaded content across workers (products.json mtime)"""
+        return self._mtime
+    
+    def _index(self, data):
+        self._categories = {c['id']: Category.from_dict(c) for c in data.get('categories', [])}
+        self._subcategories = {s['id']: Subcategory.from_dict(s) for s in data.get('subcategories', [])}
+        self._products = {p['id']: Product.from_dict(p) for p in data.get('products', [])}
+        
+        # Reverse indexes: parent id -> ordered set (dict) of child ids
+        self._subs_by_category = {cid: {} for cid in self._categories}
+        self._products_by_category = {cid: {} for cid in self._categories}
+        self._products_by_subcategory = {sid: {} for sid in self._subcategories}
+        
+        for sub in self._subcategories.values():
+            self._subs_by_category.setdefault(sub.category_id, {})[sub.id] = None
+        for product in self._products.values():
+            self._products_by_category.setdefault(product.category_id, {})[product.id] = None
+            self._products_by_subcategory.setdefault(product.subcategory_id, {})[product.id] = None
+        
+        self._next_ids = {
+            'categories': max(self._categories, default=0) + 1,
+            'subcategories': max(self._subcategories, default=0) + 1,
+            'products': max(self._products, default=0) + 1
+        }
+    
+    def to_dict(self):
+        return {
+            'categories': [c.to_dict() for c in self._categories.values()],
+            'subcategories': [s.to_dict() for s in self._subcategories.values()],
+            'products': [p.to_dict() for p in self._products.values()]
+        }
+    
+    def _save(self):
+        data = self.to_dict()
+        atomic_write_json(self.products_file, data)
+        self._mtime = self._file_mtime()
+        self._publish(data)
+    
+    def _commit(self):
+        """Persist the pending in-memory change and publish a new version.
+
+        If the write fails the in-memory state is rebuilt from disk so a
+        half-applied mutation is never visible to readers.
+        """
+        try:
+            self._save()
+        except Exception:
+            self._index(self._read_file())
+            raise
+        self.version += 1
+    
+    def refresh(self):
+        """Reload the catalog if another process rewrote products.json"""
+        if self._file_mtime() != self._mtime:
+            with self._lock:
+                if self._file_mtime() != self._mtime:
+                    self._load()
+    
+    # ---------------------------
+    # Read access
+    # ---------------------------
+    @property
+    def categories(self):
+        self.refresh()
+        return list(self._categories.values())
+    
+    @property
+    def subcategories(self):
+        self.refresh()
+        return list(self._subcategories.values())
+    
+    @property
+    def products(self):
+        self.refresh()
+        return list(self._products.values())
+    
+    def get_category(self, category_id):
+        self.refresh()
+        return self._categories.get(category_id)
+    
+    def get_subcategory(self, subcategory_id):
+        self.refresh()
+        return self._subcategories.get(subcategory_id)
+    
+    def get_product(self, product_id):
+        self.refresh()
+        return self._products.get(product_id)
+    
+    def subcategories_in_category(self, category_id):
+        self.refresh()
+        return [self._subcategories[sid] for sid in self._subs_by_category.get(category_id, ())]
+    
+    def products_in_category(self, category_id):
+        self.refresh()
+        return [self._products[pid] for pid in self._products_by_category.get(category_id, ())]
+    
+    # ---------------------------
+    # Mutations
+    # ---------------------------
+    def _take_id(self, kind):
+        new_id = self._next_ids[kind]
+        self._next_ids[kind] = new_id + 1
+        return new_id
+    
+    def add_category(self, name, description):
+        with self._lock:
+            self.refresh()
+            category = Category(self._take_id('categories'), name, description)
+            self._categories[category.id] = category
+            self._subs_by_category[category.id] = {}
+            self._products_by_category[category.id] = {}
+            self._commit()
+            return category
+    
+    def add_subcategory(self, name, category_id, description):
+        """Add a subcategory, returns None if the parent category does not exist"""
+        with self._lock:
+            self.refresh()
+            if category_id not in self._categories:
+                return None
+            
+            subcategory = Subcategory(self._take_id('subcategories'), name, category_id, description)
+            self._subcategories[subcategory.id] = subcategory
+            self._subs_by_category[category_id][subcategory.id] = None
+            self._products_by_subcategory[subcategory.id] = {}
+            self._commit()
+            return subcategory
+    
+    def add_product(self, name, description, price_cents, category_id, subcategory_id, features):
+        """Add a product, returns None unless the subcategory belongs to the category"""
+        with self._lock:
+            self.refresh()
+            subcategory = self._subcategories.get(subcategory_id)
+            if category_id not in self._categories or not subcategory or subcategory.category_id != category_id:
+                return None
+            
+            product = Product(
+                id=self._take_id('products'),
+                name=name,
+                description=description,
+                price_cents=price_cents,
+                category_id=category_id,
+                subcategory_id=subcategory_id,
+                features=tuple(features)
+            )
+            self._products[product.id] = product
+            self._products_by_category.setdefault(category_id, {})[product.id] = None
+            self._products_by_subcategory.setdefault(subcategory_id, {})[product.id] = None
+            self._commit()
+            return product
+    
+    def _unlink_product(self, product_id):
+        product = self._products.pop(product_id)
+        self._products_by_category.get(product.category_id, {}).pop(product_id, None)
+        self._products_by_subcategory.get(product.subcategory_id, {}).pop(product_id, None)
+        return product
+    
+    def delete_product(self, product_id):
+        """Delete a single product, returns the removed product or None"""
+        with self._lock:
+            self.refresh()
+            if product_id not in self._products:
+                return None
+            
+            product = self._unlink_product(product_id)
+            self._commit()
+            return product
+    
+    def delete_category(self, category_id):
+        """Delete a category with its subcategories and products.
+
+        Returns ``(category, deleted_subcategories, deleted_products)`` or
+        None if the category does not exist.
+        """
+        with self._lock:
+            self.refresh()
+            category = self._categories.get(category_id)
+            if not category:
+                return None
+            
+            # Cascade set straight from the reverse indexes
+            sub_ids = list(self._subs_by_category.pop(category_id, {}))
+            product_ids = dict(self._products_by_category.pop(category_id, {}))
+            for sid in sub_ids:
+                product_ids.update(self._products_by_subcategory.get(sid, {}))
+            
+            deleted_products = [self._unlink_product(pid) for pid in product_ids]
+            deleted_subcategories = []
+            for sid in sub_ids:
+                self._products_by_subcategory.pop(sid, None)
+                deleted_subcategories.append(self._subcategories.pop(sid))
+            del self._categories[category_id]
+            
+            self._commit()
+            return category, deleted_subcategories, deleted_products
+    
+    def delete_subcategory(self, subcategory_id):
+        """Delete a subcategory with its products.
+
+        Returns ``(subcategory, deleted_products)`` or None if the
+        subcategory does not exist.
+        """
+        with self._lock:
+            self.refresh()
+            subcategory = self._subcategories.get(subcategory_id)
+            if not subcategory:
+                return None
+            
+            product_ids = list(self._products_by_subcategory.pop(subcategory_id, {}))
+            deleted_products = [self._unlink_product(pid) for pid in product_ids]
+            self._subs_by_category.get(subcategory.category_id, {}).pop(subcategory_id, None)
+            del self._subcategories[subcategory_id]
+            
+            self._commit()
+            return subcategory, deleted_products
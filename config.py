@@ -13,20 +13,46 @@ CRYPTO_NETWORKS = {
         'name': 'USDT (BEP20)',
         'network': 'BSC',
         'decimals': 18,
+        'quote_decimals': 6,
         'usdt_contract': '0x55d398326f99059fF775485246999027B3197955'
     },
     'BTC': {
         'name': 'Bitcoin',
         'network': 'BTC',
-        'decimals': 8
+        'decimals': 8,
+        'quote_decimals': 8
     },
     'LTC': {
         'name': 'Litecoin',
         'network': 'LTC',
-        'decimals': 8
+        'decimals': 8,
+        'quote_decimals': 8
     }
 }
 
+# Your wallet addresses (REPLACE WITH YOUR ACTUAL ADDRESSES)
+WALLET_ADDRESSES = {
+    'USDT_BEP20': '0x515a1DA038D2813400912C88Bbd4921836041766',
+    'BTC': 'bc1q85ad38ndcd29zgz7d77y5k9hcsurqxaqurzl2g',
+    'LTC': 'ltc1q2e3z74c63j5cn2hu0wep5vdrmmf6jv9zf6m4rv'
+}
+
+# Account-level extended public keys (xpub/zpub/Ltub) for fresh per-order addresses.
+# Derived offline as <xpub>/0/i; assets without one use WALLET_ADDRESSES.
+WALLET_XPUBS = {
+    'BTC': os.getenv('BTC_XPUB'),
+    'LTC': os.getenv('LTC_XPUB'),
+    'USDT_BEP20': os.getenv('BSC_XPUB')
+}
+ADDRESS_POOL_SIZE = int(os.getenv('ADDRESS_POOL_SIZE', '20'))
+
+# Pending deposits to a static address get unique amounts: quote + 1..DEPOSIT_TAG_POOL displayed digits
+# (a deposit to a single-use HD address pays the exact quote)
+DEPOSIT_TAG_POOL = int(os.getenv('DEPOSIT_TAG_POOL', '1000'))
+PAYMENT_WATCH_INTERVAL = int(os.getenv('PAYMENT_WATCH_INTERVAL', '30'))
+# Seconds an expired deposit can still be paid: sent in time, confirmed after the 15 minutes
+PAYMENT_GRACE = int(os.getenv('PAYMENT_GRACE', '3600'))
+
 # Blockchain API Configuration
 BLOCKCHAIN_APIS = {
     'BTC': 'https://blockstream.info/api/',
@@ -34,5 +60,31 @@ BLOCKCHAIN_APIS = {
     'BSC': 'https://bsc-dataseed.binance.org/'
 }
 
+# Telegram flood limits (messages per second), kept just under the documented 30/s and 1/s per chat
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '29'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+
+# Webhook replies: one Bot API call per update (e.g. the callback answer) goes back in the webhook
+# response and the rest over a pooled aiohttp session; 0 sends every call directly
+WEBHOOK_REPLIES = os.getenv('WEBHOOK_REPLIES', '1') == '1'
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', '8'))
+
+# Conversation state: 'sqlite' (default, shared by workers on one host), 'memory' or 'redis'
+STATE_BACKEND = os.getenv('STATE_BACKEND', 'sqlite')
+STATE_DB_PATH = os.getenv('STATE_DB_PATH', 'state.db')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Request tracing: share of traces written to TRACE_FILE; traces slower than TRACE_SLOW_MS are always written
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_SLOW_MS = float(os.getenv('TRACE_SLOW_MS', '500'))
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+
+# Secret for the /debug/profiler route (X-Profiler-Token header); the route is off when unset
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN')
+
+# Prices, catalog snapshot and rendered menus shared by the workers on one host (mmap'd file);
+# empty disables it
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', 'shared_cache.bin')
+
 # Render Configuration
-RENDER_URL = os.getenv('RENDER_EXTERNAL_URL', 'http://localhost:8000')
\ No newline at end of file
+RENDER_URL = os.getenv('RENDER_EXTERNAL_URL', 'http://localhost:8000')
\ No newline at end of file
@@ -0,0 +1,183 @@
+import heapq
+import sqlite3
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from config import STATE_BACKEND, STATE_DB_PATH, REDIS_URL
+from serialization import dumps, loads
+
+
+# ---------------------------
+# Backends
+# ---------------------------
+class MemoryStateBackend:
+    """In-process backend: a dict plus a min-heap of expiry times.
+
+    Expiry pops only the entries that are actually due, so a sweep costs
+    O(k log n) for k expired keys instead of a scan over every key.
+    """
+    
+    def __init__(self):
+        self._data = {}
+        self._heap = []
+        self._lock = threading.Lock()
+    
+    def get(self, key, now):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at <= now:
+                del self._data[key]
+                return None
+            return value
+    
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            heapq.heappush(self._heap, (expires_at, key))
+    
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+    
+    def expire(self, now):
+        removed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                expires_at, key = heapq.heappop(self._heap)
+                item = self._data.get(key)
+                # Skip heap entries left behind by an overwrite or delete
+                if item is not None and item[1] == expires_at:
+                    del self._data[key]
+                    removed += 1
+        return removed
+
+
+class SQLiteStateBackend:
+    """SQLite backend shared by every worker on the host.
+
+    Rows carry their expiry time and an index on it lets a sweep delete
+    only the due rows.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS state_expires_at ON state (expires_at)")
+        conn.commit()
+    
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def get(self, key, now):
+        row = self._conn().execute(
+            "SELECT value FROM state WHERE key = ? AND expires_at > ?", (key, now)
+        ).fetchone()
+        return loads(row[0]) if row else None
+    
+    def set(self, key, value, expires_at):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, dumps(value).decode(), expires_at)
+        )
+    
+    def delete(self, key):
+        return self._conn().execute("DELETE FROM state WHERE key = ?", (key,)).rowcount > 0
+    
+    def expire(self, now):
+        return self._conn().execute("DELETE FROM state WHERE expires_at <= ?", (now,)).rowcount
+
+
+class RedisStateBackend:
+    """Backend for a Redis-compatible server; the server expires keys itself"""
+    
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("The 'redis' package is required for STATE_BACKEND=redis")
+        self.client = redis.Redis.from_url(url)
+    
+    def get(self, key, now):
+        raw = self.client.get(key)
+        return loads(raw) if raw is not None else None
+    
+    def set(self, key, value, expires_at):
+        ttl_ms = max(1, int((expires_at - time.time()) * 1000))
+        self.client.set(key, dumps(value), px=ttl_ms)
+    
+    def delete(self, key):
+        return self.client.delete(key) > 0
+    
+    def expire(self, now):
+        return 0
+
+
+def create_state_backend(kind=None):
+    """Build the backend named by STATE_BACKEND (memory, sqlite or redis)"""
+    kind = (kind or STATE_BACKEND).lower()
+    if kind == 'memory':
+        return MemoryStateBackend()
+    if kind == 'sqlite':
+        return SQLiteStateBackend(STATE_DB_PATH)
+    if kind == 'redis':
+        return RedisStateBackend(REDIS_URL)
+    raise ValueError(f"Unknown state backend: {kind}")
+
+
+# ---------------------------
+# Conversation state
+# ---------------------------
+class ConversationState:
+    """Per-user conversation state with TTL expiry.
+
+    Expired entries are never returned. Backends without native expiry are
+    swept at most once every ``sweep_interval`` seconds.
+    """
+    
+    def __init__(self, backend, namespace='conversation', default_ttl=3600, sweep_interval=60):
+        self.backend = backend
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0
+    
+    def _key(self, user_id):
+        return f"{self.namespace}:{user_id}"
+    
+    def _maybe_sweep(self, now):
+        if now >= self._next_sweep:
+            self._next_sweep = now + self.sweep_interval
+            self.backend.expire(now)
+    
+    def get(self, user_id):
+        now = time.time()
+        self._maybe_sweep(now)
+        return self.backend.get(self._key(user_id), now)
+    
+    def set(self, user_id, state, ttl=None):
+        now = time.time()
+        self._maybe_sweep(now)
+        self.backend.set(self._key(user_id), state, now + (ttl or self.default_ttl))
+    
+    def pop(self, user_id):
+        key = self._key(user_id)
+        state = self.backend.get(key, time.time())
+        self.backend.delete(key)
+        return state
@@ -1,80 +1,179 @@
-import json
-import os
+import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 
+from config import PAYMENT_GRACE
+
+from deposit_tags import DepositTagIndex
+from metrics import instrument_methods
+from models import Order, OrderColumns
+from order_log import OrderLog
+
+
+def _new_order(order_id, user_id, product_id, amount_cents, crypto_currency, crypto_amount_minor,
+               payment_address, exchange_rate_e8, status):
+    order = Order(
+        order_id=order_id,
+        user_id=user_id,
+        product_id=product_id,
+        amount_cents=amount_cents,
+        crypto_currency=crypto_currency,
+        crypto_amount_minor=crypto_amount_minor,
+        payment_address=payment_address,
+        exchange_rate_e8=exchange_rate_e8,
+        status=status,
+        created_at=datetime.now().isoformat(),
+        expires_at=(datetime.now() + timedelta(minutes=15)).isoformat()
+    )
+    if status == 'paid':
+        order.paid_at = order.created_at
+    return order
+
+
+@instrument_methods('database', 'create_order', 'create_deposit_order', 'get_order', 'update_order_status',
+                    'get_user_orders', 'find_pending_deposit', 'cleanup_expired_orders')
 class Database:
-    def __init__(self):
-        self.orders_file = 'orders.json'
-        self._init_files()
+    """Orders stored in the append-only order log (see order_log.OrderLog).
+
+    Creating an order or changing its status appends one record, so writes
+    cost the same at any history size. ``orders.json`` from before the log
+    is migrated on first use. Pending deposits are indexed in memory from
+    the log's open orders and rebuilt whenever the log changes. Expired
+    orders stay pending (matchable, and holding their tag slot) for
+    ``grace`` seconds before ``cleanup_expired_orders`` removes them.
+    """
+    
+    def __init__(self, events=None, orders_file='orders.log', legacy_file='orders.json', grace=PAYMENT_GRACE):
+        self.orders_file = orders_file
+        self.events = events
+        self.grace = grace
+        self.log = OrderLog(orders_file, legacy_path=legacy_file)
+        self._indexed = None
+        self.deposit_tags = DepositTagIndex(grace=grace)
     
-    def _init_files(self):
-        for file in [self.orders_file]:
-            if not os.path.exists(file):
-                with open(file, 'w') as f:
-                    json.dump([], f)
+    def _read_orders(self):
+        """Catch up with the log, refreshing the deposit tag index if it changed"""
+        version = self.log.version
+        if version != self._indexed:
+            self.deposit_tags.rebuild(self.log.open_orders(time.time() - self.grace))
+            self._indexed = version
     
-    def _read_json(self, filename):
-        with open(filename, 'r') as f:
-            return json.load(f)
+    @contextmanager
+    def transaction(self):
+        """Locked append session over the order log (see OrderLog.transaction)"""
+        try:
+            with self.log.transaction() as txn:
+                yield txn
+        except BaseException:
+            self._indexed = None  # forget deposit tags of orders that were never written
+            raise
     
-    def _write_json(self, filename, data):
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
+    def publish(self, event_type, order, **extra):
+        """Publish an order event (after the order has been saved)"""
+        if self.events:
+            self.events.publish(
+                event_type, order_id=order.order_id, user_id=order.user_id, product_id=order.product_id,
+                amount_cents=order.amount_cents, crypto_currency=order.crypto_currency,
+                crypto_amount_minor=order.crypto_amount_minor, status=order.status, **extra
+            )
+    
+    def add_order(self, orders, user_id, product_id, amount_cents, crypto_currency, crypto_amount_minor,
+                  payment_address, exchange_rate_e8, status='pending', single_use_address=False):
+        """Stage a new order in the ``orders`` log (caller holds the transaction)"""
+        order = _new_order(orders.take_id(), user_id, product_id, amount_cents, crypto_currency,
+                           crypto_amount_minor, payment_address, exchange_rate_e8, status)
+        order.single_use_address = single_use_address
+        orders.put(order)
+        self.deposit_tags.add(order)
+        return order
     
-    def create_order(self, user_id, product_id, amount, crypto_currency, crypto_amount, payment_address, exchange_rate):
-        orders = self._read_json(self.orders_file)
-        order_id = len(orders) + 1
+    def create_order(self, user_id, product_id, amount_cents, crypto_currency, crypto_amount_minor, payment_address, exchange_rate_e8):
+        with self.transaction() as txn:
+            order = self.add_order(txn.value, user_id, product_id, amount_cents, crypto_currency,
+                                   crypto_amount_minor, payment_address, exchange_rate_e8)
+            txn.changed = True
         
-        order = {
-            'order_id': order_id,
-            'user_id': user_id,
-            'product_id': product_id,
-            'amount': amount,
-            'crypto_currency': crypto_currency,
-            'crypto_amount': crypto_amount,
-            'payment_address': payment_address,
-            'exchange_rate': exchange_rate,
-            'status': 'pending',
-            'created_at': datetime.now().isoformat(),
-            'expires_at': (datetime.now() + timedelta(minutes=15)).isoformat()
-        }
+        self.publish('order_created', order)
+        return order
+    
+    def create_deposit_order(self, user_id, amount_cents, crypto_currency, base_minor, payment_address,
+                             exchange_rate_e8, single_use_address=False):
+        """Create a pending balance deposit with a unique tagged crypto amount.
+
+        ``single_use_address`` marks an HD address claimed for this order
+        alone (see DepositTagIndex.allocate). Returns None when every tag
+        slot above ``base_minor`` is taken.
+        """
+        with self.transaction() as txn:
+            self._read_orders()
+            crypto_amount_minor = self.deposit_tags.allocate(crypto_currency, payment_address, base_minor,
+                                                             single_use=single_use_address)
+            if crypto_amount_minor is None:
+                return None
+            
+            order = self.add_order(txn.value, user_id, None, amount_cents, crypto_currency,
+                                   crypto_amount_minor, payment_address, exchange_rate_e8,
+                                   single_use_address=single_use_address)
+            txn.changed = True
         
-        orders.append(order)
-        self._write_json(self.orders_file, orders)
+        self.publish('order_created', order)
         return order
     
+    def find_pending_deposit(self, crypto_currency, payment_address, crypto_amount_minor):
+        """Pending order expecting exactly this amount at this address, in O(1)"""
+        self._read_orders()
+        return self.deposit_tags.lookup(crypto_currency, payment_address, crypto_amount_minor)
+    
+    def pending_at_address(self, crypto_currency, payment_address):
+        self._read_orders()
+        return self.deposit_tags.at_address(crypto_currency, payment_address)
+    
+    def pending_addresses(self, crypto_currency=None):
+        """``(crypto_currency, address)`` pairs with pending orders"""
+        self._read_orders()
+        return self.deposit_tags.addresses(crypto_currency)
+    
     def get_order(self, order_id):
-        orders = self._read_json(self.orders_file)
-        for order in orders:
-            if order['order_id'] == order_id:
-                return order
-        return None
+        return self.log.get(order_id)
     
     def update_order_status(self, order_id, status):
-        orders = self._read_json(self.orders_file)
-        for order in orders:
-            if order['order_id'] == order_id:
-                order['status'] = status
-                if status == 'paid':
-                    order['paid_at'] = datetime.now().isoformat()
-                self._write_json(self.orders_file, orders)
-                return True
-        return False
+        with self.transaction() as txn:
+            order = txn.value.get(order_id)
+            if not order:
+                return False
+            
+            order.status = status
+            if status == 'paid':
+                order.paid_at = datetime.now().isoformat()
+            txn.value.put(order)
+            txn.changed = True
+        
+        if status == 'paid':
+            self.publish('order_paid', order)
+        elif status == 'expired':
+            self.publish('order_expired', order)
+        return True
     
     def get_user_orders(self, user_id):
-        orders = self._read_json(self.orders_file)
-        return [order for order in orders if order['user_id'] == user_id]
+        return self.log.user_orders(user_id)
+    
+    def columns(self):
+        """Columnar snapshot of all orders for reports and bulk scans"""
+        return OrderColumns(self.log.orders())
     
     def cleanup_expired_orders(self):
-        """Remove orders that have expired"""
-        orders = self._read_json(self.orders_file)
-        current_time = datetime.now()
-        valid_orders = []
-        
-        for order in orders:
-            expires_at = datetime.fromisoformat(order['expires_at'])
-            if expires_at > current_time or order['status'] in ['paid', 'cancelled']:
-                valid_orders.append(order)
+        """Remove orders that expired more than ``grace`` seconds ago; returns the removed orders"""
+        with self.transaction() as txn:
+            expired_ids = txn.value.expired_ids(time.time() - self.grace)
+            removed = [txn.value.get(order_id) for order_id in expired_ids]
+            if not removed:
+                return []
+            
+            for order in removed:
+                txn.value.remove(order.order_id)
+            txn.changed = True
         
-        self._write_json(self.orders_file, valid_orders)
-        return len(orders) - len(valid_orders)
\ No newline at end of file
+        for order in removed:
+            order.status = 'expired'
+            self.publish('order_expired', order)
+        return removed
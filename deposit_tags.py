@@ -0,0 +1,102 @@
+from datetime import datetime
+
+from config import DEPOSIT_TAG_POOL
+from money import decimals_for, QUOTE_DECIMALS
+
+
+def _timestamp(iso):
+    return datetime.fromisoformat(iso).timestamp() if iso else 0.0
+
+
+def tag_quantum(asset):
+    """Smallest step a deposit amount is tagged by: one displayed digit"""
+    return 10 ** (decimals_for(asset) - QUOTE_DECIMALS.get(asset, decimals_for(asset)))
+
+
+class DepositTagIndex:
+    """Unique amounts for pending crypto orders sharing a payment address.
+
+    Each pending order owns one ``(asset, address, amount)`` slot: its
+    quoted amount plus the smallest free offset of 1..``pool_size`` quanta
+    (one displayed digit each), so an incoming transfer identifies its
+    order with a single dict lookup. Slot 0, the exact quote, is only
+    given to an order with a single-use HD address of its own: on a
+    static wallet address the untagged amount is what a payer who
+    ignores the tag sends, so it must not pick out one order, even while
+    that order is the only one there. Slots of paid, cancelled or
+    expired orders are free again; an expired order keeps its slot (and
+    can still be matched) for ``grace`` seconds, for payments confirmed
+    after the expiry. Orders are also indexed by address for the payment
+    watcher.
+    """
+    
+    def __init__(self, pool_size=DEPOSIT_TAG_POOL, grace=0):
+        self.pool_size = pool_size
+        self.grace = grace
+        self._by_amount = {}   # (asset, address, amount_minor) -> (order, expires_ts)
+        self._by_address = {}  # (asset, address) -> {order_id: order}
+    
+    def rebuild(self, orders):
+        self._by_amount = {}
+        self._by_address = {}
+        for order in orders:
+            self.add(order)
+    
+    def add(self, order):
+        if order.status == 'pending' and order.crypto_currency != 'USD':
+            key = (order.crypto_currency, order.payment_address, order.crypto_amount_minor)
+            self._by_amount[key] = (order, _timestamp(order.expires_at))
+            self._by_address.setdefault(key[:2], {})[order.order_id] = order
+    
+    def discard(self, order):
+        key = (order.crypto_currency, order.payment_address, order.crypto_amount_minor)
+        item = self._by_amount.get(key)
+        if item and item[0] is order:
+            del self._by_amount[key]
+        at_address = self._by_address.get(key[:2])
+        if at_address and at_address.get(order.order_id) is order:
+            del at_address[order.order_id]
+            if not at_address:
+                del self._by_address[key[:2]]
+    
+    def _live(self, key, now):
+        item = self._by_amount.get(key)
+        if item is None:
+            return None
+        order, expires_ts = item
+        if order.status != 'pending' or expires_ts + self.grace <= now:
+            self.discard(order)  # reclaim the slot
+            return None
+        return order
+    
+    def lookup(self, asset, address, amount_minor, now=None):
+        """Pending order (unexpired or within grace) expecting exactly ``amount_minor`` at ``address``, or None"""
+        now = datetime.now().timestamp() if now is None else now
+        return self._live((asset, address, amount_minor), now)
+    
+    def at_address(self, asset, address, now=None):
+        """Pending orders (unexpired or within grace) paying to ``address``"""
+        now = datetime.now().timestamp() if now is None else now
+        orders = list(self._by_address.get((asset, address), {}).values())
+        return [order for order in orders
+                if self._live((asset, address, order.crypto_amount_minor), now) is order]
+    
+    def allocate(self, asset, address, base_minor, single_use=False, now=None):
+        """Smallest free tagged amount from ``base_minor`` up, or None if the pool is exhausted.
+
+        ``single_use`` says the address was claimed for this order alone,
+        which is the only case the exact quote is handed out.
+        """
+        now = datetime.now().timestamp() if now is None else now
+        quantum = tag_quantum(asset)
+        if single_use and not self.at_address(asset, address, now):
+            return base_minor
+        for slot in range(1, self.pool_size + 1):
+            amount_minor = base_minor + slot * quantum
+            if self._live((asset, address, amount_minor), now) is None:
+                return amount_minor
+        return None
+    
+    def addresses(self, asset=None):
+        """``(asset, address)`` pairs with pending orders"""
+        return [key for key in self._by_address if asset is None or key[0] == asset]
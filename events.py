@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+from serialization import dumps, loads
+from storage import append_durable, file_lock
+
+EVENT_TYPES = ('order_created', 'order_paid', 'order_expired', 'balance_credited')
+
+
+class EventQueue:
+    """Durable append-only event log shared by all workers.
+
+    Events are JSON lines in ``events.jsonl``. Consumers track their own
+    byte offset into the file, so an event published by any worker is seen
+    by every consumer, and nothing is lost across restarts.
+    """
+    
+    def __init__(self, events_file='events.jsonl'):
+        self.events_file = events_file
+        self._wake = threading.Condition()
+        if not os.path.exists(self.events_file):
+            open(self.events_file, 'a').close()
+    
+    def publish(self, event_type, **data):
+        """Append an event and wake local consumers"""
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Unknown event type: {event_type}")
+        
+        event = {'type': event_type, 'ts': time.time()}
+        event.update(data)
+        line = dumps(event) + b'\n'
+        with file_lock(self.events_file):
+            append_durable(self.events_file, line)
+        
+        with self._wake:
+            self._wake.notify_all()
+        return event
+    
+    def read(self, offset, limit=100):
+        """Up to ``limit`` complete events after ``offset``; returns ``(events, new_offset)``"""
+        events = []
+        with open(self.events_file, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n') or len(events) >= limit:
+                    break  # partially written line, picked up next time
+                offset += len(line)
+                if line.strip():
+                    events.append(loads(line))
+        return events, offset
+    
+    def size(self):
+        return os.path.getsize(self.events_file)
+    
+    def wait(self, timeout):
+        """Sleep until a local publish or ``timeout`` seconds pass"""
+        with self._wake:
+            self._wake.wait(timeout)
+
+
+class EventConsumer:
+    """Named consumer applying ``handler(event)`` to every event once.
+
+    The offset is kept in ``<events_file>.<name>.offset`` and saved after
+    each batch. Every worker may run the same consumer; a non-blocking
+    lock lets only one of them handle a given batch. Delivery is at least
+    once: a crash mid-batch repeats that batch.
+    """
+    
+    def __init__(self, queue, name, handler, batch_size=100, poll_interval=1.0):
+        self.queue = queue
+        self.name = name
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.offset_file = f"{queue.events_file}.{name}.offset"
+        self._thread = None
+    
+    def _load_offset(self):
+        try:
+            with open(self.offset_file, 'r') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            # New consumers start at the end instead of replaying history
+            return self.queue.size()
+    
+    def _save_offset(self, offset):
+        tmp_path = f"{self.offset_file}.tmp.{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.offset_file)
+    
+    def poll(self):
+        """Handle pending events; returns how many were handled"""
+        try:
+            with file_lock(self.offset_file, blocking=False):
+                if not os.path.exists(self.offset_file):
+                    self._save_offset(self._load_offset())
+                offset = self._load_offset()
+                if offset == self.queue.size():
+                    return 0
+                
+                handled = 0
+                while True:
+                    events, offset = self.queue.read(offset, self.batch_size)
+                    if not events:
+                        break
+                    for event in events:
+                        try:
+                            self.handler(event)
+                        except Exception as e:
+                            print(f"❌ Event consumer {self.name} failed on {event['type']}: {e}")
+                    self._save_offset(offset)
+                    handled += len(events)
+                return handled
+        except BlockingIOError:
+            return 0  # another worker is consuming
+    
+    def lag(self):
+        """Bytes of the event log this consumer has not handled yet"""
+        return max(0, self.queue.size() - self._load_offset())
+    
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Event consumer {self.name} error: {e}")
+            self.queue.wait(self.poll_interval)
+    
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'events-{self.name}', daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,280 @@
+import bisect
+import hashlib
+import hmac
+import threading
+
+from storage import CachedJsonFile, file_lock
+
+# ---------------------------
+# secp256k1
+# ---------------------------
+P = 2 ** 256 - 2 ** 32 - 977
+N = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFEBAAEDCE6AF48A03BBFD25E8CD0364141
+G = (0x79BE667EF9DCBBAC55A06295CE870B07029BFCDB2DCE28D959F2815B16F81798,
+     0x483ADA7726A3C4655DA4FBFC0E1108A8FD17B448A68554199C47D08FFB10D4B8)
+
+
+def _point_add(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a[0] == b[0] and (a[1] + b[1]) % P == 0:
+        return None
+    if a == b:
+        slope = 3 * a[0] * a[0] * pow(2 * a[1], P - 2, P) % P
+    else:
+        slope = (b[1] - a[1]) * pow(b[0] - a[0], P - 2, P) % P
+    x = (slope * slope - a[0] - b[0]) % P
+    return x, (slope * (a[0] - x) - a[1]) % P
+
+
+def _point_mul(k, point=G):
+    result = None
+    while k:
+        if k & 1:
+            result = _point_add(result, point)
+        point = _point_add(point, point)
+        k >>= 1
+    return result
+
+
+def _compress(point):
+    return bytes([2 + (point[1] & 1)]) + point[0].to_bytes(32, 'big')
+
+
+def _decompress(key):
+    x = int.from_bytes(key[1:], 'big')
+    y = pow((x * x * x + 7) % P, (P + 1) // 4, P)
+    if (y & 1) != (key[0] & 1):
+        y = P - y
+    return x, y
+
+
+# ---------------------------
+# Encodings
+# ---------------------------
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+BECH32_CHARSET = 'qpzry9x8gf2tvdw0s3jn54khce6mua7l'
+
+
+def base58check_decode(text):
+    number = 0
+    for char in text:
+        number = number * 58 + BASE58_ALPHABET.index(char)
+    raw = number.to_bytes((number.bit_length() + 7) // 8, 'big')
+    raw = b'\0' * (len(text) - len(text.lstrip('1'))) + raw
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError("Bad base58 checksum")
+    return payload
+
+
+def _bech32_polymod(values):
+    generator = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+    checksum = 1
+    for value in values:
+        top = checksum >> 25
+        checksum = (checksum & 0x1ffffff) << 5 ^ value
+        for i in range(5):
+            checksum ^= generator[i] if (top >> i) & 1 else 0
+    return checksum
+
+
+def segwit_address(hrp, witness_version, program):
+    """Bech32 (BIP173) address for a version 0 witness program"""
+    data = [witness_version]
+    acc = bits = 0
+    for byte in program:
+        acc = (acc << 8) | byte
+        bits += 8
+        while bits >= 5:
+            bits -= 5
+            data.append((acc >> bits) & 31)
+    if bits:
+        data.append((acc << (5 - bits)) & 31)
+    hrp_expanded = [ord(c) >> 5 for c in hrp] + [0] + [ord(c) & 31 for c in hrp]
+    polymod = _bech32_polymod(hrp_expanded + data + [0] * 6) ^ 1
+    data += [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + '1' + ''.join(BECH32_CHARSET[d] for d in data)
+
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+
+def p2wpkh_address(point, hrp):
+    return segwit_address(hrp, 0, hash160(_compress(point)))
+
+
+def evm_address(point):
+    """EIP-55 checksummed address of a public key (keccak from web3's eth_utils)"""
+    from eth_utils import keccak, to_checksum_address
+    raw = point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big')
+    return to_checksum_address(keccak(raw)[-20:])
+
+
+# ---------------------------
+# BIP32 public derivation
+# ---------------------------
+class ExtendedPublicKey:
+    """Account-level extended public key (xpub/zpub/Ltub...); derives non-hardened children"""
+    
+    def __init__(self, point, chain_code):
+        self.point = point
+        self.chain_code = chain_code
+    
+    @classmethod
+    def parse(cls, text):
+        payload = base58check_decode(text.strip())
+        if len(payload) != 78 or payload[45] not in (2, 3):
+            raise ValueError("Not an extended public key")
+        # The 4 version bytes only say which network/script it was exported for
+        return cls(_decompress(payload[45:78]), payload[13:45])
+    
+    def child(self, index):
+        if index >= 2 ** 31:
+            raise ValueError("Hardened derivation needs the private key")
+        digest = hmac.new(self.chain_code, _compress(self.point) + index.to_bytes(4, 'big'), hashlib.sha512).digest()
+        tweak = int.from_bytes(digest[:32], 'big')
+        if tweak >= N:
+            raise ValueError(f"Invalid child {index}, skip it")
+        return ExtendedPublicKey(_point_add(_point_mul(tweak), self.point), digest[32:])
+
+
+ADDRESS_FORMATS = {
+    'BTC': lambda point: p2wpkh_address(point, 'bc'),
+    'LTC': lambda point: p2wpkh_address(point, 'ltc'),
+    'USDT_BEP20': evm_address
+}
+
+
+class AddressDeriver:
+    """Receive addresses ``<xpub>/0/i`` for one asset"""
+    
+    def __init__(self, crypto_currency, xpub):
+        self.crypto_currency = crypto_currency
+        self.format = ADDRESS_FORMATS[crypto_currency]
+        self.receive = ExtendedPublicKey.parse(xpub).child(0)
+    
+    def address(self, index):
+        return self.format(self.receive.child(index).point)
+
+
+# ---------------------------
+# Address pool
+# ---------------------------
+class AddressPool:
+    """Pre-derived fresh receive addresses, shared by all workers.
+
+    ``addresses.json`` keeps per asset the next unused derivation index,
+    a list of derived but unclaimed addresses (lowest index first) and the
+    index of every claimed address. A background thread tops the list up
+    to ``pool_size``, so ``claim()`` is a pop under a file lock and never
+    waits for derivation. ``release()`` returns the address of an order
+    that expired unpaid, so abandoned deposits do not leave a run of
+    unused indexes: wallet software restored from the xpub stops scanning
+    after 20 unused addresses in a row (the BIP44 gap limit). Keep
+    ``pool_size`` within that limit too. A released address is remembered
+    as such: the original payer may still send to it, so the next order
+    there is not single-use (it gets a tagged amount, matched exactly).
+    """
+    
+    def __init__(self, xpubs, pool_file='addresses.json', pool_size=20, refill_interval=5):
+        self.derivers = {asset: AddressDeriver(asset, xpub) for asset, xpub in xpubs.items() if xpub}
+        self.pool_size = pool_size
+        self.refill_interval = refill_interval
+        self._store = CachedJsonFile(pool_file, dict, dict, dict)
+        self._wake = threading.Event()
+        self._thread = None
+    
+    def supports(self, crypto_currency):
+        return crypto_currency in self.derivers
+    
+    def free_count(self, crypto_currency):
+        return len(self._store.load().get(crypto_currency, {}).get('free', ()))
+    
+    def claim(self, crypto_currency):
+        """Take a fresh address, or None if the asset has no xpub or the pool is empty"""
+        if crypto_currency not in self.derivers:
+            return None
+        with self._store.transaction() as txn:
+            state = txn.value.get(crypto_currency, {})
+            free = state.get('free')
+            if not free:
+                address = None
+            else:
+                index, address = free.pop(0)
+                state.setdefault('claimed', {})[address] = index
+                txn.changed = True
+        self._wake.set()
+        return address
+    
+    def single_use(self, crypto_currency, address):
+        """True if ``address`` was claimed from the pool and never given to an earlier order"""
+        state = self._store.load().get(crypto_currency, {})
+        return address in state.get('claimed', {}) and address not in state.get('released', {})
+    
+    def release(self, crypto_currency, address):
+        """Put a claimed address that was never paid back in the pool; False if it is not ours"""
+        if crypto_currency not in self.derivers:
+            return False
+        with self._store.transaction() as txn:
+            state = txn.value.get(crypto_currency, {})
+            index = state.get('claimed', {}).pop(address, None)
+            if index is None:
+                return False
+            # Lowest index first, so the next claim reuses it
+            bisect.insort(state['free'], [index, address])
+            state.setdefault('released', {})[address] = index
+            txn.changed = True
+        return True
+    
+    def refill(self):
+        """Derive addresses until every pool is full; returns how many were added"""
+        try:
+            with file_lock(self._store.path + '.refill', blocking=False):
+                return self._refill()
+        except BlockingIOError:
+            return 0  # another worker is refilling
+    
+    def _refill(self):
+        added = 0
+        for crypto_currency, deriver in self.derivers.items():
+            with self._store.transaction() as txn:
+                state = txn.value.setdefault(crypto_currency, {'next_index': 0, 'free': []})
+                missing = self.pool_size - len(state['free'])
+                if missing <= 0:
+                    continue
+                start = state['next_index']
+                state['next_index'] = start + missing
+                txn.changed = True
+            
+            # Derive outside the lock; the indexes are already reserved
+            derived = []
+            for index in range(start, start + missing):
+                try:
+                    derived.append([index, deriver.address(index)])
+                except ValueError:
+                    continue  # invalid child (probability ~2^-127)
+            
+            with self._store.transaction() as txn:
+                txn.value[crypto_currency]['free'].extend(derived)
+                txn.changed = True
+            added += len(derived)
+        return added
+    
+    def _run(self):
+        while True:
+            try:
+                self.refill()
+            except Exception as e:
+                print(f"❌ Address pool refill failed: {e}")
+            self._wake.wait(self.refill_interval)
+            self._wake.clear()
+    
+    def start(self):
+        if self._thread is None and self.derivers:
+            self._thread = threading.Thread(target=self._run, name='address-pool', daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,148 @@
+import importlib
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LazyModule:
+    """Module imported on first attribute access.
+
+    ``web3 = lazy_import('web3')`` costs nothing at startup; the first
+    ``web3.Web3`` imports it (Python's import lock makes that safe from
+    several threads) and later accesses go straight to the module.
+    """
+    
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+    
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = self.__dict__['_module'] = importlib.import_module(self.__dict__['_name'])
+        return module
+    
+    @property
+    def loaded(self):
+        return self.__dict__['_module'] is not None
+    
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+    
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+class StartupTimer:
+    """Wall time of each startup phase, for the startup report"""
+    
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []
+        self.ready_after = None
+    
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+    
+    def ready(self):
+        """Mark the end of startup (the app can take requests)"""
+        self.ready_after = time.perf_counter() - self.started
+    
+    def report(self):
+        return {
+            'ready_after_s': round(self.ready_after, 3) if self.ready_after is not None else None,
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases}
+        }
+    
+    def summary(self):
+        phases = ', '.join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in self.phases)
+        total = f"{self.ready_after:.2f}s" if self.ready_after is not None else "not ready"
+        return f"🚀 Startup {total}: {phases}"
+
+
+class WarmUp:
+    """Startup work deferred to a background thread.
+
+    Tasks run in the order they were added, after an optional ``delay``,
+    so the worker can answer its first requests before caches are warm and
+    background services run. Components touched by a request before their
+    task has run initialise themselves on first use anyway. Each task's
+    duration and error are kept in ``results``.
+
+    ``ready`` is set once every required task has succeeded, ``done`` once
+    all tasks have run. In the background thread, failed required tasks
+    are retried every ``retry_interval`` seconds until they succeed.
+    """
+    
+    def __init__(self, delay=0.0, retry_interval=30.0):
+        self.delay = delay
+        self.retry_interval = retry_interval
+        self.tasks = []
+        self.results = {}
+        self.ready = threading.Event()
+        self.done = threading.Event()
+        self._thread = None
+    
+    def add(self, name, func, required=True):
+        self.tasks.append((name, func, required))
+    
+    def pending(self, required_only=False):
+        return [name for name, _, required in self.tasks
+                if name not in self.results and (required or not required_only)]
+    
+    def failed(self, required_only=False):
+        return [name for name, _, required in self.tasks
+                if (self.results.get(name) or {}).get('error') and (required or not required_only)]
+    
+    def _run_task(self, name, func):
+        started = time.perf_counter()
+        try:
+            func()
+            error = None
+        except Exception as e:
+            error = str(e)
+            print(f"❌ Warm-up task {name} failed: {e}")
+        self.results[name] = {'seconds': round(time.perf_counter() - started, 3), 'error': error}
+    
+    def _check_ready(self):
+        if not self.pending(required_only=True) and not self.failed(required_only=True):
+            self.ready.set()
+    
+    def run(self):
+        for name, func, _ in self.tasks:
+            self._run_task(name, func)
+            self._check_ready()
+        self.done.set()
+    
+    def retry_failed(self):
+        """Run the failed required tasks again; True once none are left"""
+        for name, func, required in self.tasks:
+            if required and name in self.failed():
+                self._run_task(name, func)
+        self._check_ready()
+        return self.ready.is_set()
+    
+    def _run(self):
+        if self.delay:
+            time.sleep(self.delay)
+        self.run()
+        while not self.ready.is_set():
+            time.sleep(self.retry_interval)
+            if self.retry_failed():
+                print("✅ Warm-up retried failed tasks; worker is ready")
+    
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+
+from serialization import dumps, loads
+from storage import append_durable, file_lock
+
+
+class Ledger:
+    """Append-only per-user transaction ledger.
+
+    Every balance change is one JSON line in ``ledger.jsonl``. Each worker
+    keeps a running balance per user and tails the file from the last
+    offset it has seen, so reads are O(1) plus whatever other workers
+    appended since.
+    """
+    
+    KINDS = ('opening', 'deposit', 'purchase', 'refund', 'adjustment')
+    
+    def __init__(self, ledger_file='ledger.jsonl'):
+        self.ledger_file = ledger_file
+        self._lock = threading.RLock()
+        self._reset()
+        if not os.path.exists(self.ledger_file):
+            open(self.ledger_file, 'a').close()
+        # Entries are replayed on first use (see catch_up), not at startup
+    
+    def _reset(self):
+        self._balances = {}
+        self._keys = {}
+        self._offset = 0
+        self._seq = 0
+    
+    def _apply(self, entry):
+        user_id = entry['user_id']
+        self._balances[user_id] = self._balances.get(user_id, 0) + entry['amount_cents']
+        if entry.get('key'):
+            self._keys[entry['key']] = entry
+        self._seq = max(self._seq, entry['seq'])
+    
+    def catch_up(self):
+        """Replay the ledger now instead of on first use (startup warm-up)"""
+        self._catch_up()
+    
+    def _catch_up(self):
+        """Apply entries appended since the last read (possibly by other workers)"""
+        with self._lock:
+            if os.path.getsize(self.ledger_file) == self._offset:
+                return
+            with open(self.ledger_file, 'rb') as f:
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break  # partially written line, picked up next time
+                    self._offset += len(line)
+                    if line.strip():
+                        self._apply(loads(line))
+    
+    def record(self, user_id, kind, amount_cents, key=None, ref=None):
+        """Append an entry and return it.
+
+        ``amount_cents`` is signed (purchases are negative). If ``key`` was
+        already recorded, the existing entry is returned and nothing is
+        written, so retried deposits and purchases are applied once.
+        """
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown ledger entry kind: {kind}")
+        
+        with self._lock, file_lock(self.ledger_file):
+            self._catch_up()
+            if key and key in self._keys:
+                return self._keys[key]
+            
+            entry = {
+                'seq': self._seq + 1,
+                'user_id': user_id,
+                'kind': kind,
+                'amount_cents': amount_cents,
+                'key': key,
+                'ref': ref,
+                'ts': time.time()
+            }
+            line = dumps(entry) + b'\n'
+            append_durable(self.ledger_file, line)
+            self._offset += len(line)
+            self._apply(entry)
+            return entry
+    
+    def has_key(self, key):
+        self._catch_up()
+        return key in self._keys
+    
+    def entry(self, key):
+        """The entry recorded under an idempotency key, or None"""
+        self._catch_up()
+        return self._keys.get(key)
+    
+    def balance(self, user_id):
+        """Running balance of a user in cents"""
+        self._catch_up()
+        return self._balances.get(user_id, 0)
+    
+    def is_empty(self):
+        return os.path.getsize(self.ledger_file) == 0
+    
+    def seed_opening_balances(self, users):
+        """Record current balances as 'opening' entries when the ledger is new"""
+        with self._lock, file_lock(self.ledger_file):
+            if not self.is_empty():
+                return 0
+        count = 0
+        for user in users:
+            if user.balance_cents:
+                self.record(user.user_id, 'opening', user.balance_cents, key=f"opening:{user.user_id}")
+                count += 1
+        return count
+    
+    def entries(self, user_id=None):
+        """Stream entries from disk, optionally for a single user"""
+        with open(self.ledger_file, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n') or not line.strip():
+                    continue
+                entry = loads(line)
+                if user_id is None or entry['user_id'] == user_id:
+                    yield entry
+    
+    def reconcile(self, users=None):
+        """Rebuild every balance from the ledger in one streaming pass.
+
+        Replaces the cached balances and, if ``users`` (user records) is
+        given, returns ``[(user_id, ledger_cents, snapshot_cents), ...]`` for
+        users whose stored balance disagrees with the ledger.
+        """
+        with self._lock:
+            self._reset()
+            self._catch_up()
+        
+        if users is None:
+            return []
+        
+        mismatches = []
+        seen = set()
+        for user in users:
+            seen.add(user.user_id)
+            ledger_cents = self._balances.get(user.user_id, 0)
+            if ledger_cents != user.balance_cents:
+                mismatches.append((user.user_id, ledger_cents, user.balance_cents))
+        for user_id, ledger_cents in self._balances.items():
+            if user_id not in seen and ledger_cents:
+                mismatches.append((user_id, ledger_cents, None))
+        return mismatches
@@ -0,0 +1,171 @@
+import threading
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+MAIN_MENU_BUTTON = [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+
+
+# ---------------------------
+# Catalog pages
+# ---------------------------
+def render_services(catalog):
+    """Category list as (text, markup), or None when there are no categories"""
+    categories = catalog.categories
+    if not categories:
+        return None
+    
+    services_text = "🛍️ **Available Categories**\n\n"
+    
+    keyboard = []
+    for category in categories:
+        services_text += f"📂 **{category.name}**\n"
+        services_text += f"   {category.description}\n\n"
+        keyboard.append([InlineKeyboardButton(category.name, callback_data=f"category_{category.id}")])
+    
+    keyboard.append(MAIN_MENU_BUTTON)
+    return services_text, InlineKeyboardMarkup(keyboard)
+
+
+def render_category(catalog, category_id):
+    """Products of a category as (text, markup), or None if it is missing or empty"""
+    category_products = catalog.products_in_category(category_id)
+    category = catalog.get_category(category_id)
+    
+    if not category_products or not category:
+        return None
+    
+    products_text = f"📂 **{category.name}**\n\n"
+    products_text += f"{category.description}\n\n"
+    
+    keyboard = []
+    for product in category_products:
+        products_text += f"🆔 {product.id}: **{product.name}**\n"
+        products_text += f"   💰 ${product.price:.2f}\n"
+        products_text += f"   📝 {product.description}\n\n"
+        keyboard.append([InlineKeyboardButton(
+            f"{product.name} - ${product.price:.2f}",
+            callback_data=f"product_{product.id}"
+        )])
+    
+    keyboard.append([InlineKeyboardButton("🔙 Back to Categories", callback_data="services")])
+    keyboard.append(MAIN_MENU_BUTTON)
+    return products_text, InlineKeyboardMarkup(keyboard)
+
+
+def render_product(catalog, product_id):
+    """Product details as (text, markup), or None if the product is missing"""
+    product = catalog.get_product(product_id)
+    if not product:
+        return None
+    
+    category = catalog.get_category(product.category_id)
+    subcategory = catalog.get_subcategory(product.subcategory_id)
+    
+    product_text = f"""
+📦 **{product.name}**
+
+💰 **Price:** ${product.price:.2f}
+📂 **Category:** {category.name if category else 'Unknown'}
+📁 **Subcategory:** {subcategory.name if subcategory else 'Unknown'}
+
+📝 **Description:**
+{product.description}
+
+⭐ **Features:**
+"""
+    for feature in product.features:
+        product_text += f"• {feature}\n"
+    
+    keyboard = [
+        [InlineKeyboardButton("🛒 Buy Now", callback_data=f"buy_{product.id}")],
+        [InlineKeyboardButton("🔙 Back to Category", callback_data=f"category_{product.category_id}")],
+        MAIN_MENU_BUTTON
+    ]
+    return product_text, InlineKeyboardMarkup(keyboard)
+
+
+class MenuCache:
+    """Catalog pages rendered once per catalog version.
+
+    Browsing clicks reuse the rendered text and keyboard instead of
+    rebuilding them; any catalog change (here or in another worker, seen
+    through ``catalog.version``) drops every page. ``render_all()``
+    pre-renders all pages during warm-up.
+
+    With a ``shared_cache`` one worker renders the pages of a catalog
+    revision and publishes them ('menus' slot); the other workers decode
+    them from there instead of rendering.
+    """
+    
+    def __init__(self, catalog, shared_cache=None):
+        self.catalog = catalog
+        self.shared_cache = shared_cache
+        self._version = None
+        self._pages = {}
+        self._lock = threading.Lock()
+    
+    def _page(self, key, render):
+        self.catalog.refresh()
+        changed = False
+        if self._version != self.catalog.version:
+            with self._lock:
+                if self._version != self.catalog.version:
+                    # Warm-up renders the first version; later ones are re-rendered and shared here
+                    changed = self._version is not None
+                    self._pages = {}
+                    self._version = self.catalog.version
+        if changed and self.shared_cache:
+            self.render_all()
+        
+        pages = self._pages
+        page = pages.get(key)
+        if page is None:
+            page = self._shared_page(key)
+            if page is None:
+                page = render()
+            if page is not None:
+                pages[key] = page  # missing ids are not cached, so the cache stays bounded
+        return page
+    
+    def _shared_page(self, key):
+        if not self.shared_cache:
+            return None
+        menus = self.shared_cache.get('menus')
+        if not menus or menus['revision'] != self.catalog.revision or key not in menus['pages']:
+            return None
+        text, markup = menus['pages'][key]
+        return text, InlineKeyboardMarkup.de_json(markup, None)
+    
+    def services(self):
+        return self._page('services', lambda: render_services(self.catalog))
+    
+    def category(self, category_id):
+        return self._page(f'category_{category_id}', lambda: render_category(self.catalog, category_id))
+    
+    def product(self, product_id):
+        return self._page(f'product_{product_id}', lambda: render_product(self.catalog, product_id))
+    
+    def render_all(self):
+        """Render every page now and publish them; returns the number of pages"""
+        self.services()
+        for category in self.catalog.categories:
+            self.category(category.id)
+        for product in self.catalog.products:
+            self.product(product.id)
+        self.publish()
+        return len(self._pages)
+    
+    def publish(self):
+        """Share this worker's pages unless the current revision is already shared or being shared"""
+        if not self.shared_cache:
+            return
+        revision = self.catalog.revision
+        try:
+            with self.shared_cache.refresh_lock('menus', blocking=False):
+                menus = self.shared_cache.get('menus')
+                if menus and menus['revision'] == revision:
+                    return
+                pages = {key: [text, markup.to_dict()] for key, (text, markup) in self._pages.items()}
+                self.shared_cache.set('menus', {'revision': revision, 'pages': pages})
+        except BlockingIOError:
+            pass
@@ -0,0 +1,242 @@
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+from tracing import span
+
+# Latency buckets in seconds, from 0.5 ms to 10 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+    
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+    
+    def snapshot(self):
+        """``{label values: value}`` for every series"""
+        with self._lock:
+            return dict(self._values)
+    
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Metric):
+    """Gauge set directly, or read from a callback at scrape time (free on the hot path)"""
+    
+    kind = 'gauge'
+    
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._functions = {}
+    
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+    
+    def set_function(self, function, **labels):
+        self._functions[self._key(labels)] = function
+    
+    def render(self):
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            try:
+                values[key] = function()
+            except Exception:
+                continue
+        lines = self.header()
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., +Inf count, sum]
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+    
+    def count(self, **labels):
+        series = self._series.get(self._key(labels))
+        return sum(series[:-1]) if series else 0
+    
+    def snapshot(self):
+        """``{label values: (count, sum)}`` for every series"""
+        with self._lock:
+            return {key: (sum(series[:-1]), series[-1]) for key, series in self._series.items()}
+    
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = self.header()
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (('le', _format_value(float(bound))),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Metrics of this process; each gunicorn worker serves its own"""
+    
+    def __init__(self):
+        self._metrics = {}
+    
+    def register(self, metric):
+        self._metrics.setdefault(metric.name, metric)
+        return self._metrics[metric.name]
+    
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ---------------------------
+# Metric families
+# ---------------------------
+HTTP_SECONDS = histogram('http_request_seconds', 'Flask request handling time', ('endpoint', 'status'))
+UPDATE_SECONDS = histogram('bot_update_seconds', 'Webhook update handling time per bot route', ('route',))
+UPDATE_ERRORS = counter('bot_update_errors_total', 'Updates that raised while being handled', ('route',))
+UPDATE_DECODES = counter('bot_update_decodes_total', 'Webhook updates and lazy messages by how they were decoded', ('path',))
+CALL_SECONDS = histogram('call_seconds', 'Time spent in instrumented methods', ('component', 'method'))
+CALL_ERRORS = counter('call_errors_total', 'Instrumented methods that raised or reported failure', ('component', 'method'))
+STORAGE_SECONDS = histogram('storage_seconds', 'Storage read/write latency', ('file', 'op'))
+STORAGE_BYTES = counter('storage_bytes_total', 'Bytes read from or written to storage', ('file', 'op'))
+CACHE_REQUESTS = counter('cache_requests_total', 'Cache lookups by result (hit or miss)', ('cache', 'result'))
+TELEGRAM_CALLS = counter('telegram_calls_total', 'Bot API calls sent as a webhook reply or pipelined', ('method', 'path'))
+QUEUE_DEPTH = gauge('queue_depth', 'Items waiting in internal queues', ('queue',))
+EVENT_LAG = gauge('event_consumer_lag_bytes', 'Unconsumed bytes of the event log per consumer', ('consumer',))
+
+
+# ---------------------------
+# Instrumentation helpers
+# ---------------------------
+def instrumented(component, name=None, none_is_error=False):
+    """Decorator timing a function into ``call_seconds``.
+
+    Exceptions (and, with ``none_is_error``, a None result) count in
+    ``call_errors_total``. Overhead is two clock reads and a bucket bisect.
+    Inside a traced update the call is also a ``component.method`` span.
+    """
+    def decorator(func):
+        method = name or func.__name__
+        span_name = f"{component}.{method}"
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                with span(span_name):
+                    result = func(*args, **kwargs)
+            except Exception:
+                CALL_ERRORS.inc(component=component, method=method)
+                raise
+            finally:
+                CALL_SECONDS.observe(time.perf_counter() - started, component=component, method=method)
+            if none_is_error and result is None:
+                CALL_ERRORS.inc(component=component, method=method)
+            return result
+        return wrapper
+    return decorator
+
+
+def instrument_methods(component, *method_names):
+    """Class decorator applying ``instrumented`` to the named methods"""
+    def decorator(cls):
+        for method_name in method_names:
+            setattr(cls, method_name, instrumented(component, method_name)(getattr(cls, method_name)))
+        return cls
+    return decorator
+
+
+def cache_lookup(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,323 @@
+from array import array
+from dataclasses import dataclass
+from datetime import datetime
+
+from money import from_minor, to_minor, RATE_DECIMALS
+
+ORDER_STATUSES = ('pending', 'paid', 'cancelled', 'expired')
+
+
+# ---------------------------
+# Records
+# ---------------------------
+@dataclass(slots=True)
+class User:
+    user_id: int
+    username: str = None
+    first_name: str = None
+    balance_cents: int = 0
+    registration_date: str = None
+    first_topup_date: str = None
+    total_deposited_cents: int = 0
+    total_orders: int = 0
+    last_activity: str = None
+    
+    @property
+    def balance(self):
+        return from_minor(self.balance_cents, 'USD')
+    
+    @property
+    def total_deposited(self):
+        return from_minor(self.total_deposited_cents, 'USD')
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from users.json, accepting the old float balance keys"""
+        if 'balance_cents' in data:
+            balance_cents = data['balance_cents']
+            total_deposited_cents = data.get('total_deposited_cents', 0)
+        else:
+            balance_cents = to_minor(data.get('balance', 0), 'USD')
+            total_deposited_cents = to_minor(data.get('total_deposited', 0), 'USD')
+        
+        return cls(
+            user_id=data['user_id'],
+            username=data.get('username'),
+            first_name=data.get('first_name'),
+            balance_cents=balance_cents,
+            registration_date=data.get('registration_date'),
+            first_topup_date=data.get('first_topup_date'),
+            total_deposited_cents=total_deposited_cents,
+            total_orders=data.get('total_orders', 0),
+            last_activity=data.get('last_activity')
+        )
+    
+    def to_dict(self):
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'balance_cents': self.balance_cents,
+            'registration_date': self.registration_date,
+            'first_topup_date': self.first_topup_date,
+            'total_deposited_cents': self.total_deposited_cents,
+            'total_orders': self.total_orders,
+            'last_activity': self.last_activity
+        }
+
+
+@dataclass(slots=True)
+class Order:
+    order_id: int
+    user_id: int
+    product_id: object
+    amount_cents: int
+    crypto_currency: str
+    crypto_amount_minor: int
+    payment_address: str
+    exchange_rate_e8: int
+    status: str = 'pending'
+    created_at: str = None
+    expires_at: str = None
+    paid_at: str = None
+    single_use_address: bool = False  # payment_address was claimed for this order alone
+    
+    @property
+    def amount(self):
+        return from_minor(self.amount_cents, 'USD')
+    
+    @property
+    def exchange_rate(self):
+        return from_minor(self.exchange_rate_e8, RATE_DECIMALS)
+    
+    @property
+    def crypto_amount(self):
+        return from_minor(self.crypto_amount_minor, self.crypto_currency)
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from orders.json, accepting the old float amount keys"""
+        crypto_currency = data['crypto_currency']
+        if 'amount_cents' in data:
+            amount_cents = data['amount_cents']
+            crypto_amount_minor = data['crypto_amount_minor']
+            exchange_rate_e8 = data.get('exchange_rate_e8', 0)
+        else:
+            amount_cents = to_minor(data.get('amount', 0), 'USD')
+            crypto_amount_minor = to_minor(data.get('crypto_amount', 0), crypto_currency)
+            exchange_rate_e8 = to_minor(data.get('exchange_rate', 0), RATE_DECIMALS)
+        
+        return cls(
+            order_id=data['order_id'],
+            user_id=data['user_id'],
+            product_id=data.get('product_id'),
+            amount_cents=amount_cents,
+            crypto_currency=crypto_currency,
+            crypto_amount_minor=crypto_amount_minor,
+            payment_address=data.get('payment_address'),
+            exchange_rate_e8=exchange_rate_e8,
+            status=data.get('status', 'pending'),
+            created_at=data.get('created_at'),
+            expires_at=data.get('expires_at'),
+            paid_at=data.get('paid_at'),
+            single_use_address=data.get('single_use_address', False)
+        )
+    
+    def to_dict(self):
+        data = {
+            'order_id': self.order_id,
+            'user_id': self.user_id,
+            'product_id': self.product_id,
+            'amount_cents': self.amount_cents,
+            'crypto_currency': self.crypto_currency,
+            'crypto_amount_minor': self.crypto_amount_minor,
+            'payment_address': self.payment_address,
+            'exchange_rate_e8': self.exchange_rate_e8,
+            'status': self.status,
+            'created_at': self.created_at,
+            'expires_at': self.expires_at
+        }
+        if self.paid_at:
+            data['paid_at'] = self.paid_at
+        if self.single_use_address:
+            data['single_use_address'] = True
+        return data
+
+
+@dataclass(slots=True)
+class Category:
+    id: int
+    name: str
+    description: str = ''
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['name'], data.get('description', ''))
+    
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'description': self.description}
+
+
+@dataclass(slots=True)
+class Subcategory:
+    id: int
+    name: str
+    category_id: int
+    description: str = ''
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['name'], data['category_id'], data.get('description', ''))
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'category_id': self.category_id,
+            'description': self.description
+        }
+
+
+@dataclass(slots=True)
+class Product:
+    id: int
+    name: str
+    description: str
+    price_cents: int
+    category_id: int
+    subcategory_id: int
+    features: tuple = ()
+    
+    @property
+    def price(self):
+        return from_minor(self.price_cents, 'USD')
+    
+    @classmethod
+    def from_dict(cls, data):
+        if 'price_cents' in data:
+            price_cents = data['price_cents']
+        else:
+            price_cents = to_minor(data.get('price', 0), 'USD')
+        return cls(
+            id=data['id'],
+            name=data['name'],
+            description=data.get('description', ''),
+            price_cents=price_cents,
+            category_id=data['category_id'],
+            subcategory_id=data['subcategory_id'],
+            features=tuple(data.get('features', ()))
+        )
+    
+    def to_dict(self):
+        # products.json is edited by hand, so the price stays in dollars there
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'price': float(self.price),
+            'category_id': self.category_id,
+            'subcategory_id': self.subcategory_id,
+            'features': list(self.features)
+        }
+
+
+@dataclass(slots=True)
+class Quote:
+    """A deposit price locked for one order: what the user was told to pay"""
+    order_id: int
+    crypto_currency: str
+    usd_cents: int
+    exchange_rate_e8: int
+    crypto_amount_minor: int
+    rate_fetched_at: float
+    expires_at: float
+    
+    @property
+    def exchange_rate(self):
+        return from_minor(self.exchange_rate_e8, RATE_DECIMALS)
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+    
+    def to_dict(self):
+        return {
+            'order_id': self.order_id,
+            'crypto_currency': self.crypto_currency,
+            'usd_cents': self.usd_cents,
+            'exchange_rate_e8': self.exchange_rate_e8,
+            'crypto_amount_minor': self.crypto_amount_minor,
+            'rate_fetched_at': self.rate_fetched_at,
+            'expires_at': self.expires_at
+        }
+
+
+# ---------------------------
+# Columnar views for bulk scans
+# ---------------------------
+def _epoch(iso_timestamp):
+    return datetime.fromisoformat(iso_timestamp).timestamp() if iso_timestamp else 0.0
+
+
+class UserColumns:
+    """Parallel typed arrays over all users, sorted by user id"""
+    
+    __slots__ = ('user_id', 'balance_cents', 'total_deposited_cents', 'total_orders')
+    
+    def __init__(self, users):
+        ordered = sorted(users, key=lambda u: u.user_id)
+        self.user_id = array('q', (u.user_id for u in ordered))
+        self.balance_cents = array('q', (u.balance_cents for u in ordered))
+        self.total_deposited_cents = array('q', (u.total_deposited_cents for u in ordered))
+        self.total_orders = array('l', (u.total_orders for u in ordered))
+    
+    def __len__(self):
+        return len(self.user_id)
+    
+    def totals(self):
+        return {
+            'users': len(self.user_id),
+            'balance_cents': sum(self.balance_cents),
+            'deposited_cents': sum(self.total_deposited_cents),
+            'orders': sum(self.total_orders),
+            'funded_users': sum(1 for cents in self.total_deposited_cents if cents > 0)
+        }
+
+
+class OrderColumns:
+    """Parallel typed arrays over all orders, in storage order"""
+    
+    __slots__ = ('order_id', 'user_id', 'amount_cents', 'status', 'expires_at')
+    
+    def __init__(self, orders):
+        status_codes = {status: code for code, status in enumerate(ORDER_STATUSES)}
+        self.order_id = array('q')
+        self.user_id = array('q')
+        self.amount_cents = array('q')
+        self.status = array('b')
+        self.expires_at = array('d')
+        for order in orders:
+            self.order_id.append(order.order_id)
+            self.user_id.append(order.user_id)
+            self.amount_cents.append(order.amount_cents)
+            self.status.append(status_codes.get(order.status, -1))
+            self.expires_at.append(_epoch(order.expires_at))
+    
+    def __len__(self):
+        return len(self.order_id)
+    
+    def expired_positions(self, now):
+        """Positions of orders past expiry that are neither paid nor cancelled"""
+        paid, cancelled = ORDER_STATUSES.index('paid'), ORDER_STATUSES.index('cancelled')
+        return [
+            i for i, (expires_at, status) in enumerate(zip(self.expires_at, self.status))
+            if expires_at <= now and status != paid and status != cancelled
+        ]
+    
+    def totals_by_status(self):
+        totals = {}
+        for status, cents in zip(self.status, self.amount_cents):
+            name = ORDER_STATUSES[status] if status >= 0 else 'unknown'
+            count, amount = totals.get(name, (0, 0))
+            totals[name] = (count + 1, amount + cents)
+        return totals
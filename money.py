@@ -0,0 +1,85 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from config import CRYPTO_NETWORKS
+
+# Integer minor units per asset: cents for USD, satoshis/litoshis for BTC/LTC, wei for USDT (BEP20)
+ASSET_DECIMALS = {'USD': 2}
+ASSET_DECIMALS.update({asset: info['decimals'] for asset, info in CRYPTO_NETWORKS.items()})
+
+# Precision a quoted crypto amount is rounded to before it is shown to the user
+QUOTE_DECIMALS = {'USD': 2}
+QUOTE_DECIMALS.update({asset: info.get('quote_decimals', info['decimals']) for asset, info in CRYPTO_NETWORKS.items()})
+
+# Exchange rates are stored as integer 1e-8 USD per whole coin
+RATE_DECIMALS = 8
+
+
+def decimals_for(asset):
+    """Decimals of an asset name, or pass an int through unchanged"""
+    if isinstance(asset, int):
+        return asset
+    return ASSET_DECIMALS.get(asset, 8)
+
+
+def to_minor(value, asset):
+    """Convert a str/float/Decimal amount to integer minor units of ``asset``"""
+    if value is None:
+        return 0
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value!r}")
+    if not amount.is_finite():
+        raise ValueError(f"Invalid amount: {value!r}")
+    return int((amount * (10 ** decimals_for(asset))).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor, asset):
+    """Integer minor units back to an exact Decimal amount"""
+    return Decimal(minor).scaleb(-decimals_for(asset))
+
+
+def usd_to_cents(value):
+    return to_minor(value, 'USD')
+
+
+def rate_to_minor(price):
+    """USD price of one coin to an integer rate (1e-8 USD)"""
+    return to_minor(price, RATE_DECIMALS)
+
+
+def format_usd(cents):
+    return f"{from_minor(cents, 'USD'):.2f}"
+
+
+def format_amount(minor, asset, places=None):
+    """Human readable amount, by default at the asset's quote precision"""
+    if places is None:
+        places = QUOTE_DECIMALS.get(asset, decimals_for(asset))
+    return f"{from_minor(minor, asset):.{places}f}"
+
+
+def _div_round(numerator, denominator):
+    """Integer division rounding half up (both operands positive)"""
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def quote(usd_cents, rate, asset):
+    """Crypto amount (minor units) worth ``usd_cents`` at ``rate``.
+
+    The result is rounded to the asset's quote precision, so it is always
+    a whole number of displayed digits.
+    """
+    return quote_batch((usd_cents,), rate, asset)[0]
+
+
+def quote_batch(usd_cents_list, rate, asset):
+    """Quote many USD amounts against one rate using integer arithmetic only"""
+    if rate <= 0:
+        raise ValueError(f"Invalid rate for {asset}: {rate}")
+    
+    # minor = cents / 10**2 / (rate / 10**RATE) * 10**decimals
+    scale = 10 ** (decimals_for(asset) + RATE_DECIMALS - ASSET_DECIMALS['USD'])
+    quantum = 10 ** (decimals_for(asset) - QUOTE_DECIMALS.get(asset, decimals_for(asset)))
+    denominator = rate * quantum
+    return [_div_round(cents * scale, denominator) * quantum for cents in usd_cents_list]
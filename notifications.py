@@ -0,0 +1,58 @@
+import money
+from send_scheduler import send_priority, PRIORITY_HIGH
+
+
+class OrderNotifier:
+    """Event handler telling users about their orders and deposits.
+
+    Runs as an EventConsumer; messages go out in the scheduler's high
+    priority lane so confirmations are not stuck behind broadcasts.
+    """
+    
+    def __init__(self, bot, catalog):
+        self.bot = bot
+        self.catalog = catalog
+    
+    def __call__(self, event):
+        text = self.format(event)
+        if text:
+            with send_priority(PRIORITY_HIGH):
+                self.bot.send_message(chat_id=event['user_id'], text=text, parse_mode='Markdown')
+    
+    def _product_name(self, event):
+        product = self.catalog.get_product(event.get('product_id'))
+        return product.name if product else 'Unknown'
+    
+    def format(self, event):
+        """Message text for an event, or None if the user isn't notified"""
+        event_type = event['type']
+        
+        if event_type == 'order_paid':
+            # Balance purchases are confirmed inline when the user buys, and
+            # paid deposits are announced by their balance_credited event
+            if event.get('via') == 'balance' or event.get('product_id') is None:
+                return None
+            return (
+                f"✅ **Payment Received!**\n\n"
+                f"🆔 **Order ID:** {event['order_id']}\n"
+                f"📦 **Product:** {self._product_name(event)}\n"
+                f"💰 **Amount:** ${money.format_usd(event['amount_cents'])}\n\n"
+                f"Thank you for your payment!"
+            )
+        
+        if event_type == 'order_expired':
+            return (
+                f"⌛ **Order Expired**\n\n"
+                f"🆔 **Order ID:** {event['order_id']}\n"
+                f"💰 **Amount:** ${money.format_usd(event['amount_cents'])}\n\n"
+                f"No payment was detected in time. Use /start to try again."
+            )
+        
+        if event_type == 'balance_credited':
+            return (
+                f"💰 **Balance Updated!**\n\n"
+                f"➕ **Added:** ${money.format_usd(event['amount_cents'])}\n"
+                f"💳 **New Balance:** ${money.format_usd(event['balance_cents'])}"
+            )
+        
+        return None
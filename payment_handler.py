@@ -1,157 +1,330 @@
-import json
 import requests
-from web3 import Web3
-from datetime import datetime, timedelta
+import threading
 import time
-import random
-from config import CRYPTO_NETWORKS, BLOCKCHAIN_APIS
+from contextlib import nullcontext
+from datetime import datetime
+from config import CRYPTO_NETWORKS, BLOCKCHAIN_APIS, WALLET_ADDRESSES, PAYMENT_GRACE
+from lazy import lazy_import
+from metrics import instrumented, cache_lookup
+import money
+
+# Importing web3 takes over a second and it is only needed for USDT (BEP20) lookups
+web3 = lazy_import('web3')
+
+# keccak256("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef'
+
+# Most BSC RPC endpoints reject eth_getLogs over more blocks than this
+BSC_LOG_RANGE = 5000
+# Blocks sampled to measure the BSC block time
+BSC_BLOCK_SAMPLE = 1000
 
 class PaymentHandler:
-    def __init__(self):
-        try:
-            self.bsc_web3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_APIS['BSC']))
-            print("✅ Connected to BSC network")
-        except:
-            print("❌ Could not connect to BSC network")
-            self.bsc_web3 = None
+    def __init__(self, address_pool=None, shared_cache=None):
+        self._bsc_web3 = None
+        self._bsc_lock = threading.Lock()
+        self._bsc_block_time = None  # (seconds per block, measured at)
         
+        # crypto_currency -> (rate in 1e-8 USD, fetched_at)
         self.price_cache = {}
+        # Rates fetched by any worker on this host ('prices' slot, same shape as price_cache)
+        self.shared_cache = shared_cache
+        # Fresh per-order addresses derived from configured xpubs (optional)
+        self.address_pool = address_pool
         self.cache_duration = 300  # 5 minutes
+        print("✅ Payment Handler Initialized")
     
-    def get_real_time_price(self, crypto_currency):
-        """Get real-time cryptocurrency price from Binance API"""
+    @property
+    def bsc_web3(self):
+        """BSC client, created (and web3 imported) on first use"""
+        if self._bsc_web3 is None:
+            with self._bsc_lock:
+                if self._bsc_web3 is None:
+                    self._bsc_web3 = web3.Web3(web3.Web3.HTTPProvider(BLOCKCHAIN_APIS['BSC']))
+                    print("✅ BSC client ready")
+        return self._bsc_web3
+    
+    @instrumented('price_provider', 'binance', none_is_error=True)
+    def get_binance_price(self, symbol):
+        """Get price from Binance API"""
         try:
-            # Check if we have a valid cached price
-            cache_key = crypto_currency
-            if cache_key in self.price_cache:
-                cached_price, timestamp = self.price_cache[cache_key]
-                if time.time() - timestamp < self.cache_duration:
-                    return cached_price
-            
-            # Binance API for price
-            symbols = {
-                'BTC': 'BTCUSDT',
-                'LTC': 'LTCUSDT',
-                'USDT_BEP20': 'USDTUSDT'
-            }
+            url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
+            response = requests.get(url, timeout=10)
             
-            symbol = symbols.get(crypto_currency)
-            if not symbol:
-                return self.get_fallback_price(crypto_currency)
+            if response.status_code == 200:
+                data = response.json()
+                return money.rate_to_minor(data['price'])
+            return None
+        except:
+            return None
+    
+    @instrumented('price_provider', 'kraken', none_is_error=True)
+    def get_kraken_price(self, pair):
+        """Get price from Kraken API"""
+        try:
+            url = f"https://api.kraken.com/0/public/Ticker?pair={pair}"
+            response = requests.get(url, timeout=10)
             
-            url = f"https://api.binance.com/api/v3/ticker/price?symbol={symbol}"
+            if response.status_code == 200:
+                data = response.json()
+                if 'result' in data:
+                    # Kraken returns different keys, get the first one
+                    first_key = list(data['result'].keys())[0]
+                    return money.rate_to_minor(data['result'][first_key]['c'][0])
+            return None
+        except:
+            return None
+    
+    @instrumented('price_provider', 'coingecko', none_is_error=True)
+    def get_coingecko_price(self, crypto_id):
+        """Get price from CoinGecko API"""
+        try:
+            url = f"https://api.coingecko.com/api/v3/simple/price?ids={crypto_id}&vs_currencies=usd"
             response = requests.get(url, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
-                price = float(data['price'])
-                
-                # Cache the price
-                self.price_cache[cache_key] = (price, time.time())
-                return price
-            else:
-                return self.get_fallback_price(crypto_currency)
-                
-        except Exception as e:
-            print(f"Price fetch error for {crypto_currency}: {e}")
-            return self.get_fallback_price(crypto_currency)
+                price = data.get(crypto_id, {}).get('usd')
+                if price:
+                    return money.rate_to_minor(price)
+            return None
+        except:
+            return None
+    
+    def _shared_rate(self, crypto_currency, current_time):
+        """Fresh rate published by any worker (copied into price_cache), or None"""
+        if not self.shared_cache:
+            return None
+        entry = self.shared_cache.get('prices', {}).get(crypto_currency)
+        if entry and current_time - entry[1] < self.cache_duration:
+            self.price_cache[crypto_currency] = (entry[0], entry[1])
+            return entry[0]
+        return None
     
-    def get_fallback_price(self, crypto_currency):
+    def _publish_rate(self, crypto_currency, rate, fetched_at):
+        if self.shared_cache:
+            self.shared_cache.update('prices', lambda prices: {**prices, crypto_currency: [rate, fetched_at]}, {})
+    
+    def get_rate(self, crypto_currency):
+        """Get real-time rate (integer 1e-8 USD per coin) with multiple fallback APIs"""
+        cache_key = crypto_currency
+        current_time = time.time()
+        
+        # Check cache first
+        if cache_key in self.price_cache:
+            cached_rate, timestamp = self.price_cache[cache_key]
+            if current_time - timestamp < self.cache_duration:
+                cache_lookup('price', True)
+                return cached_rate
+        
+        rate = self._shared_rate(crypto_currency, current_time)
+        if rate:
+            cache_lookup('price', True)
+            return rate
+        
+        # One worker per host fetches; the others wait for it and take its result
+        refresh_lock = self.shared_cache.refresh_lock(f'price_{crypto_currency}') if self.shared_cache else nullcontext()
+        with refresh_lock:
+            current_time = time.time()
+            rate = self._shared_rate(crypto_currency, current_time)
+            if rate:
+                cache_lookup('price', True)
+                return rate
+            
+            cache_lookup('price', False)
+            rate = self._fetch_rate(crypto_currency)
+            self.price_cache[cache_key] = (rate, current_time)
+            self._publish_rate(crypto_currency, rate, current_time)
+            return rate
+    
+    def _fetch_rate(self, crypto_currency):
+        """Ask the price APIs in turn, falling back to fixed prices"""
+        rate = None
+        print(f"🔍 Fetching price for {crypto_currency}...")
+        
+        if crypto_currency == 'BTC':
+            # Try multiple APIs for BTC
+            rate = self.get_binance_price('BTCUSDT')
+            if not rate:
+                rate = self.get_kraken_price('XXBTZUSD')
+            if not rate:
+                rate = self.get_coingecko_price('bitcoin')
+        
+        elif crypto_currency == 'LTC':
+            # Try multiple APIs for LTC
+            rate = self.get_binance_price('LTCUSDT')
+            if not rate:
+                rate = self.get_kraken_price('XLTCZUSD')
+            if not rate:
+                rate = self.get_coingecko_price('litecoin')
+        
+        elif crypto_currency == 'USDT_BEP20':
+            # For USDT, we expect ~1.0, but check multiple sources
+            rate = self.get_binance_price('BUSDUSDT')  # Using BUSD as stablecoin reference
+            if not rate:
+                rate = self.get_kraken_price('USDTZUSD')
+            if not rate:
+                rate = self.get_coingecko_price('tether')
+            
+            # If still no price or price is unrealistic, use 1.0
+            if not rate or rate < money.rate_to_minor('0.9') or rate > money.rate_to_minor('1.1'):
+                rate = money.rate_to_minor(1)
+        
+        # If all APIs fail, use fallback prices
+        if not rate:
+            rate = self.get_fallback_rate(crypto_currency)
+            print(f"⚠️ Using fallback price for {crypto_currency}: ${money.from_minor(rate, money.RATE_DECIMALS)}")
+        else:
+            print(f"✅ Real-time price for {crypto_currency}: ${money.from_minor(rate, money.RATE_DECIMALS):.4f}")
+        
+        return rate
+    
+    def get_rate_snapshot(self, crypto_currency):
+        """Cached rate and the time it was fetched: ``(rate, fetched_at)``"""
+        rate = self.get_rate(crypto_currency)
+        return rate, self.price_cache[crypto_currency][1]
+    
+    def get_real_time_price(self, crypto_currency):
+        """Get real-time USD price of one coin as a Decimal (for display)"""
+        return money.from_minor(self.get_rate(crypto_currency), money.RATE_DECIMALS)
+    
+    def get_fallback_rate(self, crypto_currency):
         """Fallback prices if API fails"""
         fallback_prices = {
-            'BTC': 45000.0,
-            'LTC': 75.0,
-            'USDT_BEP20': 1.0
+            'BTC': '45000',
+            'LTC': '75',
+            'USDT_BEP20': '1'
         }
-        return fallback_prices.get(crypto_currency, 1.0)
+        return money.rate_to_minor(fallback_prices.get(crypto_currency, '1'))
     
     def generate_payment_address(self, crypto_currency, order_id):
-        """Generate payment address for specific cryptocurrency"""
-        # 🚨 REPLACE THESE WITH YOUR ACTUAL WALLET ADDRESSES 🚨
-        addresses = {
-            'USDT_BEP20': '0x515a1DA038D2813400912C88Bbd4921836041766',
-            'BTC': 'bc1q85ad38ndcd29zgz7d77y5k9hcsurqxaqurzl2g',
-            'LTC': 'ltc1q2e3z74c63j5cn2hu0wep5vdrmmf6jv9zf6m4rv'
-        }
+        """Fresh HD address for the order, or the static wallet address as fallback"""
+        if self.address_pool:
+            address = self.address_pool.claim(crypto_currency)
+            if address:
+                return address
         
-        return addresses.get(crypto_currency)
+        address = WALLET_ADDRESSES.get(crypto_currency)
+        if not address:
+            print(f"❌ No address configured for {crypto_currency}")
+            return None
+        
+        return address
+    
+    def is_single_use_address(self, crypto_currency, address):
+        """True for a fresh HD address claimed for one order; False for a static or reused address"""
+        return bool(self.address_pool and self.address_pool.single_use(crypto_currency, address))
     
-    def check_btc_payment(self, address, expected_amount):
-        """Check BTC payments using blockchain API"""
+    def release_payment_address(self, crypto_currency, address):
+        """Return an unpaid order's HD address to the pool (static addresses are ignored)"""
+        if self.address_pool:
+            self.address_pool.release(crypto_currency, address)
+    
+    @instrumented('chain', 'btc_transfers', none_is_error=True)
+    def get_btc_transfers(self, address):
+        """Recent incoming BTC transfers as ``(txid, satoshis, block_time)``; unconfirmed ones have no time"""
         try:
-            url = f"{BLOCKCHAIN_APIS['BTC']}address/{address}"
+            url = f"{BLOCKCHAIN_APIS['BTC']}address/{address}/txs"
             response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                total_received = data.get('chain_stats', {}).get('funded_txo_sum', 0) / 100000000
-                return total_received >= expected_amount
+            if response.status_code != 200:
+                return None
+            
+            transfers = []
+            for tx in response.json():
+                value = sum(out.get('value', 0) for out in tx.get('vout', []) if out.get('scriptpubkey_address') == address)
+                if value:
+                    status = tx.get('status', {})
+                    transfers.append((tx['txid'], value, status.get('block_time') if status.get('confirmed') else None))
+            return transfers
         except Exception as e:
-            print(f"BTC check error: {e}")
-        return False
+            print(f"BTC transfers error: {e}")
+        return None
     
-    def check_ltc_payment(self, address, expected_amount):
-        """Check LTC payments using blockchain API"""
+    @instrumented('chain', 'ltc_transfers', none_is_error=True)
+    def get_ltc_transfers(self, address):
+        """Recent incoming LTC transfers as ``(txid, litoshis, confirmed_time)``"""
         try:
-            url = f"{BLOCKCHAIN_APIS['LTC']}addrs/{address}/balance"
+            url = f"{BLOCKCHAIN_APIS['LTC']}addrs/{address}?limit=50"
             response = requests.get(url, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                total_received = data.get('total_received', 0) / 100000000
-                return total_received >= expected_amount
+            if response.status_code != 200:
+                return None
+            
+            received = {}
+            data = response.json()
+            for ref in data.get('txrefs', []) + data.get('unconfirmed_txrefs', []):
+                if ref.get('tx_input_n', -1) != -1:
+                    continue  # spent from this address, not received
+                value, confirmed = received.get(ref['tx_hash'], (0, None))
+                if ref.get('confirmations', 0) > 0 and ref.get('confirmed'):
+                    confirmed = datetime.fromisoformat(ref['confirmed'].replace('Z', '+00:00')).timestamp()
+                received[ref['tx_hash']] = (value + int(ref.get('value', 0)), confirmed)
+            return [(txid, value, confirmed) for txid, (value, confirmed) in received.items()]
         except Exception as e:
-            print(f"LTC check error: {e}")
-        return False
+            print(f"LTC transfers error: {e}")
+        return None
+    
+    def _bsc_block_at(self, timestamp, head):
+        """Number of a BSC block no later than ``timestamp``, estimated from the measured block time"""
+        if timestamp >= head['timestamp']:
+            return head['number']
+        cached = self._bsc_block_time
+        if cached is None or time.time() - cached[1] > self.cache_duration:
+            sample = self.bsc_web3.eth.get_block(max(0, head['number'] - BSC_BLOCK_SAMPLE))
+            blocks = max(head['number'] - sample['number'], 1)
+            cached = (max(head['timestamp'] - sample['timestamp'], 1) / blocks, time.time())
+            self._bsc_block_time = cached
+        # 10% more blocks than estimated, in case blocks were faster in between
+        back = int((head['timestamp'] - timestamp) / cached[0] * 1.1) + 1
+        return max(0, head['number'] - back)
     
-    def check_usdt_bep20_payment(self, address, expected_amount):
-        """Check USDT BEP20 payments"""
+    @instrumented('chain', 'usdt_bep20_transfers', none_is_error=True)
+    def get_usdt_bep20_transfers(self, address, since=None):
+        """Incoming USDT (BEP20) transfers since ``since`` (a unix time) as ``(txid, wei, block_time)``.
+
+        Without ``since`` it looks back over an order's lifetime plus the
+        payment grace period.
+        """
+        if since is None:
+            since = time.time() - 15 * 60 - PAYMENT_GRACE
         try:
-            # USDT BEP20 contract ABI (simplified)
-            usdt_abi = [
-                {
-                    "constant": True,
-                    "inputs": [{"name": "_owner", "type": "address"}],
-                    "name": "balanceOf",
-                    "outputs": [{"name": "balance", "type": "uint256"}],
-                    "type": "function"
-                }
-            ]
-            
-            usdt_contract = self.bsc_web3.eth.contract(
-                address=Web3.to_checksum_address(CRYPTO_NETWORKS['USDT_BEP20']['usdt_contract']),
-                abi=usdt_abi
-            )
+            eth = self.bsc_web3.eth
+            head = eth.get_block('latest')
+            latest = head['number']
+            contract = web3.Web3.to_checksum_address(CRYPTO_NETWORKS['USDT_BEP20']['usdt_contract'])
+            topics = [TRANSFER_TOPIC, None, '0x' + '0' * 24 + address[2:].lower()]
+            logs = []
+            for from_block in range(self._bsc_block_at(since, head), latest + 1, BSC_LOG_RANGE):
+                logs.extend(eth.get_logs({
+                    'fromBlock': from_block,
+                    'toBlock': min(from_block + BSC_LOG_RANGE - 1, latest),
+                    'address': contract,
+                    'topics': topics
+                }))
             
-            balance = usdt_contract.functions.balanceOf(Web3.to_checksum_address(address)).call()
-            usdt_balance = balance / 10**18
-            return usdt_balance >= expected_amount
+            transfers = []
+            block_times = {}
+            for log in logs:
+                block_number = log['blockNumber']
+                if block_number not in block_times:
+                    block_times[block_number] = self.bsc_web3.eth.get_block(block_number)['timestamp']
+                amount = int.from_bytes(bytes(log['data']), 'big')
+                transfers.append((web3.Web3.to_hex(log['transactionHash']), amount, block_times[block_number]))
+            return transfers
         except Exception as e:
-            print(f"USDT check error: {e}")
-        return False
-    
-    def check_payment(self, crypto_currency, address, expected_amount):
-        """Check payment for specific cryptocurrency"""
-        checkers = {
-            'BTC': self.check_btc_payment,
-            'LTC': self.check_ltc_payment,
-            'USDT_BEP20': self.check_usdt_bep20_payment
-        }
-        
-        checker = checkers.get(crypto_currency)
-        if checker:
-            return checker(address, expected_amount)
-        return False
-    
-    def get_crypto_amount(self, usd_amount, crypto_currency):
-        """Convert USD amount to cryptocurrency amount using real-time prices"""
-        current_price = self.get_real_time_price(crypto_currency)
-        crypto_amount = usd_amount / current_price
-        
-        # Round to appropriate decimal places
+            print(f"USDT transfers error: {e}")
+        return None
+    
+    def get_transfers(self, crypto_currency, address, since=None):
+        """Incoming transfers to an address as ``(txid, amount_minor, timestamp)``, None on error.
+
+        ``since`` (a unix time) bounds how far back to look where the chain
+        API needs a range (BSC); BTC and LTC return the address's recent
+        transactions.
+        """
         if crypto_currency == 'BTC':
-            crypto_amount = round(crypto_amount, 6)
-        elif crypto_currency == 'LTC':
-            crypto_amount = round(crypto_amount, 4)
-        else:
-            crypto_amount = round(crypto_amount, 2)
-        
-        return crypto_amount, current_price
\ No newline at end of file
+            return self.get_btc_transfers(address)
+        if crypto_currency == 'LTC':
+            return self.get_ltc_transfers(address)
+        if crypto_currency == 'USDT_BEP20':
+            return self.get_usdt_bep20_transfers(address, since)
+        return None
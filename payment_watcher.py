@@ -0,0 +1,120 @@
+import threading
+import time
+from datetime import datetime
+
+from config import PAYMENT_WATCH_INTERVAL
+from storage import file_lock
+from user_manager import DUPLICATE
+
+
+class PaymentWatcher:
+    """Credits pending deposits from incoming transfers.
+
+    Every ``interval`` seconds it fetches recent transfers once per
+    (asset, address) with pending deposits and matches each transfer to
+    its order by exact tagged amount, or, on a single-use HD address, to
+    the only order there if it covers it. The credit is recorded in the
+    ledger under the transaction id, and transfers already there are
+    skipped, so a transfer is never credited twice nor matched to a later
+    order at the same address. Orders past expiry stay matchable for the
+    database's grace period; then the same tick cleans them up, which
+    frees their tag slots and returns their HD addresses to the pool. Only one
+    worker watches at a time.
+    """
+    
+    # Transfers may be timestamped slightly before the order by clock skew
+    CLOCK_SLACK = 120
+    
+    def __init__(self, payment_handler, db, user_manager, quote_book=None, interval=PAYMENT_WATCH_INTERVAL):
+        self.payment_handler = payment_handler
+        self.db = db
+        self.user_manager = user_manager
+        self.quote_book = quote_book
+        self.interval = interval
+        self._thread = None
+    
+    def poll(self):
+        """Match transfers to pending deposits; returns the number credited"""
+        try:
+            with file_lock(self.db.orders_file + '.watcher', blocking=False):
+                for order in self.db.cleanup_expired_orders():
+                    self.payment_handler.release_payment_address(order.crypto_currency, order.payment_address)
+                return self._match_pending()
+        except BlockingIOError:
+            return 0  # another worker is watching
+    
+    def _match_pending(self):
+        credited = 0
+        ledger = self.user_manager.ledger
+        for crypto_currency, address in self.db.pending_addresses():
+            pending = self.db.pending_at_address(crypto_currency, address)
+            if not pending:
+                continue
+            # Back to the oldest order still payable here, expired ones in their grace period included
+            since = min(datetime.fromisoformat(order.created_at).timestamp() for order in pending) - self.CLOCK_SLACK
+            transfers = self.payment_handler.get_transfers(crypto_currency, address, since=since)
+            for txid, amount_minor, timestamp in transfers or ():
+                if timestamp is None:
+                    continue  # not confirmed yet
+                if ledger and ledger.has_key(f"deposit:{crypto_currency}:{txid}"):
+                    continue  # already credited, possibly to an earlier order at this address
+                order = self.db.find_pending_deposit(crypto_currency, address, amount_minor)
+                if order is None:
+                    at_address = self.db.pending_at_address(crypto_currency, address)
+                    if len(at_address) != 1 or not at_address[0].single_use_address:
+                        continue  # a static address needs the exact tagged amount
+                    order = at_address[0]
+                    if amount_minor < order.crypto_amount_minor:
+                        continue
+                if timestamp < datetime.fromisoformat(order.created_at).timestamp() - self.CLOCK_SLACK:
+                    continue  # an older payment that happens to have the same amount
+                if not self.honours_quote(order, amount_minor, timestamp):
+                    continue
+                if self.credit(order, txid):
+                    credited += 1
+        return credited
+    
+    def honours_quote(self, order, amount_minor, timestamp):
+        """Check a payment against the order's locked quote, without fetching prices.
+
+        Orders created before quotes were locked have none and pass.
+        """
+        if not self.quote_book:
+            return True
+        if self.quote_book.verify(order.order_id, order.crypto_currency, amount_minor, timestamp):
+            return True
+        return self.quote_book.get(order.order_id) is None
+    
+    def credit(self, order, txid):
+        """Credit a deposit order once and mark it paid"""
+        key = f"deposit:{order.crypto_currency}:{txid}"
+        ref = f"order:{order.order_id}"
+        result = self.user_manager.update_balance(order.user_id, order.amount_cents, kind='deposit',
+                                                  key=key, ref=ref)
+        if not result:
+            print(f"❌ Deposit {order.order_id}: user {order.user_id} not found")
+            return False
+        if result == DUPLICATE:
+            # Only the order the transfer was credited to is paid by it (e.g. after a crash
+            # between crediting and marking it paid)
+            entry = self.user_manager.ledger.entry(key)
+            if entry is None or entry.get('ref') != ref:
+                print(f"⚠️ Deposit {order.order_id}: {txid} was already credited to {entry and entry.get('ref')}")
+                return False
+        self.db.update_order_status(order.order_id, 'paid')
+        print(f"✅ Deposit {order.order_id} paid by {txid}")
+        return True
+    
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"❌ Payment watcher error: {e}")
+            time.sleep(self.interval)
+    
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='payment-watcher', daemon=True)
+            self._thread.start()
+        return self._thread
@@ -0,0 +1,124 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Leaf functions of threads that are just waiting for work; the background loops
+# (``_run``) are only ever the leaf frame while they sleep between ticks
+IDLE_FUNCTIONS = {'wait', 'select', 'poll', 'accept', '_wait_for_tstate_lock', 'sleep', '_run'}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Statistical profiler for the running worker.
+
+    A background thread snapshots every thread's Python stack with
+    ``sys._current_frames()`` every ``interval`` seconds for the requested
+    duration, so nothing is hooked into the code being measured (about
+    1% CPU at the default 100 Hz). Stacks of threads waiting for work are
+    dropped. The result is a collapsed-stack file (one
+    ``thread;outer;...;leaf count`` line per stack, the input of
+    flamegraph.pl and speedscope) plus a top-functions summary.
+
+    It profiles the one gunicorn worker it runs in.
+    """
+    
+    def __init__(self, output_dir='profiles', interval=0.01):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.last_result = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, seconds, on_done=None):
+        """Profile for ``seconds`` in the background; False if a run is in progress"""
+        with self._lock:
+            if self.running:
+                return False
+            self._thread = threading.Thread(target=self._run, args=(seconds, on_done), name='profiler', daemon=True)
+            self._thread.start()
+            return True
+    
+    def _run(self, seconds, on_done):
+        try:
+            stacks, samples = self.sample(seconds)
+            result = self.save(stacks, samples, seconds)
+        except Exception as e:
+            print(f"❌ Profiler failed: {e}")
+            return
+        self.last_result = result
+        if on_done:
+            try:
+                on_done(result)
+            except Exception as e:
+                print(f"❌ Profiler callback failed: {e}")
+    
+    def sample(self, seconds):
+        """Collect ``(Counter of stack tuples, number of snapshots)``"""
+        own_id = threading.get_ident()
+        stacks = Counter()
+        snapshots = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_name in IDLE_FUNCTIONS:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[tuple(reversed(stack))] += 1
+            snapshots += 1
+            time.sleep(self.interval)
+        return stacks, snapshots
+    
+    def save(self, stacks, snapshots, seconds):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.collapsed")
+        with open(path, 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{';'.join(stack)} {count}\n")
+        return {
+            'file': path,
+            'seconds': seconds,
+            'snapshots': snapshots,
+            'samples': sum(stacks.values()),
+            'top': top_functions(stacks)
+        }
+
+
+def top_functions(stacks, limit=15):
+    """``[(function, self samples, total samples)]`` ordered by self samples"""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        own[stack[-1]] += count
+        for label in set(stack[1:]):
+            total[label] += count
+    return [(label, count, total[label]) for label, count in own.most_common(limit)]
+
+
+def format_summary(result):
+    """Top functions as plain text for the admin chat"""
+    samples = result['samples'] or 1
+    lines = [
+        f"🔬 Profiled {result['seconds']}s: {result['samples']} busy samples "
+        f"in {result['snapshots']} snapshots (pid {os.getpid()})",
+        "",
+        "self%  total%  function"
+    ]
+    for label, own, total in result['top']:
+        lines.append(f"{own * 100 / samples:5.1f}  {total * 100 / samples:6.1f}  {label}")
+    if not result['top']:
+        lines.append("No busy threads were seen; profile while traffic is flowing.")
+    return '\n'.join(lines)
@@ -0,0 +1,66 @@
+import time
+from datetime import datetime
+
+import money
+from config import PAYMENT_GRACE
+from conversation_state import ConversationState
+from models import Quote
+
+
+class QuoteBook:
+    """Locked deposit quotes kept in the expiry-indexed state store.
+
+    ``quote()`` prices a deposit from the payment handler's cached rate
+    snapshot without a new API call. ``lock()`` stores it under the
+    order id once the order (and its tagged amount) exists, so the
+    payment watcher can check a transfer against the promised rate with
+    one key lookup. Quotes stay readable for ``grace`` seconds after
+    they expire, for payments sent in time but confirmed late.
+    """
+    
+    def __init__(self, backend, payment_handler, grace=PAYMENT_GRACE):
+        self.payment_handler = payment_handler
+        self.grace = grace
+        self._store = ConversationState(backend, namespace='quote', default_ttl=grace)
+    
+    def quote(self, usd_cents, crypto_currency):
+        """Unlocked Quote for a USD amount at the cached rate"""
+        rate, fetched_at = self.payment_handler.get_rate_snapshot(crypto_currency)
+        return Quote(
+            order_id=None,
+            crypto_currency=crypto_currency,
+            usd_cents=usd_cents,
+            exchange_rate_e8=rate,
+            crypto_amount_minor=money.quote(usd_cents, rate, crypto_currency),
+            rate_fetched_at=fetched_at,
+            expires_at=None
+        )
+    
+    def lock(self, quote, order):
+        """Bind a quote to its order's final amount and expiry and store it"""
+        quote.order_id = order.order_id
+        quote.crypto_amount_minor = order.crypto_amount_minor
+        quote.expires_at = datetime.fromisoformat(order.expires_at).timestamp()
+        ttl = max(1, quote.expires_at - time.time()) + self.grace
+        self._store.set(order.order_id, quote.to_dict(), ttl=ttl)
+        return quote
+    
+    def get(self, order_id):
+        data = self._store.get(order_id)
+        return Quote.from_dict(data) if data else None
+    
+    def verify(self, order_id, crypto_currency, amount_minor, paid_at):
+        """The locked quote if this payment honours it, else None.
+
+        The payment must be in the quoted asset, cover the quoted amount
+        and be confirmed (``paid_at``, a unix time) before the quote
+        expired plus ``grace``: a transfer sent in time may confirm later.
+        """
+        quote = self.get(order_id)
+        if quote is None:
+            return None
+        if quote.crypto_currency != crypto_currency or amount_minor < quote.crypto_amount_minor:
+            return None
+        if paid_at > quote.expires_at + self.grace:
+            return None
+        return quote
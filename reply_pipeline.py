@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import partial
+
+from telegram import InputFile
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut, Unauthorized
+
+from lazy import lazy_import
+from metrics import TELEGRAM_CALLS
+from serialization import dumps, loads
+
+aiohttp = lazy_import('aiohttp')
+
+logger = logging.getLogger(__name__)
+
+# Bot API methods whose result no handler reads, so they can be sent after the handler returns
+DEFERRABLE = frozenset({
+    'answerCallbackQuery',
+    'sendMessage',
+    'editMessageText',
+    'editMessageReplyMarkup',
+    'editMessageCaption',
+    'deleteMessage',
+    'sendChatAction'
+})
+
+_local = threading.local()
+
+
+def parse_response(status, payload):
+    """Result of a Bot API response, or the python-telegram-bot error it stands for"""
+    try:
+        body = loads(payload)
+    except ValueError:
+        raise NetworkError(f"Invalid server response ({status})") from None
+    if body.get('ok'):
+        return body.get('result')
+    
+    parameters = body.get('parameters') or {}
+    if parameters.get('retry_after'):
+        raise RetryAfter(parameters['retry_after'])
+    description = body.get('description') or f"HTTP {status}"
+    if status in (401, 403):
+        raise Unauthorized(description)
+    if status == 400:
+        raise BadRequest(description)
+    raise NetworkError(f"{description} ({status})")
+
+
+class AsyncTelegramClient:
+    """Bot API calls over one pooled aiohttp session.
+
+    The session and its event loop run in a daemon thread started on
+    first use, so each gunicorn worker gets its own, and keep up to
+    ``pool_size`` connections to Telegram alive. ``submit`` returns a
+    concurrent Future; ``call`` waits for it. Errors are raised as
+    python-telegram-bot's exceptions (``RetryAfter`` on a 429), so
+    SendScheduler retries these calls like any other.
+    """
+    
+    def __init__(self, token, pool_size=8, timeout=10.0, base_url='https://api.telegram.org'):
+        self.url = f"{base_url}/bot{token}"
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+    
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='telegram-client', daemon=True).start()
+                self._loop = loop
+            return self._loop
+    
+    async def _post(self, method, body):
+        # Only ever runs on the client's loop, so the session needs no lock
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        async with self._session.post(f"{self.url}/{method}", data=body,
+                                      headers={'Content-Type': 'application/json'}) as response:
+            return response.status, await response.read()
+    
+    async def _call(self, method, data):
+        try:
+            status, payload = await self._post(method, dumps(data))
+        except asyncio.TimeoutError as e:
+            raise TimedOut() from e
+        except aiohttp.ClientError as e:
+            raise NetworkError(f"aiohttp {e}") from e
+        return parse_response(status, payload)
+    
+    def submit(self, method, data):
+        return asyncio.run_coroutine_threadsafe(self._call(method, data), self._event_loop())
+    
+    def call(self, method, data):
+        return self.submit(method, data).result()
+
+
+class WebhookReply:
+    """Bot API call to return as the webhook response body, if any"""
+    
+    __slots__ = ('body',)
+    
+    def __init__(self):
+        self.body = None
+
+
+class ReplyPipeline:
+    """Sends the Bot API calls of a webhook update with fewer round trips.
+
+    While an update is handled inside ``collect()``, calls to the methods
+    in ``DEFERRABLE`` are queued instead of sent (the bot method returns
+    True). Afterwards one of them becomes the webhook response body, which
+    Telegram executes itself: the callback answer if there is one, else a
+    lone call whose chat has a send token free right now. The rest are
+    sent in order, each after the previous one, through the SendScheduler
+    over the pooled client, without holding the request thread. Any other
+    call (a file upload, getMe) first sends what is queued, then goes out
+    as usual.
+    """
+    
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+    
+    def collecting(self):
+        return getattr(_local, 'calls', None) is not None
+    
+    @contextmanager
+    def collect(self):
+        reply = WebhookReply()
+        _local.calls = []
+        try:
+            yield reply
+        except BaseException:
+            self._send(self._take())
+            raise
+        calls = self._take()
+        reply.body = self._reply_body(calls)
+        self._send(calls)
+    
+    def _take(self):
+        calls, _local.calls = _local.calls, None
+        return calls
+    
+    def defer(self, endpoint, data):
+        """Queue a call made while collecting; False if it has to be sent now"""
+        calls = getattr(_local, 'calls', None)
+        if calls is None:
+            return False
+        if endpoint in DEFERRABLE and not any(isinstance(value, InputFile) for value in data.values()):
+            calls.append((endpoint, data))
+            return True
+        # Keep the order: whatever is queued goes out before this call
+        _local.calls = []
+        self._send(calls).result()
+        return False
+    
+    def _reply_body(self, calls):
+        for index, (endpoint, data) in enumerate(calls):
+            if endpoint == 'answerCallbackQuery':
+                del calls[index]
+                return self._body(endpoint, data)
+        if len(calls) == 1:
+            endpoint, data = calls[0]
+            chat_id = data.get('chat_id')
+            if chat_id is None or self.scheduler.try_acquire(str(chat_id)):
+                calls.clear()
+                return self._body(endpoint, data)
+        return None
+    
+    def _body(self, endpoint, data):
+        TELEGRAM_CALLS.inc(method=endpoint, path='webhook_reply')
+        return {'method': endpoint, **data}
+    
+    def _submit(self, endpoint, data):
+        TELEGRAM_CALLS.inc(method=endpoint, path='pipelined')
+        chat_id = data.get('chat_id')
+        if chat_id is None:
+            # Not counted against the flood limits, as with ScheduledBot
+            return self.client.submit(endpoint, data)
+        return self.scheduler.submit(partial(self.client.call, endpoint, data), chat_id=str(chat_id))
+    
+    def _send(self, calls):
+        """Send ``calls`` one after another; the returned Future resolves after the last one"""
+        done = Future()
+        
+        def send(index, previous=None):
+            if previous is not None and previous.exception() is not None:
+                logger.warning(f"Pipelined {calls[index - 1][0]} failed: {previous.exception()}")
+            if index == len(calls):
+                done.set_result(None)
+                return
+            endpoint, data = calls[index]
+            try:
+                future = self._submit(endpoint, data)
+            except Exception as e:
+                logger.warning(f"Pipelined {endpoint} failed: {e}")
+                send(index + 1)
+                return
+            future.add_done_callback(partial(send, index + 1))
+        
+        send(0)
+        return done
@@ -0,0 +1,262 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from telegram import Bot
+from telegram.error import RetryAfter
+from telegram.utils.helpers import DEFAULT_NONE
+
+from config import TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE
+from tracing import span
+
+# Priority lanes, lower runs first
+PRIORITY_HIGH = 0    # payment and purchase confirmations
+PRIORITY_NORMAL = 1  # replies to the user's own actions
+PRIORITY_LOW = 2     # broadcasts and other bulk sends
+
+_local = threading.local()
+
+
+@contextmanager
+def send_priority(priority):
+    """Send everything inside the block from this thread at ``priority``"""
+    previous = getattr(_local, 'priority', PRIORITY_NORMAL)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, 'priority', PRIORITY_NORMAL)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate`` tokens per second"""
+    
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate, capacity=1, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic() if now is None else now
+    
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+    
+    def delay(self, now):
+        """Seconds until a token is available (0 if one is available now)"""
+        self._refill(now)
+        wait = max(0.0, self.updated - now)
+        if self.tokens < 1:
+            wait += (1 - self.tokens) / self.rate
+        return wait
+    
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+    
+    def pause(self, until):
+        """Hand out nothing before ``until``, then one token (used for ``retry_after``)"""
+        if until > self.updated:
+            self.tokens = 1
+            self.updated = until
+
+
+@dataclass(slots=True)
+class SendJob:
+    func: object
+    chat_id: object
+    priority: int
+    future: Future = field(default_factory=Future)
+    attempts: int = 0
+
+
+class SendScheduler:
+    """Paces outgoing Telegram API calls under the flood limits.
+
+    A global bucket (30 msg/s) and a bucket per chat (1 msg/s) gate every
+    call; per-chat buckets are kept in a bounded LRU. Jobs wait in
+    priority lanes and a small pool of worker threads sends the highest
+    priority job whose chat has a token, so one busy chat never blocks the
+    rest. A 429 ``RetryAfter`` pauses that chat for ``retry_after`` seconds
+    and the job is retried up to ``max_retries`` times.
+    """
+    
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE,
+                 workers=4, max_chats=10000, max_retries=3):
+        self.chat_rate = chat_rate
+        self.max_chats = max_chats
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate)
+        self._chat_buckets = OrderedDict()
+        self._ready = []    # (priority, seq, job)
+        self._delayed = []  # (ready_at, priority, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = workers
+        self._threads = []
+        self._stopped = False
+    
+    def _start(self):
+        # Started on first use so each gunicorn worker gets its own threads
+        for i in range(self._workers):
+            thread = threading.Thread(target=self._run, name=f'send-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    def _chat_bucket(self, chat_id, now):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, now=now)
+            self._chat_buckets[chat_id] = bucket
+            if len(self._chat_buckets) > self.max_chats:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+    
+    def submit(self, func, chat_id=None, priority=None):
+        """Queue ``func()`` and return a Future with its result"""
+        job = SendJob(func, chat_id, current_priority() if priority is None else priority)
+        with self._cond:
+            if not self._threads:
+                self._start()
+            heapq.heappush(self._ready, (job.priority, next(self._seq), job))
+            self._cond.notify()
+        return job.future
+    
+    def call(self, func, chat_id=None, priority=None):
+        """Run ``func()`` through the scheduler and wait for its result"""
+        return self.submit(func, chat_id, priority).result()
+    
+    def try_acquire(self, chat_id=None):
+        """Take a send token now for a message sent outside the scheduler; False if none is free"""
+        with self._cond:
+            now = time.monotonic()
+            if self.global_bucket.delay(now) > 0:
+                return False
+            bucket = self._chat_bucket(chat_id, now) if chat_id is not None else None
+            if bucket is not None and bucket.delay(now) > 0:
+                return False
+            self.global_bucket.consume(now)
+            if bucket:
+                bucket.consume(now)
+            return True
+    
+    def pending(self):
+        with self._cond:
+            return len(self._ready) + len(self._delayed)
+    
+    def _next_job(self):
+        """Pop the next sendable job, waiting for tokens as needed (holds the lock)"""
+        while not self._stopped:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, job))
+            
+            if not self._ready:
+                self._cond.wait(self._delayed[0][0] - now if self._delayed else None)
+                continue
+            
+            priority, seq, job = self._ready[0]
+            bucket = None
+            if job.chat_id is not None:
+                bucket = self._chat_bucket(job.chat_id, now)
+                wait = bucket.delay(now)
+                if wait > 0:
+                    # Park it so other chats can go first
+                    heapq.heappop(self._ready)
+                    heapq.heappush(self._delayed, (now + wait, priority, seq, job))
+                    continue
+            
+            wait = self.global_bucket.delay(now)
+            if wait > 0:
+                self._cond.wait(wait)
+                continue
+            
+            heapq.heappop(self._ready)
+            self.global_bucket.consume(now)
+            if bucket:
+                bucket.consume(now)
+            return job
+        return None
+    
+    def _run(self):
+        _local.in_scheduler = True
+        while True:
+            with self._cond:
+                job = self._next_job()
+            if job is None:
+                return
+            
+            try:
+                result = job.func()
+            except RetryAfter as e:
+                job.attempts += 1
+                if job.attempts > self.max_retries:
+                    job.future.set_exception(e)
+                    continue
+                with self._cond:
+                    ready_at = time.monotonic() + e.retry_after
+                    if job.chat_id is not None:
+                        self._chat_bucket(job.chat_id, ready_at).pause(ready_at)
+                    else:
+                        self.global_bucket.pause(ready_at)
+                    heapq.heappush(self._delayed, (ready_at, job.priority, next(self._seq), job))
+                    self._cond.notify()
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
+    
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class ScheduledBot(Bot):
+    """Bot whose chat-bound API calls go through a SendScheduler.
+
+    Calls without a ``chat_id`` (answerCallbackQuery, getMe, setWebhook)
+    are not counted against the message limits and go out directly, as do
+    calls made from inside a scheduled job. With a ``pipeline``, calls made
+    while it collects a webhook update's replies are handed to it instead.
+    """
+    
+    def __init__(self, token, scheduler, pipeline=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.scheduler = scheduler
+        self.pipeline = pipeline
+    
+    def _post(self, endpoint, data=None, timeout=DEFAULT_NONE, api_kwargs=None):
+        if self.pipeline is not None and self.pipeline.collecting():
+            # The same normalisation as Bot._post, so the queued call is plain JSON
+            data = data if data is not None else {}
+            if api_kwargs:
+                data.update(api_kwargs)
+            self._insert_defaults(data, timeout)
+            if self.pipeline.defer(endpoint, {key: value for key, value in data.items() if value is not None}):
+                return True
+        
+        chat_id = data.get('chat_id') if data else None
+        if chat_id is None or getattr(_local, 'in_scheduler', False):
+            with span(f"telegram.{endpoint}"):
+                return super()._post(endpoint, data, timeout, api_kwargs)
+        # The span includes time spent queued behind the flood limits
+        with span(f"telegram.{endpoint}", queued=True):
+            return self.scheduler.call(
+                lambda: Bot._post(self, endpoint, data, timeout, api_kwargs),
+                chat_id=str(chat_id)
+            )
@@ -0,0 +1,78 @@
+"""JSON encoding through the fastest library installed.
+
+orjson is used when available, then msgspec, then the standard library.
+``dumps`` returns compact UTF-8 bytes (the on-disk format everywhere) and
+``loads`` accepts bytes or str; ``dumps_pretty`` is for exports meant for
+people. Values the fast libraries cannot represent exactly fall back to
+the standard library: integers beyond 64 bits, such as USDT amounts in
+wei, would otherwise fail to encode or be decoded as floats.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Digits mapped to b'0' so twenty in a row (maybe an integer past 2**64) is a substring search
+_DIGITS_TO_ZERO = bytes.maketrans(b'123456789', b'000000000')
+_LONG_NUMBER = b'0' * 20
+
+if orjson is not None:
+    BACKEND = 'orjson'
+    
+    def _fast_dumps(value, default):
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+    
+    _fast_loads = orjson.loads
+
+elif msgspec is not None:
+    BACKEND = 'msgspec'
+    _encoder = msgspec.json.Encoder()
+    
+    def _fast_dumps(value, default):
+        if default is None:
+            return _encoder.encode(value)
+        return msgspec.json.encode(value, enc_hook=default)
+    
+    def _fast_loads(data):
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+
+else:
+    BACKEND = 'json'
+    _fast_dumps = None
+    _fast_loads = None
+
+
+def dumps(value, default=None):
+    """Compact JSON as UTF-8 bytes; ``default`` converts unsupported objects"""
+    if _fast_dumps is not None:
+        try:
+            return _fast_dumps(value, default)
+        except (TypeError, ValueError, OverflowError):
+            pass  # integers past 64 bits; anything else unsupported fails again below
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=default).encode()
+
+
+def loads(data):
+    """Parse a JSON document from bytes or str"""
+    if _fast_loads is None:
+        return json.loads(data)
+    if isinstance(data, str):
+        data = data.encode()
+    if _LONG_NUMBER in data.translate(_DIGITS_TO_ZERO):
+        return json.loads(data)
+    return _fast_loads(data)
+
+
+def dumps_pretty(value):
+    """Indented JSON as UTF-8 bytes, for exports"""
+    return json.dumps(value, indent=2, ensure_ascii=False).encode()
@@ -0,0 +1,192 @@
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from metrics import cache_lookup
+from serialization import dumps, loads
+from storage import file_lock
+
+MAGIC = b'TGSC'
+LAYOUT_VERSION = 1
+
+# name -> capacity in bytes; changing this changes the layout hash and
+# re-initialises the file on the next start
+SLOTS = (
+    ('prices', 64 * 1024),
+    ('catalog', 1024 * 1024),
+    ('menus', 4 * 1024 * 1024)
+)
+
+HEADER = struct.Struct('<4sIII')        # magic, layout version, layout hash, slot count
+SLOT = struct.Struct('<24sQQII')        # name, sequence, data offset, length, capacity
+SEQUENCE_AT = 24                        # offset of the sequence inside a slot descriptor
+LENGTH_AT = 40
+DATA_START = 4096
+READ_RETRIES = 20
+
+
+class _Slot:
+    __slots__ = ('name', 'descriptor_at', 'sequence_at', 'length_at', 'offset', 'capacity')
+    
+    def __init__(self, name, descriptor_at, offset, capacity):
+        self.name = name
+        self.descriptor_at = descriptor_at
+        self.sequence_at = descriptor_at + SEQUENCE_AT
+        self.length_at = descriptor_at + LENGTH_AT
+        self.offset = offset
+        self.capacity = capacity
+
+
+class SharedCache:
+    """JSON values shared by all workers on the host through one mmap'd file.
+
+    Each slot has a fixed region and a sequence number used as a seqlock:
+    the writer makes it odd, copies the new value in and makes it even
+    again, so readers never lock. A reader copies the bytes and keeps them
+    only if the sequence is unchanged and even; it decodes a slot once per
+    sequence and afterwards answers from its own decoded copy (treat the
+    values as read-only). While a write is in progress readers get their
+    previous copy. Writers are serialised by a file lock.
+
+    The header carries a magic, ``LAYOUT_VERSION`` and a hash of ``SLOTS``;
+    a file with another layout is re-initialised and readers still mapping
+    the old one see every slot as empty. If the file cannot be mapped the
+    cache is disabled: ``get`` returns the default and ``set`` does nothing.
+    """
+    
+    def __init__(self, path, slots=SLOTS):
+        self.path = path
+        self._slots = {}
+        offset = DATA_START
+        for index, (name, capacity) in enumerate(slots):
+            self._slots[name] = _Slot(name, HEADER.size + index * SLOT.size, offset, capacity)
+            offset += capacity
+        self.size = offset
+        layout_hash = zlib.crc32(repr(tuple(slots)).encode())
+        self._header = HEADER.pack(MAGIC, LAYOUT_VERSION, layout_hash, len(slots))
+        self._local = {}
+        self._lock = threading.Lock()
+        self._mm = None
+        try:
+            self._open()
+        except (OSError, ValueError) as e:
+            print(f"❌ Shared cache disabled ({path}): {e}")
+    
+    @property
+    def enabled(self):
+        return self._mm is not None
+    
+    def _open(self):
+        with file_lock(self.path):
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                # Only ever grow the file: shrinking it under another worker's mapping would crash it
+                if os.fstat(fd).st_size < self.size:
+                    os.ftruncate(fd, self.size)
+                self._mm = mmap.mmap(fd, self.size)
+            finally:
+                os.close(fd)
+            if self._mm[:HEADER.size] != self._header:
+                self._initialise()
+    
+    def _initialise(self):
+        self._mm[:HEADER.size] = b'\0' * HEADER.size
+        for slot in self._slots.values():
+            self._mm[slot.descriptor_at:slot.descriptor_at + SLOT.size] = SLOT.pack(
+                slot.name.encode(), 0, slot.offset, 0, slot.capacity)
+        self._mm[:HEADER.size] = self._header
+    
+    # ---------------------------
+    # Readers (lock-free)
+    # ---------------------------
+    def _sequence(self, slot):
+        return struct.unpack_from('<Q', self._mm, slot.sequence_at)[0]
+    
+    def get(self, name, default=None):
+        """Current value of a slot, or ``default`` if it was never written"""
+        slot = self._slots[name]
+        mm = self._mm
+        if mm is None or mm[:HEADER.size] != self._header:
+            return default
+        
+        cached = self._local.get(name)
+        for _ in range(READ_RETRIES):
+            sequence = self._sequence(slot)
+            if cached is not None and cached[0] == sequence:
+                cache_lookup(f'shared_{name}', True)
+                return cached[1]
+            if sequence & 1:
+                # Being rewritten: the previous copy is still consistent
+                if cached is not None:
+                    return cached[1]
+                time.sleep(0.001)
+                continue
+            if sequence == 0:
+                return default
+            
+            length = struct.unpack_from('<I', mm, slot.length_at)[0]
+            payload = mm[slot.offset:slot.offset + min(length, slot.capacity)]
+            if self._sequence(slot) != sequence:
+                continue
+            try:
+                value = loads(payload)
+            except ValueError:
+                continue
+            cache_lookup(f'shared_{name}', False)
+            self._local[name] = (sequence, value)
+            return value
+        return cached[1] if cached is not None else default
+    
+    # ---------------------------
+    # Writers (one at a time across workers)
+    # ---------------------------
+    @contextmanager
+    def _writer(self):
+        with self._lock, file_lock(self.path):
+            yield
+    
+    def _write(self, slot, value):
+        payload = dumps(value)
+        if len(payload) > slot.capacity:
+            print(f"❌ Shared cache slot {slot.name} too small: {len(payload)} > {slot.capacity} bytes")
+            return False
+        
+        sequence = self._sequence(slot)
+        # An odd sequence left by a writer that died mid-write is simply overwritten
+        writing = sequence + 1 if sequence % 2 == 0 else sequence + 2
+        mm = self._mm
+        struct.pack_into('<Q', mm, slot.sequence_at, writing)
+        mm[slot.offset:slot.offset + len(payload)] = payload
+        struct.pack_into('<I', mm, slot.length_at, len(payload))
+        struct.pack_into('<Q', mm, slot.sequence_at, writing + 1)
+        self._local[slot.name] = (writing + 1, value)
+        return True
+    
+    def set(self, name, value):
+        """Publish a JSON-serialisable value; False if it does not fit or the cache is off"""
+        if self._mm is None:
+            return False
+        with self._writer():
+            return self._write(self._slots[name], value)
+    
+    def update(self, name, func, default=None):
+        """Replace a slot with ``func(current value)`` atomically across workers"""
+        if self._mm is None:
+            return None
+        with self._writer():
+            value = func(self.get(name, default))
+            self._write(self._slots[name], value)
+            return value
+    
+    @contextmanager
+    def refresh_lock(self, name, blocking=True):
+        """Held by the one worker refreshing ``name``; others wait, then re-check the cache.
+
+        With ``blocking=False`` a refresh in progress elsewhere raises BlockingIOError.
+        """
+        with file_lock(f"{self.path}.{name}", blocking=blocking):
+            yield
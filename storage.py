@@ -0,0 +1,138 @@
+import fcntl
+import os
+import time
+from contextlib import contextmanager
+
+from metrics import STORAGE_SECONDS, STORAGE_BYTES, cache_lookup
+from serialization import dumps, dumps_pretty, loads
+from tracing import span
+
+
+def file_signature(path):
+    """(mtime, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def atomic_write_json(path, data, pretty=False):
+    """Write JSON (compact unless ``pretty``) to a temp file and rename it over the target"""
+    started = time.perf_counter()
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with span('storage.write', file=os.path.basename(path)):
+        encoded = dumps_pretty(data) if pretty else dumps(data)
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded)
+        size = len(encoded)
+        os.replace(tmp_path, path)
+    STORAGE_SECONDS.observe(time.perf_counter() - started, file=os.path.basename(path), op='write')
+    STORAGE_BYTES.inc(size, file=os.path.basename(path), op='write')
+
+
+def append_durable(path, data):
+    """Append bytes to a file and fsync them (caller holds the file lock)"""
+    started = time.perf_counter()
+    with span('storage.append', file=os.path.basename(path)), open(path, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    STORAGE_SECONDS.observe(time.perf_counter() - started, file=os.path.basename(path), op='append')
+    STORAGE_BYTES.inc(len(data), file=os.path.basename(path), op='append')
+
+
+@contextmanager
+def file_lock(path, shared=False, blocking=True):
+    """Cross-process lock on ``<path>.lock`` (flock, released on exit).
+
+    With ``blocking=False`` a lock held elsewhere raises BlockingIOError.
+    """
+    with open(f"{path}.lock", 'a') as lock_file:
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        fcntl.flock(lock_file, flags if blocking else flags | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class CachedJsonFile:
+    """A JSON file decoded once and re-parsed only when it changes on disk.
+
+    ``decode`` turns the raw JSON document into the in-memory value and
+    ``encode`` does the reverse on save. Other workers' writes are picked up
+    through the file's mtime/size signature.
+    """
+    
+    def __init__(self, path, default, decode, encode):
+        self.path = path
+        self.default = default
+        self.decode = decode
+        self.encode = encode
+        self.name = os.path.basename(path)
+        self._signature = None
+        self._value = None
+        
+        if not os.path.exists(path):
+            atomic_write_json(path, default())
+    
+    def load(self):
+        signature = file_signature(self.path)
+        hit = self._value is not None and signature == self._signature
+        cache_lookup(self.name, hit)
+        if not hit:
+            started = time.perf_counter()
+            with span('storage.read', file=self.name):
+                try:
+                    with open(self.path, 'rb') as f:
+                        raw = loads(f.read())
+                except (OSError, ValueError):
+                    raw = self.default()
+                self._value = self.decode(raw)
+            self._signature = signature
+            STORAGE_SECONDS.observe(time.perf_counter() - started, file=self.name, op='read')
+            STORAGE_BYTES.inc(signature[1] if signature else 0, file=self.name, op='read')
+        return self._value
+    
+    def save(self, value):
+        atomic_write_json(self.path, self.encode(value))
+        self._value = value
+        self._signature = file_signature(self.path)
+    
+    def commit(self, txn):
+        """Save a transaction's value now, before its block ends (which then has nothing to write)"""
+        if txn.changed:
+            self.save(txn.value)
+            txn.changed = False
+    
+    def invalidate(self):
+        """Drop the cached value so the next load re-reads the file"""
+        self._value = None
+        self._signature = None
+    
+    @contextmanager
+    def transaction(self):
+        """Lock the file, yield a Transaction over the fresh value and save it once.
+
+        The file is only rewritten if ``txn.changed`` was set. If the block
+        raises, the cache is dropped so partially mutated records are never
+        served.
+        """
+        with file_lock(self.path):
+            txn = Transaction(self.load())
+            try:
+                yield txn
+            except BaseException:
+                self.invalidate()
+                raise
+            if txn.changed:
+                self.save(txn.value)
+
+
+class Transaction:
+    __slots__ = ('value', 'changed')
+    
+    def __init__(self, value):
+        self.value = value
+        self.changed = False
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+
+from metrics import instrumented
+from models import Order, Product, User
+from money import RATE_DECIMALS
+
+
+@dataclass(slots=True)
+class PurchaseResult:
+    status: str
+    user: User = None
+    product: Product = None
+    order: Order = None
+    shortfall_cents: int = 0
+    
+    @property
+    def ok(self):
+        return self.status in ('ok', 'duplicate')
+
+
+class Store:
+    """Storage operations spanning users, orders and the ledger.
+
+    Locks are always taken in the same order (users, then orders, then the
+    ledger) so concurrent operations from several workers cannot deadlock.
+    """
+    
+    def __init__(self, user_manager, db, catalog, ledger=None):
+        self.user_manager = user_manager
+        self.db = db
+        self.catalog = catalog
+        self.ledger = ledger
+    
+    @instrumented('store')
+    def purchase(self, user_id, product_id, request_key=None):
+        """Pay for a product from the user's balance in one locked transaction.
+
+        Checks the balance, debits it, increments the order count and
+        creates a paid order. users.json is written first, then the order
+        log and the ledger are appended to, once each; if either append
+        fails the debit is written back. ``request_key`` identifies the
+        click that asked for the purchase: a retried or repeated request
+        returns the order it already paid for with status ``'duplicate'``
+        instead of debiting again. Otherwise ``status`` is ``'ok'``,
+        ``'product_not_found'``, ``'user_not_found'`` or
+        ``'insufficient_funds'``.
+        """
+        product = self.catalog.get_product(product_id)
+        if not product:
+            return PurchaseResult('product_not_found')
+        
+        with self.user_manager.transaction() as users_txn:
+            user = users_txn.value.get(int(user_id))
+            if not user:
+                return PurchaseResult('user_not_found', product=product)
+            
+            key = f"purchase:{user.user_id}:{request_key}" if request_key and self.ledger else None
+            entry = self.ledger.entry(key) if key else None
+            if entry:
+                order = self.db.get_order(int(entry['ref'].split(':')[1]))
+                return PurchaseResult('duplicate', user=user, product=product, order=order)
+            
+            if user.balance_cents < product.price_cents:
+                return PurchaseResult(
+                    'insufficient_funds', user=user, product=product,
+                    shortfall_cents=product.price_cents - user.balance_cents
+                )
+            
+            # users.json first: if it cannot be written, nothing has been recorded yet
+            self.user_manager.apply_balance_change(user, -product.price_cents)
+            user.total_orders += 1
+            users_txn.changed = True
+            self.user_manager.commit(users_txn)
+            
+            order = None
+            try:
+                with self.db.transaction() as orders_txn:
+                    order = self.db.add_order(
+                        orders_txn.value, user.user_id, product.id, product.price_cents,
+                        'USD', product.price_cents, None, 10 ** RATE_DECIMALS, status='paid'
+                    )
+                    orders_txn.changed = True
+                if self.ledger:
+                    self.ledger.record(
+                        user.user_id, 'purchase', -product.price_cents,
+                        key=key or f"purchase:{order.order_id}", ref=f"order:{order.order_id}"
+                    )
+            except BaseException:
+                # Give the money back so users.json still agrees with the ledger
+                if order is not None and self.db.get_order(order.order_id):
+                    self.db.update_order_status(order.order_id, 'cancelled')
+                user.balance_cents += product.price_cents
+                user.total_orders -= 1
+                users_txn.changed = True
+                self.user_manager.commit(users_txn)
+                raise
+        
+        self.db.publish('order_paid', order, via='balance')
+        return PurchaseResult('ok', user=user, product=product, order=order)
@@ -0,0 +1,51 @@
+import asyncio
+import json
+
+from admin_commands import AdminCommands
+from catalog import Catalog
+from config import ADMIN_ID
+
+CATALOG = {
+    'categories': [{'id': 1, 'name': 'Accounts', 'description': ''}],
+    'subcategories': [{'id': 1, 'name': 'Streaming', 'category_id': 1, 'description': ''}],
+    'products': []
+}
+
+
+class FakeDispatcher:
+    def add_handler(self, handler):
+        pass
+
+
+class FakeMessage:
+    def __init__(self):
+        self.from_user = type('User', (), {'id': ADMIN_ID})()
+        self.replies = []
+    
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def run(handler, text):
+    update = type('Update', (), {'message': FakeMessage()})()
+    context = type('Context', (), {'args': text.split(' ')})()
+    asyncio.run(handler(update, context))
+    return update.message.replies[-1]
+
+
+def test_admin_adds_go_through_the_catalog(tmp_path):
+    path = tmp_path / 'products.json'
+    path.write_text(json.dumps(CATALOG))
+    catalog = Catalog(str(path))
+    admin = AdminCommands(FakeDispatcher(), catalog)
+    version = catalog.version
+    
+    assert run(admin.add_category, 'Games|Game keys').startswith('✅')
+    assert run(admin.add_subcategory, 'Steam|2|Steam keys').startswith('✅')
+    assert run(admin.add_product, 'Elden Ring|PC key|39.99|2|2|Instant').startswith('✅')
+    assert run(admin.add_product, 'Orphan|x|1|1|2|none').startswith('❌')
+    assert catalog.version == version + 3
+    
+    product = Catalog(str(path)).products_in_category(2)[0]
+    assert (product.name, product.price_cents, product.subcategory_id) == ('Elden Ring', 3999, 2)
+    assert not list(tmp_path.glob('products.json.tmp*'))
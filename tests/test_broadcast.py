@@ -0,0 +1,98 @@
+from concurrent.futures import Future
+
+from telegram.error import Unauthorized
+
+from broadcast import BroadcastManager
+
+
+class FakeUserManager:
+    def __init__(self, user_ids):
+        self.ids = user_ids
+    
+    def user_ids(self):
+        return list(self.ids)
+
+
+class FakeScheduler:
+    def submit(self, func, chat_id=None, priority=None):
+        future = Future()
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+class FakeBot:
+    def __init__(self, blocked=()):
+        self.sent = []
+        self.blocked = set(blocked)
+        self.on_send = None
+    
+    def send_message(self, chat_id, text):
+        if self.on_send:
+            self.on_send(chat_id)
+        if chat_id in self.blocked:
+            raise Unauthorized('Forbidden: bot was blocked by the user')
+        self.sent.append(chat_id)
+
+
+def manager(tmp_path, user_ids, bot, chunk_size=2):
+    broadcasts = BroadcastManager(FakeUserManager(user_ids), bot, FakeScheduler(),
+                                  jobs_dir=str(tmp_path / 'broadcasts'), chunk_size=chunk_size)
+    broadcasts.started = []
+    broadcasts.start = broadcasts.started.append  # run jobs inline from the test
+    return broadcasts
+
+
+def test_broadcast_reaches_everyone_and_counts_blocked_users(tmp_path):
+    bot = FakeBot(blocked={3})
+    broadcasts = manager(tmp_path, [1, 2, 3, 4, 5], bot)
+    job = broadcasts.create('Hello', admin_chat_id=99)
+    broadcasts._run(job['id'])
+    
+    job = broadcasts.load(job['id'])
+    assert job['status'] == 'done'
+    assert (job['sent'], job['blocked'], job['failed']) == (4, 1, 0)
+    assert job['cursor'] == 5
+    assert bot.sent == [1, 2, 4, 5, 99]
+
+
+def test_resumed_job_continues_after_its_checkpoint(tmp_path):
+    bot = FakeBot()
+    broadcasts = manager(tmp_path, [1, 2, 3, 4, 5], bot)
+    job = broadcasts.create('Hello')
+    
+    # Crash after the first chunk: the checkpoint holds cursor 2
+    def crash(chat_id):
+        if chat_id == 3:
+            raise SystemExit
+    bot.on_send = crash
+    try:
+        broadcasts._send_all(job['id'])
+    except SystemExit:
+        pass
+    assert broadcasts.load(job['id'])['cursor'] == 2
+    
+    bot.on_send = None
+    broadcasts.started.clear()
+    broadcasts.resume()
+    assert broadcasts.started == [job['id']]
+    broadcasts._run(job['id'])
+    
+    job = broadcasts.load(job['id'])
+    assert job['status'] == 'done'
+    assert job['sent'] == 5
+    assert bot.sent == [1, 2, 3, 4, 5]
+
+
+def test_cancel_stops_at_the_next_checkpoint(tmp_path):
+    bot = FakeBot()
+    broadcasts = manager(tmp_path, [1, 2, 3, 4, 5], bot)
+    job = broadcasts.create('Hello')
+    bot.on_send = lambda chat_id: chat_id == 2 and broadcasts.cancel(job['id'])
+    broadcasts._run(job['id'])
+    
+    job = broadcasts.load(job['id'])
+    assert job['status'] == 'cancelled'
+    assert bot.sent == [1, 2]
@@ -0,0 +1,59 @@
+import json
+
+from catalog import Catalog
+
+CATALOG = {
+    'categories': [{'id': 1, 'name': 'Accounts', 'description': ''},
+                   {'id': 2, 'name': 'Games', 'description': ''}],
+    'subcategories': [{'id': 1, 'name': 'Streaming', 'category_id': 1, 'description': ''},
+                      {'id': 2, 'name': 'Music', 'category_id': 1, 'description': ''},
+                      {'id': 3, 'name': 'Steam', 'category_id': 2, 'description': ''}],
+    'products': [{'id': 1, 'name': 'Netflix', 'description': '', 'price': 5.99, 'category_id': 1, 'subcategory_id': 1},
+                 {'id': 2, 'name': 'Spotify', 'description': '', 'price': 2.99, 'category_id': 1, 'subcategory_id': 2},
+                 {'id': 3, 'name': 'Hulu', 'description': '', 'price': 3.99, 'category_id': 1, 'subcategory_id': 1},
+                 {'id': 4, 'name': 'Elden Ring', 'description': '', 'price': 39.99, 'category_id': 2, 'subcategory_id': 3}]
+}
+
+
+def catalog_file(tmp_path):
+    path = tmp_path / 'products.json'
+    path.write_text(json.dumps(CATALOG))
+    return str(path)
+
+
+def test_deleting_a_category_cascades_to_its_subcategories_and_products(tmp_path):
+    path = catalog_file(tmp_path)
+    catalog = Catalog(path)
+    version = catalog.version
+    
+    category, subcategories, products = catalog.delete_category(1)
+    assert category.name == 'Accounts'
+    assert sorted(sub.id for sub in subcategories) == [1, 2]
+    assert sorted(product.id for product in products) == [1, 2, 3]
+    assert catalog.version == version + 1
+    
+    reloaded = Catalog(path)
+    assert [c.id for c in reloaded.categories] == [2]
+    assert [s.id for s in reloaded.subcategories] == [3]
+    assert [p.id for p in reloaded.products] == [4]
+    assert catalog.delete_category(1) is None
+
+
+def test_deleting_a_subcategory_keeps_its_siblings(tmp_path):
+    catalog = Catalog(catalog_file(tmp_path))
+    subcategory, products = catalog.delete_subcategory(1)
+    assert subcategory.name == 'Streaming'
+    assert sorted(product.id for product in products) == [1, 3]
+    assert [s.id for s in catalog.subcategories_in_category(1)] == [2]
+    assert [p.id for p in catalog.products_in_category(1)] == [2]
+    
+    # Ids are not reused after deletes
+    assert catalog.add_subcategory('Video', 1, '').id == 4
+
+
+def test_other_workers_see_a_rewrite(tmp_path):
+    path = catalog_file(tmp_path)
+    reader, writer = Catalog(path), Catalog(path)
+    writer.delete_product(4)
+    assert reader.get_product(4) is None
+    assert [p.id for p in reader.products_in_category(2)] == []
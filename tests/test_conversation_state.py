@@ -0,0 +1,49 @@
+import pytest
+
+import conversation_state
+from conversation_state import ConversationState, MemoryStateBackend, SQLiteStateBackend
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryStateBackend()
+    return SQLiteStateBackend(str(tmp_path / 'state.db'))
+
+
+def test_expired_state_is_never_returned(backend, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(conversation_state.time, 'time', lambda: clock[0])
+    state = ConversationState(backend, default_ttl=60)
+    
+    state.set(7, {'step': 'amount', 'crypto': 'BTC'})
+    assert state.get(7) == {'step': 'amount', 'crypto': 'BTC'}
+    
+    clock[0] += 60
+    assert state.get(7) is None
+    assert state.pop(7) is None
+
+
+def test_pop_removes_state(backend):
+    state = ConversationState(backend)
+    state.set(7, {'step': 'amount'})
+    assert state.pop(7) == {'step': 'amount'}
+    assert state.get(7) is None
+
+
+def test_sweep_skips_entries_that_were_overwritten():
+    backend = MemoryStateBackend()
+    backend.set('a', 1, expires_at=10)
+    backend.set('a', 2, expires_at=100)
+    backend.set('b', 3, expires_at=20)
+    
+    # The stale heap entry for 'a' must not evict the newer value
+    assert backend.expire(50) == 1
+    assert backend.get('a', 50) == 2
+    assert backend.get('b', 50) is None
+
+
+def test_sqlite_state_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'state.db')
+    ConversationState(SQLiteStateBackend(path)).set(7, {'step': 'amount'})
+    assert ConversationState(SQLiteStateBackend(path)).get(7) == {'step': 'amount'}
@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+import pytest
+
+from events import EventConsumer, EventQueue
+from notifications import OrderNotifier
+from send_scheduler import PRIORITY_HIGH, current_priority
+
+
+def test_every_consumer_sees_each_event_once(tmp_path):
+    queue = EventQueue(str(tmp_path / 'events.jsonl'))
+    queue.publish('order_created', order_id=1, user_id=7)
+    
+    # New consumers start at the end of the log instead of replaying it
+    seen_a, seen_b = [], []
+    consumer_a = EventConsumer(queue, 'a', seen_a.append)
+    consumer_b = EventConsumer(queue, 'b', seen_b.append)
+    assert consumer_a.poll() == 0
+    assert consumer_b.poll() == 0
+    
+    queue.publish('order_paid', order_id=1, user_id=7)
+    queue.publish('balance_credited', user_id=7, amount_cents=500, balance_cents=500)
+    assert consumer_a.poll() == 2
+    assert consumer_a.poll() == 0
+    assert [e['type'] for e in seen_a] == ['order_paid', 'balance_credited']
+    assert consumer_a.lag() == 0
+    assert consumer_b.lag() > 0
+    
+    # The offset survives a restart
+    restarted = EventConsumer(queue, 'b', seen_b.append)
+    assert restarted.poll() == 2
+    assert [e['type'] for e in seen_b] == ['order_paid', 'balance_credited']
+
+
+def test_partially_written_event_is_read_once_complete(tmp_path):
+    queue = EventQueue(str(tmp_path / 'events.jsonl'))
+    queue.publish('order_created', order_id=1)
+    with open(queue.events_file, 'ab') as f:
+        f.write(b'{"type": "order_paid", "order_id"')
+    
+    events, offset = queue.read(0)
+    assert [e['order_id'] for e in events] == [1]
+    with open(queue.events_file, 'ab') as f:
+        f.write(b': 1}\n')
+    events, offset = queue.read(offset)
+    assert events == [{'type': 'order_paid', 'order_id': 1}]
+
+
+def test_failing_handler_does_not_block_later_events(tmp_path):
+    queue = EventQueue(str(tmp_path / 'events.jsonl'))
+    seen = []
+    
+    def handler(event):
+        if event['order_id'] == 1:
+            raise RuntimeError('boom')
+        seen.append(event['order_id'])
+    
+    consumer = EventConsumer(queue, 'notify', handler)
+    consumer.poll()
+    queue.publish('order_paid', order_id=1)
+    queue.publish('order_paid', order_id=2)
+    assert consumer.poll() == 2
+    assert seen == [2]
+
+
+def test_unknown_event_types_are_rejected(tmp_path):
+    queue = EventQueue(str(tmp_path / 'events.jsonl'))
+    with pytest.raises(ValueError):
+        queue.publish('order_refunded', order_id=1)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+    
+    def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append((chat_id, text, current_priority()))
+
+
+class FakeCatalog:
+    def get_product(self, product_id):
+        return SimpleNamespace(name='Netflix') if product_id == 1 else None
+
+
+def test_notifier_messages_users_in_the_high_priority_lane():
+    bot = FakeBot()
+    notifier = OrderNotifier(bot, FakeCatalog())
+    notifier({'type': 'order_paid', 'order_id': 12, 'user_id': 7, 'product_id': 1, 'amount_cents': 599})
+    
+    [(chat_id, text, priority)] = bot.sent
+    assert chat_id == 7
+    assert 'Netflix' in text and '$5.99' in text
+    assert priority == PRIORITY_HIGH
+
+
+def test_notifier_skips_purchases_confirmed_inline():
+    bot = FakeBot()
+    notifier = OrderNotifier(bot, FakeCatalog())
+    notifier({'type': 'order_paid', 'order_id': 12, 'user_id': 7, 'product_id': 1,
+              'amount_cents': 599, 'via': 'balance'})
+    notifier({'type': 'order_created', 'order_id': 13, 'user_id': 7})
+    assert bot.sent == []
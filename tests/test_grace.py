@@ -0,0 +1,55 @@
+import time
+from datetime import datetime, timedelta
+
+from conversation_state import MemoryStateBackend
+from database import Database
+from deposit_tags import DepositTagIndex
+from models import Order
+from quotes import QuoteBook
+
+ADDRESS = 'bc1qexampleaddress'
+
+
+class FakePaymentHandler:
+    def get_rate_snapshot(self, crypto_currency):
+        return 6500000000000, time.time()
+
+
+def pending_order(expires_at, order_id=1, amount_minor=150001):
+    return Order(order_id=order_id, user_id=42, product_id='deposit', amount_cents=1000,
+                 crypto_currency='BTC', crypto_amount_minor=amount_minor, payment_address=ADDRESS,
+                 exchange_rate_e8=6500000000000, expires_at=expires_at.isoformat())
+
+
+def test_expired_order_is_matchable_and_tagged_during_grace():
+    expires_at = datetime.now()
+    order = pending_order(expires_at)
+    index = DepositTagIndex(grace=3600)
+    index.add(order)
+    
+    late = expires_at.timestamp() + 600
+    assert index.lookup('BTC', ADDRESS, 150001, now=late) is order
+    assert index.allocate('BTC', ADDRESS, 150000, now=late) == 150002
+    assert index.lookup('BTC', ADDRESS, 150001, now=expires_at.timestamp() + 3600) is None
+
+
+def test_expired_orders_are_cleaned_up_after_grace(tmp_path, monkeypatch):
+    db = Database(orders_file=str(tmp_path / 'orders.log'), legacy_file=str(tmp_path / 'orders.json'),
+                  grace=3600)
+    order = db.create_deposit_order(42, 1000, 'BTC', 150000, ADDRESS, 6500000000000)
+    expiry = datetime.fromisoformat(order.expires_at).timestamp()
+    
+    monkeypatch.setattr(time, 'time', lambda: expiry + 600)
+    assert db.cleanup_expired_orders() == []
+    monkeypatch.setattr(time, 'time', lambda: expiry + 3601)
+    assert [removed.order_id for removed in db.cleanup_expired_orders()] == [order.order_id]
+
+
+def test_quote_accepts_payments_confirmed_within_grace():
+    quotes = QuoteBook(MemoryStateBackend(), FakePaymentHandler(), grace=3600)
+    order = pending_order(datetime.now() + timedelta(minutes=15), amount_minor=150000)
+    quote = quotes.lock(quotes.quote(1000, 'BTC'), order)
+    
+    assert quotes.verify(order.order_id, 'BTC', 150000, quote.expires_at + 600) is not None
+    assert quotes.verify(order.order_id, 'BTC', 150000, quote.expires_at + 3601) is None
+    assert quotes.verify(order.order_id, 'BTC', 149999, quote.expires_at) is None
@@ -0,0 +1,44 @@
+from hd_wallet import AddressDeriver, AddressPool, G, evm_address
+
+# BIP84 test vector (mnemonic "abandon abandon ... about"), account m/84'/0'/0'
+BIP84_ZPUB = 'zpub6rFR7y4Q2AijBEqTUquhVz398htDFrtymD9xYYfG1m4wAcvPhXNfE3EfH1r1ADqtfSdVCToUG868RvUUkgDKf31mGDtKsAYz2oz2AGutZYs'
+
+
+def test_bip84_receive_addresses():
+    deriver = AddressDeriver('BTC', BIP84_ZPUB)
+    assert deriver.address(0) == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+    assert deriver.address(1) == 'bc1qnjg0jd8228aq7egyzacy8cys3knf9xvrerkf9g'
+
+
+def test_evm_address_is_eip55_checksummed():
+    # Public key of private key 1
+    assert evm_address(G) == '0x7E5F4552091A69125d5DfCb7b8C2659029395Bdf'
+
+
+def test_released_address_is_claimed_again_first(tmp_path):
+    pool = AddressPool({'BTC': BIP84_ZPUB}, pool_file=str(tmp_path / 'addresses.json'), pool_size=3)
+    pool.refill()
+    first = pool.claim('BTC')
+    second = pool.claim('BTC')
+    assert first == 'bc1qcr8te4kr609gcawutmrza0j4xv80jy8z306fyu'
+    
+    assert pool.release('BTC', first)
+    assert not pool.release('BTC', first)  # no longer claimed
+    assert not pool.release('BTC', 'bc1qstaticwalletaddress')
+    assert pool.claim('BTC') == first
+    assert pool.claim('BTC') not in (first, second)
+
+
+def test_reused_address_is_not_single_use(tmp_path):
+    pool = AddressPool({'BTC': BIP84_ZPUB}, pool_file=str(tmp_path / 'addresses.json'), pool_size=3)
+    pool.refill()
+    first = pool.claim('BTC')
+    second = pool.claim('BTC')
+    assert pool.single_use('BTC', first) and pool.single_use('BTC', second)
+    assert not pool.single_use('BTC', 'bc1qstaticwalletaddress')
+    
+    pool.release('BTC', first)
+    assert pool.claim('BTC') == first
+    # The first order's payer may still send here: the new order needs an exact tagged amount
+    assert not pool.single_use('BTC', first)
+    assert pool.single_use('BTC', second)
@@ -0,0 +1,26 @@
+from ledger import Ledger
+
+
+def test_idempotency_key_applies_an_entry_once(tmp_path):
+    path = str(tmp_path / 'ledger.jsonl')
+    ledger = Ledger(path)
+    first = ledger.record(42, 'deposit', 1000, key='deposit:BTC:tx1', ref='order:1')
+    again = ledger.record(42, 'deposit', 1000, key='deposit:BTC:tx1', ref='order:2')
+    
+    assert again == first
+    assert ledger.balance(42) == 1000
+    assert ledger.entry('deposit:BTC:tx1')['ref'] == 'order:1'
+    assert len(list(ledger.entries())) == 1
+
+
+def test_idempotency_keys_are_shared_between_workers(tmp_path):
+    path = str(tmp_path / 'ledger.jsonl')
+    worker_a, worker_b = Ledger(path), Ledger(path)
+    worker_a.record(42, 'purchase', -300, key='purchase:5')
+    
+    assert worker_b.has_key('purchase:5')
+    worker_b.record(42, 'purchase', -300, key='purchase:5')
+    worker_b.record(42, 'deposit', 1000)
+    worker_b.record(42, 'deposit', 1000)
+    assert worker_a.balance(42) == worker_b.balance(42) == 1700
+    assert not worker_a.has_key('purchase:6')
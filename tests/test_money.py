@@ -0,0 +1,42 @@
+from decimal import Decimal
+
+import pytest
+
+import money
+
+
+def test_to_minor_rounds_half_up():
+    assert money.to_minor('0.005', 'USD') == 1
+    assert money.to_minor('0.004', 'USD') == 0
+    assert money.to_minor('19.995', 'USD') == 2000
+    assert money.to_minor(0.1, 'BTC') == 10000000
+    assert money.to_minor(None, 'USD') == 0
+
+
+def test_to_minor_rejects_invalid_amounts():
+    for value in ('abc', 'NaN', 'Infinity'):
+        with pytest.raises(ValueError):
+            money.to_minor(value, 'USD')
+
+
+def test_from_minor_and_format_are_exact():
+    assert money.from_minor(1, 'BTC') == Decimal('0.00000001')
+    assert money.format_usd(105) == '1.05'
+    assert money.format_amount(15385, 'BTC') == '0.00015385'
+    assert money.format_amount(3333333 * 10 ** 12, 'USDT_BEP20') == '3.333333'
+
+
+def test_quote_rounds_half_up_to_quote_precision():
+    # $10 at $65,000 is 15384.6 satoshis
+    assert money.quote(1000, money.rate_to_minor('65000'), 'BTC') == 15385
+    # $10 at $3 is 3.3333... USDT, shown to 6 decimals of its 18
+    assert money.quote(1000, money.rate_to_minor('3'), 'USDT_BEP20') == 3333333 * 10 ** 12
+    assert money.quote(500, money.rate_to_minor('3'), 'USDT_BEP20') == 1666667 * 10 ** 12
+
+
+def test_quote_batch_matches_single_quotes():
+    rate = money.rate_to_minor('80.00')
+    assert money.quote_batch([100, 1000, 12345], rate, 'LTC') == [money.quote(cents, rate, 'LTC')
+                                                                  for cents in (100, 1000, 12345)]
+    with pytest.raises(ValueError):
+        money.quote_batch([100], 0, 'LTC')
@@ -0,0 +1,68 @@
+from database import _new_order
+from order_log import OrderLog, order_record
+
+
+def add_order(log, user_id=42, amount_cents=1000):
+    with log.transaction() as txn:
+        order = _new_order(log.take_id(), user_id, None, amount_cents, 'USD', amount_cents, None, 10 ** 8, 'pending')
+        log.put(order)
+        txn.changed = True
+    return order
+
+
+def test_torn_tail_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / 'orders.log')
+    log = OrderLog(path)
+    first = add_order(log)
+    
+    # A writer crashed halfway through appending a record
+    record = order_record(_new_order(2, 42, None, 500, 'USD', 500, None, 10 ** 8, 'pending'))
+    with open(path, 'ab') as f:
+        f.write(record[:len(record) // 2])
+    
+    reopened = OrderLog(path)
+    assert [order.order_id for order in reopened.orders()] == [first.order_id]
+    
+    second = add_order(reopened, amount_cents=700)
+    assert second.order_id == 2
+    assert [(order.order_id, order.amount_cents) for order in OrderLog(path).orders()] == [(1, 1000), (2, 700)]
+
+
+def test_compaction_keeps_the_latest_version_of_live_orders(tmp_path):
+    path = str(tmp_path / 'orders.log')
+    log = OrderLog(path)
+    kept = add_order(log)
+    removed = add_order(log, user_id=7)
+    with log.transaction() as txn:
+        kept.status = 'paid'
+        log.put(kept)
+        log.remove(removed.order_id)
+        txn.changed = True
+    
+    generation = log.stats()['generation']
+    assert log.compact() > 0
+    assert log.stats()['generation'] == generation + 1
+    assert log.stats()['dead_bytes'] == 0
+    
+    for current in (log, OrderLog(path)):
+        assert current.get(kept.order_id).status == 'paid'
+        assert current.get(removed.order_id) is None
+        assert [order.order_id for order in current.user_orders(42)] == [kept.order_id]
+        assert current.user_orders(7) == []
+        assert current.expired_ids(now=float('inf')) == []
+
+
+def test_compaction_does_not_reuse_ids_of_removed_orders(tmp_path):
+    path = str(tmp_path / 'orders.log')
+    log = OrderLog(path)
+    for _ in range(3):
+        add_order(log)
+    with log.transaction() as txn:
+        log.remove(2)
+        log.remove(3)
+        txn.changed = True
+    
+    log.compact()
+    assert log.stats()['next_id'] == 4
+    assert add_order(log).order_id == 4
+    assert OrderLog(path).stats()['next_id'] == 5
@@ -0,0 +1,43 @@
+from payment_handler import BSC_LOG_RANGE, PaymentHandler
+
+LATEST = 50000000
+NOW = 1760000000
+BLOCK_TIME = 0.75
+ADDRESS = '0x7E5F4552091A69125d5DfCb7b8C2659029395Bdf'
+
+
+class FakeEth:
+    def __init__(self):
+        self.ranges = []
+    
+    def get_block(self, number):
+        number = LATEST if number == 'latest' else number
+        return {'number': number, 'timestamp': int(NOW - (LATEST - number) * BLOCK_TIME)}
+    
+    def get_logs(self, params):
+        self.ranges.append((params['fromBlock'], params['toBlock']))
+        if params['fromBlock'] <= LATEST - 100 <= params['toBlock']:
+            return [{'blockNumber': LATEST - 100, 'data': (5 * 10 ** 18).to_bytes(32, 'big'),
+                     'transactionHash': b'\x01' * 32}]
+        return []
+
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+def test_usdt_transfers_are_fetched_back_to_since_in_chunks():
+    handler = PaymentHandler()
+    handler._bsc_web3 = FakeWeb3()
+    # Older than an order's lifetime plus an hour of grace: more blocks than one request may cover
+    since = NOW - 75 * 60
+    transfers = handler.get_usdt_bep20_transfers(ADDRESS, since)
+    
+    ranges = handler.bsc_web3.eth.ranges
+    assert ranges[0][0] <= LATEST - (NOW - since) / BLOCK_TIME
+    assert ranges[-1][1] == LATEST
+    assert all(to_block - from_block < BSC_LOG_RANGE for from_block, to_block in ranges)
+    assert all(ranges[i][1] + 1 == ranges[i + 1][0] for i in range(len(ranges) - 1))
+    assert len(ranges) > 1
+    assert transfers == [('0x' + '01' * 32, 5 * 10 ** 18, int(NOW - 100 * BLOCK_TIME))]
@@ -0,0 +1,106 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from database import Database
+from ledger import Ledger
+from payment_watcher import PaymentWatcher
+from user_manager import UserManager, DUPLICATE
+
+ADDRESS = 'bc1qexampleaddress'
+BASE_MINOR = 150000
+
+
+class FakePaymentHandler:
+    def __init__(self):
+        self.transfers = []
+        self.since = None
+    
+    def get_transfers(self, crypto_currency, address, since=None):
+        self.since = since
+        return list(self.transfers)
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # UserManager keeps users.json in the working directory
+    ledger = Ledger(str(tmp_path / 'ledger.jsonl'))
+    user_manager = UserManager(ledger)
+    user_manager.create_user(42, 'ann', 'Ann')
+    db = Database(orders_file=str(tmp_path / 'orders.log'), legacy_file=str(tmp_path / 'orders.json'))
+    return PaymentWatcher(FakePaymentHandler(), db, user_manager)
+
+
+def deposit(watcher):
+    return watcher.db.create_deposit_order(42, 1000, 'BTC', BASE_MINOR, ADDRESS, 6500000000000)
+
+
+def test_update_balance_reports_duplicate_key(watcher):
+    user_manager = watcher.user_manager
+    assert user_manager.update_balance(42, 500, kind='deposit', key='deposit:BTC:tx') is True
+    assert user_manager.update_balance(42, 500, kind='deposit', key='deposit:BTC:tx') == DUPLICATE
+    assert user_manager.get_user(42).balance_cents == 500
+
+
+def test_credited_transfer_is_not_matched_to_a_later_order(watcher):
+    first = deposit(watcher)
+    watcher.payment_handler.transfers = [('tx1', first.crypto_amount_minor, time.time())]
+    assert watcher.poll() == 1
+    assert watcher.db.get_order(first.order_id).status == 'paid'
+    
+    # Same address, freed slot: the new order expects the same amount tx1 paid
+    second = deposit(watcher)
+    assert second.crypto_amount_minor == first.crypto_amount_minor
+    assert watcher.poll() == 0
+    assert watcher.db.get_order(second.order_id).status == 'pending'
+    assert watcher.user_manager.get_user(42).balance_cents == 1000
+    
+    # Its own payment is still matched
+    watcher.payment_handler.transfers.append(('tx2', second.crypto_amount_minor, time.time()))
+    assert watcher.poll() == 1
+    assert watcher.db.get_order(second.order_id).status == 'paid'
+    assert watcher.user_manager.get_user(42).balance_cents == 2000
+
+
+def test_credit_marks_only_the_order_the_transfer_was_credited_to(watcher):
+    first = deposit(watcher)
+    watcher.user_manager.update_balance(42, 1000, kind='deposit', key='deposit:BTC:tx1',
+                                        ref=f"order:{first.order_id}")
+    second = deposit(watcher)
+    
+    assert watcher.credit(second, 'tx1') is False
+    assert watcher.db.get_order(second.order_id).status == 'pending'
+    # Credited before the order was marked paid (a crash in between): marking it now is safe
+    assert watcher.credit(first, 'tx1') is True
+    assert watcher.db.get_order(first.order_id).status == 'paid'
+    assert watcher.user_manager.get_user(42).balance_cents == 1000
+
+
+def test_static_address_never_pays_the_untagged_quote(watcher):
+    order = deposit(watcher)
+    assert order.crypto_amount_minor == BASE_MINOR + 1
+    
+    # Alone on the address, but a payer ignoring the tag must not be matched to it
+    watcher.payment_handler.transfers = [('tx1', BASE_MINOR, time.time()), ('tx2', BASE_MINOR + 5, time.time())]
+    assert watcher.poll() == 0
+    assert watcher.db.get_order(order.order_id).status == 'pending'
+
+
+def test_single_use_address_pays_the_exact_quote_or_more(watcher):
+    order = watcher.db.create_deposit_order(42, 1000, 'BTC', BASE_MINOR, ADDRESS, 6500000000000,
+                                            single_use_address=True)
+    assert order.crypto_amount_minor == BASE_MINOR
+    assert watcher.db.get_order(order.order_id).single_use_address
+    
+    watcher.payment_handler.transfers = [('tx1', BASE_MINOR + 5, time.time())]
+    assert watcher.poll() == 1
+    assert watcher.db.get_order(order.order_id).status == 'paid'
+
+
+def test_transfers_are_fetched_back_to_the_oldest_payable_order(watcher):
+    first = deposit(watcher)
+    deposit(watcher)
+    watcher.poll()
+    created = datetime.fromisoformat(first.created_at).timestamp()
+    assert watcher.payment_handler.since == created - PaymentWatcher.CLOCK_SLACK
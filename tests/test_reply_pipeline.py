@@ -0,0 +1,137 @@
+from concurrent.futures import Future
+
+import pytest
+from telegram import InputFile
+
+from reply_pipeline import ReplyPipeline
+from send_scheduler import ScheduledBot
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+    
+    def call(self, method, data):
+        self.calls.append((method, data))
+        return True
+    
+    def submit(self, method, data):
+        future = Future()
+        future.set_result(self.call(method, data))
+        return future
+
+
+class FakeScheduler:
+    """Holds submitted jobs until the test runs them"""
+    
+    def __init__(self, tokens=True):
+        self.tokens = tokens
+        self.jobs = []
+    
+    def try_acquire(self, chat_id=None):
+        return self.tokens
+    
+    def submit(self, func, chat_id=None, priority=None):
+        future = Future()
+        self.jobs.append((func, future))
+        return future
+    
+    def run_next(self, error=None):
+        func, future = self.jobs.pop(0)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(func())
+    
+    def run_all(self):
+        while self.jobs:
+            self.run_next()
+
+
+def pipeline(tokens=True):
+    client, scheduler = FakeClient(), FakeScheduler(tokens)
+    return ReplyPipeline(client, scheduler), client, scheduler
+
+
+def test_callback_answer_becomes_the_webhook_reply():
+    replies, client, scheduler = pipeline()
+    with replies.collect() as reply:
+        assert replies.defer('editMessageText', {'chat_id': 1, 'message_id': 7, 'text': 'Shop'})
+        assert replies.defer('answerCallbackQuery', {'callback_query_id': '99'})
+        assert replies.defer('sendMessage', {'chat_id': 1, 'text': 'Hi'})
+        assert client.calls == [] and scheduler.jobs == []
+    
+    assert reply.body == {'method': 'answerCallbackQuery', 'callback_query_id': '99'}
+    scheduler.run_all()
+    assert [method for method, data in client.calls] == ['editMessageText', 'sendMessage']
+    assert not replies.collecting()
+
+
+def test_lone_call_is_the_reply_only_if_its_chat_has_a_token():
+    replies, client, scheduler = pipeline(tokens=True)
+    with replies.collect() as reply:
+        replies.defer('sendMessage', {'chat_id': 1, 'text': 'Hi'})
+    assert reply.body == {'method': 'sendMessage', 'chat_id': 1, 'text': 'Hi'}
+    assert scheduler.jobs == []
+    
+    replies, client, scheduler = pipeline(tokens=False)
+    with replies.collect() as reply:
+        replies.defer('sendMessage', {'chat_id': 1, 'text': 'Hi'})
+    assert reply.body is None
+    scheduler.run_all()
+    assert client.calls == [('sendMessage', {'chat_id': 1, 'text': 'Hi'})]
+
+
+def test_queued_calls_are_sent_one_after_another():
+    replies, client, scheduler = pipeline(tokens=False)
+    with replies.collect():
+        for text in ('one', 'two', 'three'):
+            replies.defer('sendMessage', {'chat_id': 1, 'text': text})
+    
+    # The next call is only submitted once the previous one finished, failed or not
+    assert len(scheduler.jobs) == 1
+    scheduler.run_next(error=RuntimeError('Timed out'))
+    assert len(scheduler.jobs) == 1
+    scheduler.run_next()
+    assert len(scheduler.jobs) == 1
+    scheduler.run_next()
+    assert scheduler.jobs == []
+    assert [data['text'] for method, data in client.calls] == ['two', 'three']
+
+
+def test_other_calls_flush_the_queue_first():
+    replies, client, scheduler = pipeline()
+    
+    def run_jobs_on_submit(func, chat_id=None, priority=None):
+        future = Future()
+        future.set_result(func())
+        return future
+    scheduler.submit = run_jobs_on_submit
+    
+    with replies.collect() as reply:
+        replies.defer('sendMessage', {'chat_id': 1, 'text': 'Your file:'})
+        assert not replies.defer('sendDocument', {'chat_id': 1, 'document': 'orders.json'})
+        assert client.calls == [('sendMessage', {'chat_id': 1, 'text': 'Your file:'})]
+        # Uploads are never deferred, whatever the method
+        assert not replies.defer('sendMessage', {'chat_id': 1, 'photo': InputFile(b'x', filename='x')})
+        replies.defer('sendMessage', {'chat_id': 1, 'text': 'Done'})
+    assert reply.body == {'method': 'sendMessage', 'chat_id': 1, 'text': 'Done'}
+
+
+def test_queued_calls_are_still_sent_if_the_handler_fails():
+    replies, client, scheduler = pipeline()
+    with pytest.raises(RuntimeError):
+        with replies.collect() as reply:
+            replies.defer('answerCallbackQuery', {'callback_query_id': '99'})
+            raise RuntimeError('handler crashed')
+    assert reply.body is None
+    assert client.calls == [('answerCallbackQuery', {'callback_query_id': '99'})]
+    assert not replies.defer('sendMessage', {'chat_id': 1, 'text': 'Hi'})
+
+
+def test_bot_calls_are_deferred_while_collecting():
+    replies, client, scheduler = pipeline()
+    bot = ScheduledBot('123456:TEST', scheduler, pipeline=replies)
+    with replies.collect() as reply:
+        assert bot.send_message(chat_id=42, text='Hi') is True
+    assert reply.body == {'method': 'sendMessage', 'chat_id': 42, 'text': 'Hi'}
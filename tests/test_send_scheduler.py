@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+from telegram.error import RetryAfter
+
+from send_scheduler import PRIORITY_HIGH, PRIORITY_LOW, SendScheduler, TokenBucket
+
+
+def retry_after(seconds):
+    error = RetryAfter(1)
+    error.retry_after = seconds
+    return error
+
+
+def test_bucket_paces_to_its_rate():
+    bucket = TokenBucket(rate=2, capacity=1, now=0)
+    assert bucket.delay(0) == 0
+    bucket.consume(0)
+    assert bucket.delay(0) == pytest.approx(0.5)
+    assert bucket.delay(0.25) == pytest.approx(0.25)
+    assert bucket.delay(0.5) == 0
+    
+    # Idle time never banks more than ``capacity`` tokens
+    bucket.consume(0.5)
+    assert bucket.delay(10) == 0
+    bucket.consume(10)
+    assert bucket.delay(10) > 0
+
+
+def test_pause_holds_tokens_until_retry_after():
+    bucket = TokenBucket(rate=1, now=0)
+    bucket.pause(5)
+    assert bucket.delay(1) == pytest.approx(4)
+    assert bucket.delay(5) == 0
+    bucket.consume(5)
+    assert bucket.delay(5) == pytest.approx(1)
+
+
+def test_retry_after_pauses_the_chat_and_retries():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, workers=2)
+    calls = []
+    
+    def send():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise retry_after(0.2)
+        return 'sent'
+    
+    try:
+        paused = scheduler.submit(send, chat_id='1')
+        time.sleep(0.05)
+        # Other chats are not held back by the paused one
+        other = scheduler.submit(time.monotonic, chat_id='2')
+        assert other.result(timeout=5) < calls[0] + 0.2
+        
+        assert paused.result(timeout=5) == 'sent'
+        assert len(calls) == 2
+        assert calls[1] - calls[0] >= 0.2
+    finally:
+        scheduler.stop()
+
+
+def test_retry_after_gives_up_after_max_retries():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, workers=1, max_retries=2)
+    attempts = []
+    
+    def send():
+        attempts.append(1)
+        raise retry_after(0.01)
+    
+    try:
+        with pytest.raises(RetryAfter):
+            scheduler.call(send, chat_id='1')
+        assert len(attempts) == 3
+    finally:
+        scheduler.stop()
+
+
+def test_higher_priority_jobs_go_first():
+    scheduler = SendScheduler(global_rate=1000, chat_rate=1000, workers=1)
+    gate = threading.Event()
+    order = []
+    try:
+        scheduler.submit(gate.wait)
+        time.sleep(0.05)
+        low = scheduler.submit(lambda: order.append('low'), priority=PRIORITY_LOW)
+        high = scheduler.submit(lambda: order.append('high'), priority=PRIORITY_HIGH)
+        gate.set()
+        low.result(timeout=5)
+        high.result(timeout=5)
+        assert order == ['high', 'low']
+    finally:
+        scheduler.stop()
@@ -0,0 +1,48 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+import serialization
+from serialization import dumps, dumps_pretty, loads
+
+WEI = 25 * 10**18  # 25 USDT in wei, past 64 bits
+
+
+@pytest.fixture(params=['fast', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'json':
+        monkeypatch.setattr(serialization, '_fast_dumps', None)
+        monkeypatch.setattr(serialization, '_fast_loads', None)
+    return request.param
+
+
+def test_round_trip_is_compact_utf8(backend):
+    value = {'name': 'Café ☕', 'price_cents': 599, 'tags': [1, 2.5, None, True]}
+    data = dumps(value)
+    assert isinstance(data, bytes)
+    assert b' ' not in data.replace('Café ☕'.encode(), b'')
+    assert json.loads(data) == value
+    assert loads(data) == value
+    assert loads(data.decode()) == value
+
+
+def test_integers_past_64_bits_stay_exact(backend):
+    data = dumps({'value': WEI, 'values': [WEI, -WEI]})
+    assert loads(data) == {'value': WEI, 'values': [WEI, -WEI]}
+    assert type(loads(data)['value']) is int
+
+
+def test_default_converts_unsupported_objects(backend):
+    assert loads(dumps({'amount': Decimal('5.99')}, default=str)) == {'amount': '5.99'}
+    with pytest.raises(TypeError):
+        dumps({'amount': Decimal('5.99')})
+
+
+def test_invalid_json_raises_value_error(backend):
+    with pytest.raises(ValueError):
+        loads(b'{"type": "order_paid", "order_id"')
+
+
+def test_dumps_pretty_is_indented():
+    assert dumps_pretty({'a': 'é'}) == '{\n  "a": "é"\n}'.encode()
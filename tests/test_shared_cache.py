@@ -0,0 +1,34 @@
+from shared_cache import SharedCache
+
+SLOTS = (('prices', 1024), ('menus', 64))
+
+
+def test_value_round_trips_between_workers(tmp_path):
+    path = str(tmp_path / 'shared_cache.bin')
+    writer, reader = SharedCache(path, SLOTS), SharedCache(path, SLOTS)
+    assert reader.get('prices', {}) == {}
+    
+    prices = {'BTC': [6500000000000, 1700000000.5], 'big': 2 ** 70}
+    assert writer.set('prices', prices) is True
+    assert reader.get('prices') == prices
+    assert SharedCache(path, SLOTS).get('prices') == prices
+    
+    writer.set('prices', {'BTC': [1, 2.0]})
+    assert reader.get('prices') == {'BTC': [1, 2.0]}
+
+
+def test_update_and_oversized_values(tmp_path):
+    path = str(tmp_path / 'shared_cache.bin')
+    cache = SharedCache(path, SLOTS)
+    assert cache.update('menus', lambda count: count + 1, default=0) == 1
+    assert cache.update('menus', lambda count: count + 1, default=0) == 2
+    assert SharedCache(path, SLOTS).get('menus') == 2
+    
+    assert cache.set('menus', 'x' * 100) is False
+    assert cache.get('menus') == 2
+
+
+def test_other_layout_reinitialises_the_file(tmp_path):
+    path = str(tmp_path / 'shared_cache.bin')
+    SharedCache(path, SLOTS).set('prices', {'BTC': 1})
+    assert SharedCache(path, (('prices', 2048), ('menus', 64))).get('prices') is None
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from catalog import Catalog
+from database import Database
+from ledger import Ledger
+from store import Store
+from user_manager import UserManager
+
+CATALOG = {
+    'categories': [{'id': 1, 'name': 'Accounts', 'description': ''}],
+    'subcategories': [{'id': 1, 'name': 'Streaming', 'category_id': 1, 'description': ''}],
+    'products': [{'id': 1, 'name': 'Netflix', 'description': '', 'price_cents': 599,
+                  'category_id': 1, 'subcategory_id': 1, 'features': []}]
+}
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # UserManager keeps users.json in the working directory
+    (tmp_path / 'products.json').write_text(json.dumps(CATALOG))
+    ledger = Ledger(str(tmp_path / 'ledger.jsonl'))
+    user_manager = UserManager(ledger)
+    user_manager.create_user(42, 'ann', 'Ann')
+    user_manager.update_balance(42, 1000, kind='adjustment', key='opening')
+    db = Database(orders_file=str(tmp_path / 'orders.log'), legacy_file=str(tmp_path / 'orders.json'))
+    return Store(user_manager, db, Catalog(str(tmp_path / 'products.json')), ledger)
+
+
+def test_purchase_debits_once_per_request(store):
+    result = store.purchase(42, 1, request_key='42:7:1700000000')
+    assert result.status == 'ok'
+    assert result.user.balance_cents == 401
+    assert store.db.get_order(result.order.order_id).status == 'paid'
+    
+    again = store.purchase(42, 1, request_key='42:7:1700000000')
+    assert again.status == 'duplicate' and again.ok
+    assert again.order.order_id == result.order.order_id
+    assert store.user_manager.get_user(42).balance_cents == 401
+    assert store.ledger.balance(42) == 401
+    
+    assert store.purchase(42, 1, request_key='42:7:1700000060').status == 'insufficient_funds'
+
+
+def test_failed_ledger_append_gives_the_money_back(store, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(store.ledger, 'record', fail)
+    
+    with pytest.raises(OSError):
+        store.purchase(42, 1, request_key='42:7:1700000000')
+    user = store.user_manager.get_user(42)
+    assert (user.balance_cents, user.total_orders) == (1000, 0)
+    assert [order.status for order in store.db.get_user_orders(42)] == ['cancelled']
+    assert store.ledger.balance(42) == 1000
+
+
+def test_failed_users_write_records_nothing(store, monkeypatch):
+    def fail(value):
+        raise OSError('disk full')
+    monkeypatch.setattr(store.user_manager._store, 'save', fail)
+    
+    with pytest.raises(OSError):
+        store.purchase(42, 1, request_key='42:7:1700000000')
+    assert store.user_manager.get_user(42).balance_cents == 1000
+    assert store.db.get_user_orders(42) == []
+    assert store.ledger.balance(42) == 1000
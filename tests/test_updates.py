@@ -0,0 +1,51 @@
+from telegram import Message, Update
+
+from updates import LazyMessage, decode_update
+
+MESSAGE = {
+    'message_id': 7,
+    'date': 1700000000,
+    'chat': {'id': 42, 'type': 'private'},
+    'from': {'id': 42, 'is_bot': False, 'first_name': 'Ann', 'username': 'ann'},
+    'text': '/start promo',
+    'entities': [{'type': 'bot_command', 'offset': 0, 'length': 6}],
+    'reply_markup': {'inline_keyboard': [[{'text': '🛍️ Shop', 'callback_data': 'shop'}]]}
+}
+
+
+def test_message_routing_fields_are_decoded_up_front():
+    update = decode_update({'update_id': 1, 'message': MESSAGE}, None)
+    message = update.message
+    assert isinstance(message, LazyMessage)
+    assert update.effective_chat.id == 42
+    assert update.effective_user.username == 'ann'
+    assert message.text == '/start promo'
+    assert message.parse_entities() and message.date.timestamp() == 1700000000
+    # Nothing else has been decoded yet
+    assert message._data is MESSAGE
+
+
+def test_other_fields_decode_the_whole_message_on_first_access():
+    message = decode_update({'update_id': 1, 'message': MESSAGE}, None).message
+    assert message.reply_markup.inline_keyboard[0][0].callback_data == 'shop'
+    assert message._data is None
+    assert message.photo == []
+    assert message.to_dict() == Message.de_json(MESSAGE, None).to_dict()
+
+
+def test_callback_query_message_is_lazy():
+    data = {'update_id': 2, 'callback_query': {
+        'id': '99', 'from': MESSAGE['from'], 'chat_instance': 'x', 'data': 'buy_1', 'message': MESSAGE
+    }}
+    update = decode_update(data, None)
+    assert update.callback_query.data == 'buy_1'
+    assert update.effective_chat.id == 42
+    assert isinstance(update.callback_query.message, LazyMessage)
+    assert update.to_dict() == Update.de_json(data, None).to_dict()
+
+
+def test_other_update_kinds_are_decoded_in_full():
+    data = {'update_id': 3, 'edited_message': MESSAGE}
+    update = decode_update(data, None)
+    assert type(update.edited_message) is Message
+    assert update.edited_message.reply_markup is not None
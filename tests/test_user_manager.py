@@ -0,0 +1,49 @@
+import pytest
+
+from ledger import Ledger
+from user_manager import UserManager
+
+
+@pytest.fixture
+def user_manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # UserManager keeps users.json in the working directory
+    user_manager = UserManager(Ledger(str(tmp_path / 'ledger.jsonl')))
+    user_manager.create_user(42, 'ann', 'Ann')
+    return user_manager
+
+
+def test_failed_ledger_append_writes_the_balance_back(user_manager, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(user_manager.ledger, 'record', fail)
+    
+    with pytest.raises(OSError):
+        user_manager.update_balance(42, 500, kind='deposit', key='deposit:BTC:tx1')
+    user = user_manager.get_user(42)
+    assert (user.balance_cents, user.total_deposited_cents, user.first_topup_date) == (0, 0, None)
+
+
+def test_failed_users_write_records_nothing(user_manager, monkeypatch):
+    def fail(value):
+        raise OSError('disk full')
+    monkeypatch.setattr(user_manager._store, 'save', fail)
+    
+    with pytest.raises(OSError):
+        user_manager.update_balance(42, 500, kind='deposit', key='deposit:BTC:tx1')
+    assert not user_manager.ledger.has_key('deposit:BTC:tx1')
+    assert user_manager.ledger.balance(42) == 0
+
+
+def test_balance_the_ledger_never_recorded_is_repaired(user_manager):
+    user_manager.update_balance(42, 500, kind='deposit', key='deposit:BTC:tx1')
+    # Killed after users.json was written, before the ledger append
+    with user_manager.transaction() as txn:
+        user_manager.apply_balance_change(txn.value[42], 300)
+        txn.changed = True
+    
+    assert user_manager.repair_from_ledger() == 1
+    assert user_manager.get_user(42).balance_cents == 500
+    assert user_manager.repair_from_ledger() == 0
+    # The deposit can be credited again under its key
+    assert user_manager.update_balance(42, 300, kind='deposit', key='deposit:BTC:tx2') is True
+    assert user_manager.get_user(42).balance_cents == 800
@@ -0,0 +1,34 @@
+from lazy import WarmUp
+
+
+def test_failed_required_task_keeps_worker_unready():
+    attempts = []
+    
+    def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError('price API down')
+    
+    warmup = WarmUp()
+    warmup.add('prices', flaky)
+    warmup.add('web3', lambda: None, required=False)
+    warmup.run()
+    assert warmup.done.is_set()
+    assert not warmup.ready.is_set()
+    assert warmup.failed(required_only=True) == ['prices']
+    
+    assert warmup.retry_failed() is True
+    assert warmup.ready.is_set()
+    assert warmup.failed() == []
+
+
+def test_failed_optional_task_does_not_block_readiness():
+    def broken():
+        raise RuntimeError('no web3')
+    
+    warmup = WarmUp()
+    warmup.add('users', lambda: None)
+    warmup.add('web3', broken, required=False)
+    warmup.run()
+    assert warmup.ready.is_set()
+    assert warmup.failed() == ['web3']
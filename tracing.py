@@ -0,0 +1,194 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from config import TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_FILE
+from serialization import dumps, loads
+
+_local = threading.local()
+
+
+class Trace:
+    """Spans recorded while one update is handled on this thread"""
+    
+    __slots__ = ('name', 'attrs', 'started_at', 'started', 'spans', 'depth', 'max_spans', 'dropped')
+    
+    def __init__(self, name, attrs, max_spans):
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.depth = 0
+        self.max_spans = max_spans
+        self.dropped = 0
+    
+    def add(self, name, started, ended, depth, attrs, error):
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return
+        span = {
+            'name': name,
+            'start_ms': round((started - self.started) * 1000, 3),
+            'ms': round((ended - started) * 1000, 3),
+            'depth': depth
+        }
+        if attrs:
+            span.update(attrs)
+        if error:
+            span['error'] = error.__name__
+        self.spans.append(span)
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attrs', 'started', 'depth')
+    
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+    
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        ended = time.perf_counter()
+        self.trace.depth -= 1
+        self.trace.add(self.name, self.started, ended, self.depth, self.attrs, exc_type)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name, **attrs):
+    """Time a block as a span of the current thread's trace (free when there is none)"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return NO_SPAN
+    return _Span(trace, name, attrs)
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+class Tracer:
+    """Per-update traces with span timings, written to a JSONL sink.
+
+    Spans are always recorded (a list append per span), so the decision
+    to keep a trace is made at the end: every trace slower than
+    ``slow_ms`` is written, other traces with probability
+    ``sample_rate``. The sink rotates to ``<file>.1`` past ``max_bytes``
+    and is shared by all workers, so ``slowest()`` sees every worker.
+    """
+    
+    def __init__(self, sink=TRACE_FILE, sample_rate=TRACE_SAMPLE_RATE, slow_ms=TRACE_SLOW_MS,
+                 max_spans=200, max_bytes=5 * 1024 * 1024):
+        self.sink = sink
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.max_spans = max_spans
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+    
+    def trace(self, name, **attrs):
+        return _TraceScope(self, name, attrs)
+    
+    def finish(self, trace, error=None):
+        duration_ms = (time.perf_counter() - trace.started) * 1000
+        slow = duration_ms >= self.slow_ms
+        if not slow and random.random() >= self.sample_rate:
+            return None
+        
+        record = {
+            'name': trace.name,
+            'ts': round(trace.started_at, 3),
+            'ms': round(duration_ms, 3),
+            'slow': slow,
+            'pid': os.getpid(),
+            **trace.attrs,
+            'spans': trace.spans
+        }
+        if error:
+            record['error'] = error.__name__
+        if trace.dropped:
+            record['dropped_spans'] = trace.dropped
+        self.write(record)
+        return record
+    
+    def write(self, record):
+        line = dumps(record, default=str) + b'\n'
+        try:
+            with self._lock:
+                if os.path.exists(self.sink) and os.path.getsize(self.sink) > self.max_bytes:
+                    os.replace(self.sink, self.sink + '.1')
+                # One write() on an O_APPEND file, so lines from several workers do not interleave
+                with open(self.sink, 'ab') as f:
+                    f.write(line)
+        except OSError as e:
+            print(f"❌ Could not write trace: {e}")
+    
+    def recent(self, lines=2000):
+        """The last ``lines`` traces from the sink, oldest first"""
+        if not os.path.exists(self.sink):
+            return []
+        with open(self.sink, 'rb') as f:
+            tail = deque(f, maxlen=lines)
+        traces = []
+        for line in tail:
+            try:
+                traces.append(loads(line))
+            except ValueError:
+                continue  # a line cut by rotation
+        return traces
+    
+    def slowest(self, limit=5, lines=2000):
+        return sorted(self.recent(lines), key=lambda record: record['ms'], reverse=True)[:limit]
+
+
+class _TraceScope:
+    __slots__ = ('tracer', 'name', 'attrs', 'trace')
+    
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace = None
+    
+    def __enter__(self):
+        if getattr(_local, 'trace', None) is None:
+            self.trace = _local.trace = Trace(self.name, self.attrs, self.tracer.max_spans)
+        return self.trace
+    
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            _local.trace = None
+            self.tracer.finish(self.trace, exc_type)
+        return False
+
+
+def format_trace(record, top_spans=3):
+    """One trace as a few plain-text lines for the admin chat"""
+    when = time.strftime('%H:%M:%S', time.localtime(record['ts']))
+    label = record.get('route') or record['name']
+    lines = [f"{record['ms']:.0f} ms — {label} (update {record.get('update_id', '?')}, {when}, pid {record['pid']})"]
+    for span_record in sorted(record['spans'], key=lambda s: s['ms'], reverse=True)[:top_spans]:
+        detail = f" {span_record['file']}" if 'file' in span_record else ''
+        lines.append(f"   {span_record['ms']:.1f} ms {span_record['name']}{detail}")
+    return '\n'.join(lines)
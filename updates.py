@@ -0,0 +1,92 @@
+"""Fast decoding of webhook updates.
+
+``Update.de_json`` builds the whole object graph of an update, including
+the keyboard of the message a button belongs to, which no handler reads.
+``decode_update`` builds only what routing and the handlers use: the
+update, its callback query and its message, with the message's id, date,
+chat, sender, text and entities. Every other message field is decoded
+on first access (the whole message at once, with ``Message.de_json``),
+so handlers that need them still see a complete ``Message``. Update kinds
+the bot does not handle go through ``Update.de_json`` unchanged.
+"""
+from telegram import CallbackQuery, Chat, Message, MessageEntity, Update, User
+from telegram.utils.helpers import from_timestamp
+
+from metrics import UPDATE_DECODES
+
+# Every attribute a Message can hold (its __slots__ and those of its base classes)
+MESSAGE_FIELDS = tuple(
+    attr for cls in Message.__mro__ for attr in getattr(cls, '__slots__', ()) if attr != '__dict__'
+)
+
+
+class LazyMessage(Message):
+    """Message decoded up front only for the fields handlers route on"""
+    
+    __slots__ = ('_data',)
+    
+    @classmethod
+    def from_data(cls, data, bot):
+        message = object.__new__(cls)
+        fields = {
+            'message_id': data['message_id'],
+            'date': from_timestamp(data['date']),
+            'chat': Chat.de_json(data['chat'], bot),
+            'from_user': User.de_json(data.get('from'), bot),
+            'text': data.get('text'),
+            'entities': MessageEntity.de_list(data.get('entities'), bot),
+            'bot': bot,
+            '_data': data
+        }
+        for name, value in fields.items():
+            object.__setattr__(message, name, value)
+        object.__setattr__(message, '_id_attrs', (message.message_id, message.chat))
+        return message
+    
+    def __getattr__(self, name):
+        # Only reached for slots that are still unset, i.e. fields not decoded yet
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            data = object.__getattribute__(self, '_data')
+        except AttributeError:
+            raise AttributeError(name) from None
+        if data is None:
+            raise AttributeError(name)
+        
+        full = Message.de_json(data, self.bot)
+        for field in MESSAGE_FIELDS:
+            try:
+                object.__getattribute__(self, field)
+            except AttributeError:
+                object.__setattr__(self, field, getattr(full, field, None))
+        # Cleared last: a concurrent reader of a half-filled message decodes it again
+        object.__setattr__(self, '_data', None)
+        UPDATE_DECODES.inc(path='message_full')
+        return object.__getattribute__(self, name)
+
+
+def decode_callback_query(data, bot):
+    message = data.get('message')
+    return CallbackQuery(
+        id=data['id'],
+        from_user=User.de_json(data['from'], bot),
+        chat_instance=data.get('chat_instance'),
+        message=LazyMessage.from_data(message, bot) if message else None,
+        data=data.get('data'),
+        inline_message_id=data.get('inline_message_id'),
+        game_short_name=data.get('game_short_name'),
+        bot=bot
+    )
+
+
+def decode_update(data, bot):
+    """Update for a webhook payload: messages and button clicks are decoded lazily"""
+    if 'message' in data:
+        UPDATE_DECODES.inc(path='fast')
+        return Update(data['update_id'], message=LazyMessage.from_data(data['message'], bot))
+    if 'callback_query' in data:
+        UPDATE_DECODES.inc(path='fast')
+        return Update(data['update_id'], callback_query=decode_callback_query(data['callback_query'], bot))
+    UPDATE_DECODES.inc(path='full')
+    return Update.de_json(data, bot)
@@ -1,87 +1,180 @@
-import json
-import os
 from datetime import datetime
 
+from metrics import instrument_methods
+from models import User, UserColumns
+from storage import CachedJsonFile
+
+# update_balance() result when the idempotency key was already recorded (nothing changed)
+DUPLICATE = 'duplicate'
+
+@instrument_methods('user_manager', 'get_user', 'create_user', 'update_balance', 'touch_many', 'all_users')
 class UserManager:
-    def __init__(self):
+    def __init__(self, ledger=None, events=None):
         self.users_file = 'users.json'
-        self._init_file()
+        self.ledger = ledger
+        self.events = events
+        self._store = CachedJsonFile(self.users_file, dict, self._decode, self._encode)
+        self._columns = None
+    
+    @staticmethod
+    def _decode(raw):
+        return {int(uid): User.from_dict(data) for uid, data in raw.items()}
     
-    def _init_file(self):
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w') as f:
-                json.dump({}, f)
+    @staticmethod
+    def _encode(users):
+        return {str(uid): user.to_dict() for uid, user in users.items()}
     
     def _read_users(self):
-        with open(self.users_file, 'r') as f:
-            return json.load(f)
+        users = self._store.load()
+        if self._columns is not None and self._columns[0] is not users:
+            self._columns = None
+        return users
     
-    def _write_users(self, users):
-        with open(self.users_file, 'w') as f:
-            json.dump(users, f, indent=2)
+    def transaction(self):
+        """Locked read-modify-write over all users (see CachedJsonFile.transaction)"""
+        self._columns = None
+        return self._store.transaction()
+    
+    def commit(self, txn):
+        """Write users.json now, inside a transaction (see CachedJsonFile.commit)"""
+        self._store.commit(txn)
     
     def get_user(self, user_id):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str not in users:
-            return None
-        
-        return users[user_id_str]
+        return self._read_users().get(int(user_id))
     
     def create_user(self, user_id, username, first_name):
         users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            return users[user_id_str]
-        
-        user_data = {
-            'user_id': user_id,
-            'username': username,
-            'first_name': first_name,
-            'balance': 0.0,
-            'registration_date': datetime.now().isoformat(),
-            'first_topup_date': None,
-            'total_deposited': 0.0,
-            'total_orders': 0,
-            'last_activity': datetime.now().isoformat()
-        }
+        if user_id in users:
+            return users[user_id]
         
-        users[user_id_str] = user_data
-        self._write_users(users)
-        return user_data
+        with self.transaction() as txn:
+            users = txn.value
+            if user_id in users:
+                return users[user_id]
+            
+            user = User(
+                user_id=user_id,
+                username=username,
+                first_name=first_name,
+                registration_date=datetime.now().isoformat(),
+                last_activity=datetime.now().isoformat()
+            )
+            
+            users[user_id] = user
+            txn.changed = True
+            return user
     
-    def update_balance(self, user_id, amount):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str not in users:
-            return False
-        
-        users[user_id_str]['balance'] += amount
-        users[user_id_str]['total_deposited'] += max(0, amount)
-        users[user_id_str]['last_activity'] = datetime.now().isoformat()
+    def apply_balance_change(self, user, amount_cents):
+        """Apply a balance change to a user record (caller holds the transaction)"""
+        user.balance_cents += amount_cents
+        if amount_cents > 0:
+            user.total_deposited_cents += amount_cents
+        user.last_activity = datetime.now().isoformat()
         
         # Set first top-up date if this is the first deposit
-        if amount > 0 and users[user_id_str]['first_topup_date'] is None:
-            users[user_id_str]['first_topup_date'] = datetime.now().isoformat()
+        if amount_cents > 0 and user.first_topup_date is None:
+            user.first_topup_date = datetime.now().isoformat()
+    
+    def update_balance(self, user_id, amount_cents, kind=None, key=None, ref=None):
+        """Add (or subtract, if negative) an amount in cents to the user's balance.
+
+        With a ledger attached, users.json is written first and the change
+        then recorded in the ledger; if that append fails the balance is
+        written back. A repeated idempotency ``key`` leaves the balance
+        untouched and returns ``DUPLICATE`` instead of True. False if the
+        user does not exist.
+        """
+        with self.transaction() as txn:
+            user = txn.value.get(int(user_id))
+            
+            if not user:
+                return False
+            
+            if self.ledger and key and self.ledger.has_key(key):
+                return DUPLICATE
+            
+            before = (user.balance_cents, user.total_deposited_cents, user.first_topup_date)
+            self.apply_balance_change(user, amount_cents)
+            txn.changed = True
+            
+            if self.ledger:
+                self.commit(txn)
+                try:
+                    kind = kind or ('deposit' if amount_cents > 0 else 'purchase')
+                    self.ledger.record(user.user_id, kind, amount_cents, key=key, ref=ref)
+                except BaseException:
+                    user.balance_cents, user.total_deposited_cents, user.first_topup_date = before
+                    txn.changed = True
+                    self.commit(txn)
+                    raise
         
-        self._write_users(users)
+        if self.events and amount_cents > 0:
+            self.events.publish(
+                'balance_credited', user_id=user.user_id, amount_cents=amount_cents,
+                balance_cents=user.balance_cents, ref=ref
+            )
         return True
     
+    def repair_from_ledger(self):
+        """Set balances that disagree with the ledger to the ledger's; returns how many (startup).
+
+        Balance changes reach users.json before the ledger, so a worker
+        killed in between leaves one the ledger never recorded. Undoing it
+        lets it be retried: the payment watcher credits the deposit again
+        under the same key.
+        """
+        if not self.ledger:
+            return 0
+        repaired = 0
+        with self.transaction() as txn:
+            for user_id, ledger_cents, stored_cents in self.ledger.reconcile(txn.value.values()):
+                if stored_cents is None:
+                    continue
+                print(f"⚠️ Balance of user {user_id} reset to the ledger's: {stored_cents} -> {ledger_cents} cents")
+                txn.value[user_id].balance_cents = ledger_cents
+                repaired += 1
+            txn.changed = repaired > 0
+        return repaired
+    
     def update_user_activity(self, user_id):
-        users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            users[user_id_str]['last_activity'] = datetime.now().isoformat()
-            self._write_users(users)
+        with self.transaction() as txn:
+            user = txn.value.get(int(user_id))
+            
+            if user:
+                user.last_activity = datetime.now().isoformat()
+                txn.changed = True
+    
+    def touch_many(self, seen):
+        """Set ``last_activity`` for many users (``{user_id: unix_time}``) in one write"""
+        updated = 0
+        with self.transaction() as txn:
+            for user_id, seen_at in seen.items():
+                user = txn.value.get(user_id)
+                last_activity = datetime.fromtimestamp(seen_at).isoformat()
+                if user and (user.last_activity or '') < last_activity:
+                    user.last_activity = last_activity
+                    updated += 1
+            txn.changed = updated > 0
+        return updated
     
     def increment_orders(self, user_id):
+        with self.transaction() as txn:
+            user = txn.value.get(int(user_id))
+            
+            if user:
+                user.total_orders += 1
+                txn.changed = True
+    
+    def all_users(self):
+        return list(self._read_users().values())
+    
+    def columns(self):
+        """Columnar snapshot of all users for reports and bulk scans"""
         users = self._read_users()
-        user_id_str = str(user_id)
-        
-        if user_id_str in users:
-            users[user_id_str]['total_orders'] += 1
-            self._write_users(users)
\ No newline at end of file
+        if self._columns is None:
+            self._columns = (users, UserColumns(users.values()))
+        return self._columns[1]
+    
+    def user_ids(self):
+        """All user ids in ascending order as a compact array"""
+        return self.columns().user_id